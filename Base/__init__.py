@@ -1,4 +1,5 @@
 from .deep_models import *
+from .derivatives import *
 from .dg import *
 from .lla import *
 from .mcmc import *
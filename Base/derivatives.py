@@ -0,0 +1,102 @@
+import torch
+from torch.func import jacfwd, vmap
+
+
+def parse_partial(name, output_names, input_names):
+    """
+    Split a partial derivative name into its output column and the input columns it is
+    differentiated by, e.g. "w_xy" -> (index of "w", [index of "x", index of "y"]).
+    A name without "_" is the output value itself.
+    """
+    output, _, inputs = name.partition("_")
+    if len(inputs) > 2:
+        raise ValueError(f"Partial '{name}' is of order {len(inputs)}, only up to second order is supported.")
+    return output_names.index(output), [input_names.index(i) for i in inputs]
+
+
+def autograd_partials(model, x, requested):
+    """
+    Reverse mode: one forward pass, one gradient call per output that has first derivatives
+    and one per (output, input) pair that has second derivatives. Every call returns the full
+    gradient with respect to `x`, the partials are its columns.
+    """
+    y = model(x)
+    first, second = {}, {}
+
+    def gradient(f):
+        return torch.autograd.grad(f, x, grad_outputs=torch.ones_like(f), create_graph=True)[0]
+
+    for col, idx in requested:
+        if len(idx) >= 1 and col not in first:
+            first[col] = gradient(y[:, col])
+        if len(idx) == 2 and (col, idx[0]) not in second:
+            second[(col, idx[0])] = gradient(first[col][:, idx[0]])
+
+    results = []
+    for col, idx in requested:
+        if len(idx) == 0:
+            results.append(y[:, col])
+        elif len(idx) == 1:
+            results.append(first[col][:, idx[0]])
+        else:
+            results.append(second[(col, idx[0])][:, idx[1]])
+    return results
+
+
+def forward_partials(model, x, requested):
+    """
+    Forward mode with torch.func: the value, the Jacobian and (when needed) the Hessian of the
+    outputs of every point with respect to its inputs, from nested jacfwd vectorized with vmap.
+    Cheap when the input dimension is small, as for space-time collocation points.
+    """
+    def f(xp):
+        y = model(xp.unsqueeze(0)).squeeze(0)
+        return y, y
+
+    def f_jacobian(xp):
+        jacobian, y = jacfwd(f, has_aux=True)(xp)
+        return jacobian, (jacobian, y)
+
+    if any(len(idx) == 2 for _, idx in requested):
+        hessian, (jacobian, y) = vmap(jacfwd(f_jacobian, has_aux=True))(x)
+    else:
+        jacobian, y = vmap(jacfwd(f, has_aux=True))(x)
+
+    results = []
+    for col, idx in requested:
+        if len(idx) == 0:
+            results.append(y[:, col])
+        elif len(idx) == 1:
+            results.append(jacobian[:, col, idx[0]])
+        else:
+            results.append(hessian[:, col, idx[0], idx[1]])
+    return results
+
+
+DERIVATIVE_ENGINES = {"autograd": autograd_partials, "forward": forward_partials}
+
+
+def compute_partials(model, x, names, output_names, input_names, engine="autograd"):
+    """
+    Compute the declared partial derivatives of the outputs of `model` at the points `x`.
+
+    Parameters:
+    model (callable): Maps points (n, d) to outputs (n, n_outputs).
+    x (Tensor): Points, (n, d).
+    names (tuple): Partials, "<output>_<inputs>" such as "w", "w_t" or "w_xy".
+    output_names (tuple): Name of every output column.
+    input_names (tuple): Single character names of the leading input columns that are
+                         differentiated, e.g. ("x", "y", "t").
+    engine (str): "autograd" (reverse mode, one gradient call per field) or "forward"
+                  (torch.func jacfwd/vmap).
+
+    Returns:
+    dict: Name -> partial derivative, (n, 1).
+    """
+    if engine not in DERIVATIVE_ENGINES:
+        raise ValueError(f"Unknown derivative engine '{engine}', choose one of {list(DERIVATIVE_ENGINES)}.")
+
+    requested = [parse_partial(name, output_names, input_names) for name in names]
+    x = x.requires_grad_(True) if engine == "autograd" else x
+    results = DERIVATIVE_ENGINES[engine](model, x, requested)
+    return {name: r.reshape(-1, 1) for name, r in zip(names, results)}
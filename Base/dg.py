@@ -2,6 +2,7 @@ import numpy as np
 import torch
 from torch.nn.utils import parameters_to_vector
 from .deep_models import DNN,WRFNN, MDNN
+from .derivatives import compute_partials
 
 def _uplad_model(config):
     if config.nn_model == "NN":
@@ -25,19 +26,37 @@ class deepGalerkin(torch.nn.Module):
         self.M = None
         self.gamma = None
 
+        # "autograd" or "forward" (torch.func), see Base.derivatives
+        self.derivative_engine = config.get("derivative_engine", "autograd")
+
         # Initialize model
         self.model = _uplad_model(config).to(device)
         self.to(device)
 
-    def laplace_approx():
+    def laplace_approx(output=None):
+        """
+        Mark a method as a term of the Laplace approximation. `output` is the column of the
+        model output the method returns unchanged (a linear output of the last layer), which
+        dgala fits from the last-layer features without autograd. None for residual operators.
+        """
         def decorator(func):
             def wrapper(*args, **kwargs):
                 # Pass through the original function's behavior
                 return func(*args, **kwargs)
             wrapper.use_laplace = True  # Add the attribute to the wrapped function
+            wrapper.linear_output = output
             return wrapper  # Return the wrapped function
         return decorator
     
+    def partials(self, x, names):
+        """
+        Partial derivatives of the model outputs at `x`, declared by name ("w_x", "w_xx", ...)
+        against the `output_names` and `input_names` of the subclass, see Base.derivatives.
+        """
+        # Models pickled before derivative_engine existed use reverse mode
+        engine = getattr(self, "derivative_engine", "autograd")
+        return compute_partials(self.model, x, names, self.output_names, self.input_names, engine=engine)
+
     def init_M(self):  # Separate method for initializing M
         if hasattr(self, 'chunks'):
             self.M = torch.triu(torch.ones((self.chunks, self.chunks), device=self.device), diagonal=1).T
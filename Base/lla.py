@@ -1,5 +1,4 @@
 import torch
-from torch.nn.utils import parameters_to_vector
 from torch.distributions.multivariate_normal import _precision_to_scale_tril
 
 from  .utilities import get_decorated_methods
@@ -8,12 +7,33 @@ from .utilities import FeatureExtractor
 from copy import deepcopy
 from math import sqrt, pi
 
+def select_laplace_layers(model, subset_of_weights, last_layer_name):
+    """
+    Names of the layers whose weights are in the Laplace approximation: `last_layer_name` for
+    "last_layer", every nn.Linear of the model for "all", or a list of layer names (subnetwork).
+    """
+    if subset_of_weights == "last_layer":
+        return [last_layer_name]
+    if subset_of_weights == "all":
+        return [name for name, module in model.named_modules() if isinstance(module, torch.nn.Linear)]
+    return list(subset_of_weights)
+
+
 class dgala(torch.nn.Module):
-    def __init__(self, dga, sigma_noise=1., prior_precision=1.,prior_mean=0., last_layer_name = "output_layer"):
+    """
+    Laplace approximation of a deepGalerkin model with a dense (full) generalized Gauss-Newton
+    Hessian of the weights of `subset_of_weights`, see select_laplace_layers. The structured
+    curvatures (DiagDgala, KronDgala, LowRankDgala) share the fit / __call__ /
+    log_marginal_likelihood API, see get_dgala.
+    """
+    def __init__(self, dga, sigma_noise=1., prior_precision=1.,prior_mean=0., last_layer_name = "output_layer",
+                 jacobian_batch_size = 512, subset_of_weights = "last_layer"):
         super(dgala, self).__init__()
 
         self.dgala = deepcopy(dga)
         self.model = FeatureExtractor(deepcopy(dga.model), last_layer_name = last_layer_name)
+        self.layer_names = select_laplace_layers(dga.model, subset_of_weights, last_layer_name)
+        self.layer_sizes = None
         self._device = next(dga.model.parameters()).device
         self.lossfunc = torch.nn.MSELoss(reduction ='mean')
         
@@ -23,6 +43,8 @@ class dgala(torch.nn.Module):
         self.mean = None
         self.n_params = None
         self.n_data = {key: None for key in self.dgala.lambdas.keys()}
+        self.jacobian_batch_size = jacobian_batch_size  # Output rows per batched backward pass in fit
+        self._posterior_cache = None  # (state key, factors, state tensors), see posterior_factors
 
         self._prior_precision = torch.tensor([prior_precision], device=self._device)
         self._prior_mean = torch.tensor([prior_mean], device=self._device)
@@ -44,6 +66,7 @@ class dgala(torch.nn.Module):
             self._prior_precision = new_prior_precision.to(self._device)
         else:
             self._prior_precision = torch.tensor([new_prior_precision], device=self._device).float()
+        self._posterior_cache = None
 
     @property
     def sigma_noise(self):
@@ -55,16 +78,49 @@ class dgala(torch.nn.Module):
             self._sigma_noise = new_sigma_noise.to(self._device)
         else:
             self._sigma_noise = torch.tensor(new_sigma_noise, device=self._device,requires_grad=True).float()
+        self._posterior_cache = None
 
     @property
     def posterior_precision(self):
         """Diagonal posterior precision \\(p\\)."""
         return self._H_factor * self.H + torch.diag(self.prior_precision_diag)
 
+    @property
+    def posterior_factors(self):
+        """
+        Factorization of the posterior precision used by the predictive distribution (see
+        _factorize_posterior). It is computed once and reused until H, the prior precision,
+        sigma_noise or the temperature change (reassigned, or modified in place). Not
+        differentiable, the predictive distribution is detached anyway.
+        """
+        # A tensor is identified by its id, storage and in-place version. The cache holds on to the
+        # tensors, so their ids cannot be reused by new tensors while the entry is alive
+        state = [*self._H_tensors(), self.prior_precision, self.sigma_noise]
+        key = tuple((id(t), t.data_ptr(), t._version) for t in state) + (self.temperature,)
+        # dgala objects pickled before the cache existed have no _posterior_cache
+        cached = getattr(self, "_posterior_cache", None)
+        if cached is None or cached[0] != key:
+            with torch.no_grad():
+                cached = (key, self._factorize_posterior(), state)
+            self._posterior_cache = cached
+        return cached[1]
+
+    def _H_tensors(self):
+        """Tensors that hold H, they key the posterior_factors cache."""
+        return [self.H]
+
+    def _factorize_posterior(self):
+        return _precision_to_scale_tril(self.posterior_precision)
+
+    @property
+    def posterior_scale(self):
+        """Lower triangular factor \\(S\\) of the posterior covariance, \\(S S^T = p^{-1}\\), cached."""
+        return self.posterior_factors
+
     @property
     def posterior_covariance(self):
-        """Diagonal posterior variance \\(p^{-1}\\).""" 
-        post_scale = _precision_to_scale_tril(self.posterior_precision)
+        """Posterior covariance \\(p^{-1}\\), from the cached posterior_scale.""" 
+        post_scale = self.posterior_scale
         return post_scale @ post_scale.T
 
     @property
@@ -82,6 +138,13 @@ class dgala(torch.nn.Module):
 
         elif len(self.prior_precision) == self.n_params:  # diagonal
             return self.prior_precision
+
+        elif len(self.prior_precision) == len(self.laplace_layer_names):  # layer-wise
+            sizes = torch.tensor(self.layer_sizes, device=self._device)
+            return self.prior_precision.repeat_interleave(sizes)
+
+        raise ValueError(f"Prior precision of length {len(self.prior_precision)}, expected 1 (scalar), "
+                         f"{len(self.laplace_layer_names)} (layer-wise) or {self.n_params} (diagonal).")
         
     @property
     def scatter(self):
@@ -146,9 +209,10 @@ class dgala(torch.nn.Module):
        # assert set(self.class_methods) == set([element for sublist in fit_data["class_method"].values() for element in sublist])
 
         self.dgala.model.eval()
-        #self.mean = parameters_to_vector(self.dgala.model.output_layer.parameters()).detach()
-        self.mean = parameters_to_vector(self.model.last_layer.parameters()).detach()
+        layer_vectors = [self.layer_vector(layer) for layer in self.laplace_layers(self.dgala.model)]
+        self.mean = torch.cat(layer_vectors).detach()
         self.n_params = len(self.mean)
+        self.layer_sizes = [len(v) for v in layer_vectors]
         self.prior_mean = self._prior_mean
         self._init_H()
 
@@ -168,85 +232,241 @@ class dgala(torch.nn.Module):
         self.loss = {key:loss.item() for key,loss in loss.items()}
 
         self.full_Hessian(fit_data)
+        self._finalize_H()
         
     def _init_H(self):
         self.H = torch.zeros(self.n_params,self.n_params,device=self._device)
+        self._posterior_cache = None
+
+    def _accumulate_H(self, jacobian_matrix, weight):
+        """Add weight * J^T J of a batch of (row weighted) Jacobians (batch, n_params) to H."""
+        self.H += weight * (jacobian_matrix.T @ jacobian_matrix)
+
+    def _add_damping(self, damping):
+        self.H.diagonal().add_(damping)
 
-    def gradient_outograd(self, y, x):
-        grad_p = torch.autograd.grad(outputs=y, 
-                                 inputs=x, create_graph=True, allow_unused=True, materialize_grads=True)
-        return [grp.detach() for grp in grad_p]
+    def _finalize_H(self):
+        """Called once all the terms are accumulated, e.g. to factorize a structured H."""
+        pass
+
+    @property
+    def laplace_layer_names(self):
+        # dgala objects pickled before subset_of_weights existed are last-layer only
+        return getattr(self, "layer_names", None) or [self.model._last_layer_name]
+
+    @property
+    def last_layer_only(self):
+        return self.laplace_layer_names == [self.model._last_layer_name]
+
+    def laplace_layers(self, model):
+        """The modules of `model` in the Laplace approximation, in the order of the parameter vector."""
+        modules = dict(model.named_modules())
+        layers = [modules[name] for name in self.laplace_layer_names]
+        if not self.last_layer_only and not all(isinstance(layer, torch.nn.Linear) for layer in layers):
+            raise ValueError("Laplace approximations beyond the last layer need nn.Linear layers.")
+        return layers
+
+    def layer_vector(self, layer):
+        """Parameters of a layer as a vector, the weights and bias of every output unit consecutive."""
+        params = list(layer.parameters())
+        ndim = params[0].shape[0]
+        return torch.cat([p.reshape(ndim, -1) for p in params], dim=1).reshape(-1)
+
+    def batched_jacobian(self, output, parameters_, start, stop):
+        """
+        Jacobians of the rows `start:stop` of the flattened `output` with respect to
+        `parameters_` (a list with the parameters of every layer), from one batched backward
+        pass (`is_grads_batched`, a vmap over the vector-Jacobian products) seeded with one-hot
+        rows.
+
+        Returns:
+        Tensor: (stop - start, n_params), layer after layer, the parameters of every output unit
+                of a layer consecutive (weights, then bias), as in layer_vector.
+        """
+        bsize = stop - start
+        grad_outputs = torch.zeros(bsize, output.shape[0], device=output.device, dtype=output.dtype)
+        grad_outputs[torch.arange(bsize), torch.arange(start, stop)] = 1
+
+        inputs = [p for layer in parameters_ for p in layer]
+        grad_p = torch.autograd.grad(outputs=output, inputs=inputs, grad_outputs=grad_outputs,
+                                     retain_graph=True, allow_unused=True, is_grads_batched=True)
+        # materialize_grads would give the parameters `output` does not depend on (the output bias
+        # of a residual) zeros without the batch dimension
+        grad_p = [g if g is not None else torch.zeros(bsize, *p.shape, device=p.device, dtype=p.dtype)
+                  for g, p in zip(grad_p, inputs)]
+
+        jacobians, first = [], 0
+        for layer in parameters_:
+            grads = grad_p[first:first + len(layer)]
+            first += len(layer)
+            ndim = grads[0].shape[1]
+            jacobians.append(torch.cat([g.reshape(bsize, ndim, -1) for g in grads], dim=2).reshape(bsize, -1))
+        return torch.cat(jacobians, dim=1)
+
+    def jacobian_batches(self, output, parameters_):
+        """Jacobians of `output` in batches of `jacobian_batch_size` rows, yields (start, stop, J)."""
+        output = output.reshape(-1)
+        batch_size = getattr(self, "jacobian_batch_size", 512)
+        for start in range(0, output.shape[0], batch_size):
+            stop = min(start + batch_size, output.shape[0])
+            yield start, stop, self.batched_jacobian(output, parameters_, start, stop).detach()
     
     def full_Hessian(self,fit_data, damping_factor=1e-6):
-        parameters_ = list(self.dgala.model.output_layer.parameters())
-        #parameters_ = list(self.model.last_layer.parameters())
-        damping = torch.eye(self.n_params,device=self._device)*damping_factor
+        parameters_ = [list(layer.parameters()) for layer in self.laplace_layers(self.dgala.model)]
 
         for key,dt_fit in fit_data["data_fit"].items():
             dt_fit = dt_fit[1] if isinstance(dt_fit, tuple) else dt_fit
 
             for z,clm in enumerate(fit_data["class_method"][key]):
+                weight = self.dgala.lambdas[fit_data["outputs"][key][z]]
+                output = self.linear_output(clm)
+                if output is not None:
+                    self.linear_output_hessian(dt_fit, output, key, weight)
+                    self._add_damping(damping_factor * weight)
+                    self.n_data[fit_data["outputs"][key][z]] = dt_fit.shape[0]
+                    continue
+
                 self.dgala.model.zero_grad()
                 fout = getattr(self.dgala, clm)(dt_fit)
 
                 if isinstance(fout, tuple):  # Check if fout is a tuple
                     for i, f_out_indv in enumerate(fout):  # Iterate over fout if it's a tuple
-                        indv_h = self.compute_hessian(f_out_indv,parameters_,key)
-                        self. H += (indv_h + damping)*self.dgala.lambdas[fit_data["outputs"][key][i]]
+                        weight = self.dgala.lambdas[fit_data["outputs"][key][i]]
+                        self.compute_hessian(f_out_indv,parameters_,key,weight)
+                        self._add_damping(damping_factor * weight)
                         self.n_data[fit_data["outputs"][key][i]] = f_out_indv.shape[0]
                 else:
-                    indv_h = self.compute_hessian(fout,parameters_,key)
-                    self. H += (indv_h + damping)*self.dgala.lambdas[fit_data["outputs"][key][z]]
+                    self.compute_hessian(fout,parameters_,key,weight)
+                    self._add_damping(damping_factor * weight)
                     self.n_data[fit_data["outputs"][key][z]] = fout.shape[0]
                 
-    def compute_hessian (self,output,parameters_,key):
-        hessian_loss = torch.zeros(self.n_params,self.n_params)
-
-        if self.chunks: 
-            nitems_chunk = output.shape[0] // self.chunks
-            chunk_counter = 0
+    def linear_output(self, clm):
+        """
+        Column of the model output that the method `clm` returns as is (see
+        deepGalerkin.laplace_approx), or None when its Jacobian needs autograd. The closed form
+        needs a last-layer approximation with the nn.Linear parameter layout.
+        """
+        if not self.last_layer_only or not isinstance(self.model.last_layer, torch.nn.Linear):
+            return None
+        return getattr(getattr(self.dgala, clm), "linear_output", None)
+
+    def row_weights(self, nrows, key):
+        """sqrt(gamma[c]) for the rows of chunk c of the chunked PDE loss, None for other terms."""
+        if not (self.chunks and key == "pde"):
+            return None
+        return self.gamma.to(self._device).sqrt().repeat_interleave(nrows // self.chunks)
+
+    def linear_output_rows(self, phi, output):
+        """Last-layer Jacobians of output `output`, [phi, 1] in the parameters of that unit, (batch, n_params)."""
+        jacobian_matrix = torch.zeros(phi.shape[0], self.n_params, device=phi.device, dtype=phi.dtype)
+        nfeatures = phi.shape[1]
+        jacobian_matrix[:, output * nfeatures:(output + 1) * nfeatures] = phi
+        return jacobian_matrix
+
+    def linear_output_hessian(self, x, output, key, weight):
+        """
+        Add the GGN of a linear output to H from the penultimate features, one GEMM and no
+        backward pass. The last-layer Jacobian of output c at x is [phi(x), 1] in the
+        parameters of unit c and zero elsewhere, so only the diagonal block of unit c is filled.
+        """
+        with torch.no_grad():
+            _, phi = self.last_layer_features(x)
 
-        for i,fo in enumerate(output):
-            grad_p = self.gradient_outograd(fo,parameters_)
-            
-            ndim = grad_p[0].shape[0]
+            row_weights = self.row_weights(phi.shape[0], key)
+            if row_weights is not None:
+                phi = phi * row_weights[:, None]
 
-            reshaping_grads = [g.reshape(ndim,-1) for g in grad_p]
-            # Concatenate along the parameter axis
-            jacobian_matrix = torch.cat(reshaping_grads, dim=1).flatten().unsqueeze(0) 
+            nfeatures = phi.shape[1]
+            block = slice(output * nfeatures, (output + 1) * nfeatures)
+            self.H[block, block] += weight * (phi.T @ phi)
 
-            hessian_loss +=  jacobian_matrix.T @ jacobian_matrix
+    def compute_hessian (self,output,parameters_,key,weight):
+        """
+        Add the generalized Gauss-Newton weight * J^T J of `output` with respect to
+        `parameters_` to H, from the per-sample Jacobians of `jacobian_batch_size` rows at a
+        time. For the chunked PDE loss the rows of chunk c are scaled by sqrt(gamma[c]), so
+        every chunk enters with the causal weight it has in the loss.
+        """
+        row_weights = self.row_weights(output.numel(), key)
 
-            if self.chunks and (i + 1) % nitems_chunk == 0 and key == "pde":
-                hessian_loss *= self.gamma[chunk_counter]
-                chunk_counter += 1
-        return hessian_loss
+        for start, stop, jacobian_matrix in self.jacobian_batches(output, parameters_):
+            if row_weights is not None:
+                jacobian_matrix = jacobian_matrix * row_weights[start:stop, None]
+            self._accumulate_H(jacobian_matrix, weight)
         
 
-    def __call__(self, x):
-        """Compute the posterior predictive on input data `X`."""
-        f_mu, f_var = self._glm_predictive_distribution(x)
+    def __call__(self, x, outputs=None, diagonal=False):
+        """Compute the posterior predictive on input data `X`, see _glm_predictive_distribution."""
+        f_mu, f_var = self._glm_predictive_distribution(x, outputs=outputs, diagonal=diagonal)
         return f_mu, f_var
 
 
-    def _glm_predictive_distribution(self, X):
-        Js, f_mu = self.last_layer_jacobians(X)
-        f_var = self.functional_variance(Js)
-        if f_mu.shape[-1] > 1:
+    @torch.no_grad()
+    def _glm_predictive_distribution(self, X, outputs=None, diagonal=False):
+        """
+        Predictive mean and variance of the linearized model at `X`.
+
+        Without `outputs` and `diagonal` the shapes are the historical ones: the variances
+        (batch, output) of a multi-output model, the covariance (batch, 1, 1) of a single output.
+        With `outputs` (output indices) only those are returned, the means (batch, k) and either
+        the variances (batch, k) when `diagonal`, or the covariances (batch, k, k).
+        """
+        if self.last_layer_only:
+            f_mu, phi = self.last_layer_features(X)
+        else:
+            f_mu, phi = self.model(X), None
+        selected = range(f_mu.shape[-1]) if outputs is None else list(outputs)
+
+        f_var = self.predictive_covariance(X, phi, selected, diagonal)
+        if not diagonal and outputs is None and f_mu.shape[-1] > 1:
             f_var = torch.diagonal(f_var, dim1 = 1, dim2 = 2)
+
+        if outputs is not None:
+            f_mu = f_mu[:, list(outputs)]
         return f_mu.detach(), f_var.detach()
 
+    def predictive_covariance(self, X, phi, selected, diagonal):
+        """
+        Covariances (batch, k, k), or variances (batch, k) when `diagonal`, of the `selected`
+        outputs, as (J S)(J S)^T with the cached posterior_scale S.
+
+        For the last layer the Jacobian of output c is phi^T in the parameters of unit c
+        (phi ⊗ I), so J S is phi @ S[block c] and the identity-tiled Jacobian is never built.
+        """
+        if phi is not None:
+            scale_blocks = self.posterior_scale.reshape(-1, phi.shape[1], self.n_params)
+            JS = [phi @ scale_blocks[c] for c in selected]
+        else:
+            JS = [J @ self.posterior_scale for J in self.output_jacobians(X, selected)]
+
+        if diagonal:
+            return torch.stack([js.square().sum(-1) for js in JS], dim=1)
+        JS = torch.stack(JS, dim=1)
+        return JS @ JS.transpose(1, 2)
+
+    def output_jacobians(self, X, selected):
+        """Jacobians (batch, n_params) of the `selected` model outputs with respect to the Laplace weights."""
+        with torch.enable_grad():
+            f = self.model.model(X)
+            parameters_ = [list(layer.parameters()) for layer in self.laplace_layers(self.model.model)]
+            return [torch.cat([J for _, _, J in self.jacobian_batches(f[:, c], parameters_)]) for c in selected]
+
+    def last_layer_features(self, x):
+        """Model output and penultimate features, with a column of ones for the bias."""
+        f, phi = self.model.forward_with_features(x)
+        if self.model.last_layer.bias is not None:
+            phi = torch.cat([phi, torch.ones(phi.shape[0], 1, device=phi.device)], dim=1)
+        return f, phi
+
     def last_layer_jacobians(self, x):
         """
         Compute Jacobians \\(\\nabla_{\\theta_\\textrm{last}} f(x;\\theta_\\textrm{last})\\) 
         only at current last-layer parameter \\(\\theta_{\\textrm{last}}\\).
         """
-        f, phi = self.model.forward_with_features(x)
+        f, phi = self.last_layer_features(x)
         bsize = phi.shape[0]
         output_size = f.shape[-1]
 
-        if self.model.last_layer.bias is not None:
-            phi = torch.cat([phi, torch.ones(f.shape[0],1).to(self._device)], dim=1)
         # calculate Jacobians using the feature vector 'phi'
         identity = torch.eye(output_size, device=x.device).unsqueeze(0).tile(bsize, 1, 1)
         # Jacobians are batch x output x params
@@ -255,7 +475,12 @@ class dgala(torch.nn.Module):
     
 
     def functional_variance(self, Js: torch.Tensor) -> torch.Tensor:
-        return torch.einsum('ncp,pq,nkq->nck', Js, self.posterior_covariance, Js)
+        """
+        Covariance J p^{-1} J^T of the outputs, (batch, output, output), as (J S)(J S)^T with
+        the cached posterior_scale S: one GEMM with the factor, no inversion per call.
+        """
+        JS = Js @ self.posterior_scale
+        return JS @ JS.transpose(1, 2)
     
   
     def log_marginal_likelihood(self, prior_precision=None, sigma_noise=None):
@@ -306,3 +531,296 @@ class dgala(torch.nn.Module):
 
         if n_iter == max_iter:
             print(f"Maximum iterations ({max_iter})reached, sigma : {self.sigma_noise.item()}, prior: {self.prior_precision.item()}.")
+
+
+class _StructuredDgala(dgala):
+    """
+    Common part of the structured curvatures. The GGN is accumulated from Jacobian rows (the
+    closed-form rows of linear outputs included) into the representation of the subclass, and
+    the predictive covariance comes from Jacobians whitened by the posterior factors, minus a
+    low-rank correction where the subclass has one.
+    """
+    def linear_output_hessian(self, x, output, key, weight):
+        with torch.no_grad():
+            _, phi = self.last_layer_features(x)
+
+            row_weights = self.row_weights(phi.shape[0], key)
+            if row_weights is not None:
+                phi = phi * row_weights[:, None]
+            self._accumulate_H(self.linear_output_rows(phi, output), weight)
+
+    def laplace_layers(self, model):
+        layers = super().laplace_layers(model)
+        if not all(isinstance(layer, torch.nn.Linear) for layer in layers):
+            raise ValueError(f"{type(self).__name__} needs nn.Linear layers.")
+        return layers
+
+    def predictive_covariance(self, X, phi, selected, diagonal):
+        if phi is not None:
+            Js = [self.linear_output_rows(phi, c) for c in selected]
+        else:
+            Js = self.output_jacobians(X, selected)
+
+        factors = self.posterior_factors
+        whitened = [self.whiten(J, factors) for J in Js]
+        corrections = [self.correction(J, factors) for J in Js]
+
+        if diagonal:
+            f_var = torch.stack([w.square().sum(-1) for w in whitened], dim=1)
+            if corrections[0] is not None:
+                f_var = f_var - torch.stack([c.square().sum(-1) for c in corrections], dim=1)
+            return f_var
+
+        whitened = torch.stack(whitened, dim=1)
+        f_var = whitened @ whitened.transpose(1, 2)
+        if corrections[0] is not None:
+            corrections = torch.stack(corrections, dim=1)
+            f_var = f_var - corrections @ corrections.transpose(1, 2)
+        return f_var
+
+    def whiten(self, J, factors):
+        raise NotImplementedError
+
+    def correction(self, J, factors):
+        """Rows C with J p^{-1} J^T = (J W)(J W)^T - C C^T, None without a low-rank term."""
+        return None
+
+    @property
+    def posterior_covariance(self):
+        """Dense posterior covariance \\(p^{-1}\\), O(n_params^2) memory, for small problems and checks."""
+        return torch.linalg.inv(self.posterior_precision)
+
+    @property
+    def posterior_scale(self):
+        """Dense lower triangular factor of the posterior covariance, for small problems and checks."""
+        return torch.linalg.cholesky(self.posterior_covariance)
+
+
+class DiagDgala(_StructuredDgala):
+    """
+    Diagonal GGN, H is the vector of the squared Jacobians summed over the data. O(n_params)
+    memory, the log determinant and the predictive variances are elementwise.
+    """
+    def _init_H(self):
+        self.H = torch.zeros(self.n_params,device=self._device)
+        self._posterior_cache = None
+
+    def _accumulate_H(self, jacobian_matrix, weight):
+        self.H += weight * jacobian_matrix.square().sum(0)
+
+    def _add_damping(self, damping):
+        self.H += damping
+
+    @property
+    def posterior_precision(self):
+        """Diagonal posterior precision \\(p\\), as a vector."""
+        return self._H_factor * self.H + self.prior_precision_diag
+
+    @property
+    def log_det_posterior_precision(self):
+        return self.posterior_precision.log().sum()
+
+    @property
+    def posterior_covariance(self):
+        return torch.diag(1 / self.posterior_precision)
+
+    @property
+    def posterior_scale(self):
+        return torch.diag(self.posterior_factors)
+
+    def _factorize_posterior(self):
+        return self.posterior_precision.rsqrt()
+
+    def whiten(self, J, factors):
+        return J * factors
+
+
+class KronDgala(_StructuredDgala):
+    """
+    Kronecker-factored GGN (KFAC): one block B ⊗ A per layer, A over the inputs (and bias) of
+    the layer and B over its output units, no coupling between layers. The factors are
+    eigendecomposed once after fit, so the log determinant and the solves are elementwise in
+    the eigenbasis, \\(O(n_{in}^3 + n_{out}^3)\\) per layer instead of \\(O(n_{params}^3)\\).
+
+    The per-sample weight gradients G (n_out, n_in + 1) of a residual operator are not rank one
+    (the input derivatives run through the layer several times), so the factors are the
+    one-pass estimate A = sum G^T G / sum ||G||^2 and B = sum G G^T, whose Kronecker product
+    has the trace of the exact block. The damping is added exactly to the eigenvalues. The prior
+    precision has to be scalar or layer-wise.
+    """
+    def _init_H(self):
+        layers = self.laplace_layers(self.dgala.model)
+        self.layer_shapes = [(layer.out_features, size // layer.out_features)
+                             for layer, size in zip(layers, self.layer_sizes)]
+        self.H = {"A": [torch.zeros(nin, nin, device=self._device) for _, nin in self.layer_shapes],
+                  "B": [torch.zeros(nout, nout, device=self._device) for nout, _ in self.layer_shapes],
+                  "scale": [torch.zeros((), device=self._device) for _ in self.layer_shapes],
+                  "damping": torch.zeros((), device=self._device)}
+        self.eigen = None
+        self._posterior_cache = None
+
+    def layer_gradients(self, J):
+        """Split Jacobian rows (batch, n_params) into the weight gradients (batch, n_out, n_in + 1) of every layer."""
+        first = 0
+        for nout, nin in self.layer_shapes:
+            yield J[:, first:first + nout * nin].reshape(-1, nout, nin)
+            first += nout * nin
+
+    def _accumulate_H(self, jacobian_matrix, weight):
+        for l, G in enumerate(self.layer_gradients(jacobian_matrix)):
+            self.H["A"][l] += weight * torch.einsum("noi,noj->ij", G, G)
+            self.H["B"][l] += weight * torch.einsum("nio,njo->ij", G, G)
+            self.H["scale"][l] += weight * G.square().sum()
+
+    def _add_damping(self, damping):
+        self.H["damping"] += damping
+
+    def _finalize_H(self):
+        """Eigendecompositions (la, Qa, lb, Qb) of the trace matched factors of every layer."""
+        self.eigen = []
+        for A, B, scale in zip(self.H["A"], self.H["B"], self.H["scale"]):
+            la, Qa = torch.linalg.eigh(A / scale.clamp_min(torch.finfo(A.dtype).tiny))
+            lb, Qb = torch.linalg.eigh(B)
+            self.eigen.append((la.clamp_min(0), Qa, lb.clamp_min(0), Qb))
+        self._posterior_cache = None
+
+    def _H_tensors(self):
+        return self.H["A"] + self.H["B"] + self.H["scale"] + [self.H["damping"]]
+
+    @property
+    def layer_prior_precision(self):
+        nlayers = len(self.layer_shapes)
+        if len(self.prior_precision) == 1:
+            return self.prior_precision.expand(nlayers)
+        if len(self.prior_precision) == nlayers:
+            return self.prior_precision
+        raise ValueError(f"{type(self).__name__} needs a scalar or layer-wise ({nlayers}) prior precision.")
+
+    def layer_eigenvalues(self):
+        """Eigenvalues (n_out, n_in + 1) of the posterior precision of every layer."""
+        return [self._H_factor * (lb[:, None] * la[None, :] + self.H["damping"]) + delta
+                for (la, _, lb, _), delta in zip(self.eigen, self.layer_prior_precision)]
+
+    @property
+    def posterior_precision(self):
+        """Dense block-diagonal posterior precision \\(p\\), for small problems and checks."""
+        blocks = []
+        for (la, Qa, lb, Qb), eigenvalues in zip(self.eigen, self.layer_eigenvalues()):
+            Q = torch.kron(Qb, Qa)
+            blocks.append((Q * eigenvalues.reshape(-1)) @ Q.T)
+        return torch.block_diag(*blocks)
+
+    @property
+    def log_det_posterior_precision(self):
+        return sum(eigenvalues.log().sum() for eigenvalues in self.layer_eigenvalues())
+
+    def _factorize_posterior(self):
+        return [(Qa, Qb, eigenvalues.rsqrt())
+                for (_, Qa, _, Qb), eigenvalues in zip(self.eigen, self.layer_eigenvalues())]
+
+    def whiten(self, J, factors):
+        # (Qb ⊗ Qa)^T vec(G) = vec(Qb^T G Qa) for the row-major layout of the layer parameters
+        return torch.cat([((Qb.T @ G @ Qa) * inv_sqrt).reshape(G.shape[0], -1)
+                          for (Qa, Qb, inv_sqrt), G in zip(factors, self.layer_gradients(J))], dim=1)
+
+
+class LowRankDgala(_StructuredDgala):
+    """
+    Low-rank-plus-diagonal GGN, H ≈ U diag(s) U^T + D. The rank `rank` part is a Nyström
+    approximation from a sketch H Ω accumulated in the same single pass over the Jacobians
+    (Tropp et al. 2017, with a small shift for stability), and D keeps the part of the exact
+    diagonal it misses. The log determinant and the predictive variances use the Woodbury
+    identity, \\(O(n_{params}\\, rank^2)\\) instead of \\(O(n_{params}^3)\\).
+    """
+    def __init__(self, dga, rank=50, seed=0, **kwargs):
+        super(LowRankDgala, self).__init__(dga, **kwargs)
+        self.rank = rank
+        self.seed = seed
+
+    def _init_H(self):
+        generator = torch.Generator().manual_seed(self.seed)
+        test_matrix = torch.randn(self.n_params, min(self.rank, self.n_params), generator=generator)
+        self.test_matrix = torch.linalg.qr(test_matrix)[0].to(self._device)
+
+        self.H = {"sketch": torch.zeros(self.n_params, self.test_matrix.shape[1], device=self._device),
+                  "diagonal": torch.zeros(self.n_params, device=self._device),
+                  "damping": torch.zeros((), device=self._device)}
+        self._posterior_cache = None
+
+    def _accumulate_H(self, jacobian_matrix, weight):
+        self.H["sketch"] += weight * (jacobian_matrix.T @ (jacobian_matrix @ self.test_matrix))
+        self.H["diagonal"] += weight * jacobian_matrix.square().sum(0)
+
+    def _add_damping(self, damping):
+        self.H["damping"] += damping
+
+    def _finalize_H(self):
+        """Nyström approximation U diag(s) U^T of the sketched GGN and the diagonal residual D."""
+        sketch, test_matrix = self.H["sketch"], self.test_matrix
+        shift = torch.finfo(sketch.dtype).eps * torch.linalg.norm(sketch)
+        shifted = sketch + shift * test_matrix
+
+        C = torch.linalg.cholesky(test_matrix.T @ shifted)
+        B = torch.linalg.solve_triangular(C, shifted.T, upper=False).T
+        U, singular_values, _ = torch.linalg.svd(B, full_matrices=False)
+        eigenvalues = (singular_values.square() - shift).clamp_min(0)
+
+        self.H["U"] = U
+        self.H["eigenvalues"] = eigenvalues
+        self.H["residual"] = (self.H["diagonal"] - (U.square() * eigenvalues).sum(1)).clamp_min(0)
+        self._posterior_cache = None
+
+    def _H_tensors(self):
+        return [self.H["U"], self.H["eigenvalues"], self.H["residual"], self.H["damping"]]
+
+    def low_rank_terms(self):
+        """Diagonal Dp = a (D + damping) + p_0 of the posterior precision and Û = U (a s)^{1/2}, p = Dp + Û Û^T."""
+        diagonal = self._H_factor * (self.H["residual"] + self.H["damping"]) + self.prior_precision_diag
+        U = self.H["U"] * (self._H_factor * self.H["eigenvalues"]).sqrt()
+        return diagonal, U
+
+    @property
+    def posterior_precision(self):
+        """Dense posterior precision \\(p\\), for small problems and checks."""
+        diagonal, U = self.low_rank_terms()
+        return U @ U.T + torch.diag(diagonal)
+
+    @property
+    def log_det_posterior_precision(self):
+        # det(Dp + Û Û^T) = det(Dp) det(I + Û^T Dp^{-1} Û)
+        diagonal, U = self.low_rank_terms()
+        K = torch.eye(U.shape[1], device=self._device) + U.T @ (U / diagonal[:, None])
+        return diagonal.log().sum() + torch.logdet(K)
+
+    def _factorize_posterior(self):
+        diagonal, U = self.low_rank_terms()
+        V = U / diagonal[:, None]
+        L = torch.linalg.cholesky(torch.eye(U.shape[1], device=self._device) + U.T @ V)
+        return diagonal.rsqrt(), V, L
+
+    def whiten(self, J, factors):
+        return J * factors[0]
+
+    def correction(self, J, factors):
+        # Woodbury: p^{-1} = Dp^{-1} - V K^{-1} V^T with V = Dp^{-1} Û and K = I + Û^T V = L L^T
+        _, V, L = factors
+        return torch.linalg.solve_triangular(L, (J @ V).T, upper=False).T
+
+
+DGALA_STRUCTURES = {
+    "full": dgala,
+    "diag": DiagDgala,
+    "kron": KronDgala,
+    "lowrank": LowRankDgala,
+}
+
+
+def get_dgala(dga, hessian_structure="full", **kwargs):
+    """
+    Laplace approximation of `dga` with the `hessian_structure` curvature ("full", "diag",
+    "kron" or "lowrank"). The options (subset_of_weights, prior_precision, rank, ...) are
+    passed to the class.
+    """
+    if hessian_structure not in DGALA_STRUCTURES:
+        raise ValueError(f"Unknown Hessian structure '{hessian_structure}', choose one of {list(DGALA_STRUCTURES)}.")
+    return DGALA_STRUCTURES[hessian_structure](dga, **kwargs)
@@ -4,10 +4,177 @@ import torch.multiprocessing as mp
 
 from pyro.distributions import Distribution
 
+import os
+import glob
 import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm  # For a progress bar
 
 
+class SampleSink:
+    """
+    Receives the states of a chain one step at a time. Every `thin`-th state is kept in a
+    buffer of `chunk_size` states on the chain's device, full buffers are handed to
+    `write_chunk` as host arrays, so the memory footprint does not grow with the chain length.
+    """
+    def __init__(self, thin=1, chunk_size=10000):
+        self.thin = thin
+        self.chunk_size = chunk_size
+        self.buffer = None
+        self.n_seen = 0
+        self.n_buffer = 0
+        self.n_stored = 0
+
+    def append(self, theta):
+        """Offer the current state of the chain, shape (nparameters) or (nchains, nparameters)."""
+        if self.n_seen % self.thin == 0:
+            if self.buffer is None:
+                self.buffer = torch.zeros((self.chunk_size, *theta.shape), dtype=theta.dtype, device=theta.device)
+            self.buffer[self.n_buffer] = theta.detach()
+            self.n_buffer += 1
+            if self.n_buffer == self.chunk_size:
+                self.flush()
+        self.n_seen += 1
+
+    def flush(self):
+        """Hand the buffered states to `write_chunk` and empty the buffer."""
+        if self.n_buffer > 0:
+            self.write_chunk(self.buffer[:self.n_buffer].to("cpu", copy=True).numpy())
+            self.n_stored += self.n_buffer
+            self.n_buffer = 0
+
+    def write_chunk(self, chunk):
+        raise NotImplementedError("write_chunk must be implemented in a subclass.")
+
+    def result(self):
+        raise NotImplementedError("result must be implemented in a subclass.")
+
+
+class MemorySink(SampleSink):
+    """Keeps every stored state in host memory and returns them as one array."""
+    def __init__(self, thin=1, chunk_size=10000):
+        super().__init__(thin, chunk_size)
+        self.chunks = []
+
+    def write_chunk(self, chunk):
+        self.chunks.append(chunk)
+
+    def result(self):
+        self.flush()
+        if not self.chunks:
+            return np.empty((0,))
+        return np.concatenate(self.chunks, axis=0)
+
+
+class NpyChunkSink(SampleSink):
+    """
+    Writes the stored states to disk as a directory of `.npy` chunks (one file per full buffer),
+    so results are flushed incrementally and a run can be inspected while it is still going.
+    Chunks left in `path` by an earlier run are removed when the sink is created, as `np.save`
+    would overwrite a single result file. Use `NpyChunkSink.load` to read them back.
+    """
+    def __init__(self, path, thin=1, chunk_size=10000):
+        super().__init__(thin, chunk_size)
+        self.path = path
+        self.n_chunks = 0
+        os.makedirs(self.path, exist_ok=True)
+        for file in glob.glob(os.path.join(self.path, "chunk_*.npy")):
+            os.remove(file)
+
+    def write_chunk(self, chunk):
+        np.save(os.path.join(self.path, f"chunk_{self.n_chunks:06d}.npy"), chunk)
+        self.n_chunks += 1
+
+    def result(self):
+        self.flush()
+        return self.path
+
+    @staticmethod
+    def load(path, mmap_mode="r"):
+        """
+        List of the chunks written to `path`, in order, memory-mapped by default so nothing is read
+        until it is used; with `mmap_mode=None` they are read into memory. The chain is
+        `np.concatenate(chunks)` when it fits in memory.
+        """
+        files = sorted(glob.glob(os.path.join(path, "chunk_*.npy")))
+        if not files:
+            raise FileNotFoundError(f"No chunk_*.npy files in {path}.")
+        return [np.load(file, mmap_mode=mmap_mode) for file in files]
+
+
+class MomentsSink(SampleSink):
+    """Only keeps the running mean and variance of the stored states (merged chunk by chunk)."""
+    def __init__(self, thin=1, chunk_size=10000):
+        super().__init__(thin, chunk_size)
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+
+    def write_chunk(self, chunk):
+        chunk = chunk.astype(np.float64)
+        n_chunk = chunk.shape[0]
+        mean_chunk = chunk.mean(axis=0)
+        m2_chunk = ((chunk - mean_chunk) ** 2).sum(axis=0)
+
+        n = self.n + n_chunk
+        delta = mean_chunk - self.mean
+        self.mean = self.mean + delta * n_chunk / n
+        self.m2 = self.m2 + m2_chunk + delta ** 2 * self.n * n_chunk / n
+        self.n = n
+
+    def result(self):
+        self.flush()
+        var = self.m2 / (self.n - 1) if self.n > 1 else np.full_like(self.mean, np.nan)
+        return {"n": self.n, "mean": self.mean, "var": var}
+
+
+
+# Fine-level likelihood owned by a FineSolverPool worker process
+_fine_likelihood = None
+
+def _init_fine_worker(likelihood_factory, factory_args):
+    """Build the long-lived fine likelihood of a worker, one solver per process."""
+    global _fine_likelihood
+    torch.set_num_threads(1)
+    _fine_likelihood = likelihood_factory(*factory_args)
+
+def _eval_fine_worker(theta):
+    return float(_fine_likelihood(theta))
+
+
+class FineSolverPool:
+    """
+    Process pool serving fine-level log-likelihoods to Delayed Acceptance chains.
+    Each worker calls `likelihood_factory(*factory_args)` once at start-up, so meshes,
+    FFT plans and the like are built once per worker and every submitted theta only pays
+    for the solve. `likelihood_factory` and `factory_args` must be picklable, and the
+    resulting callable maps a numpy theta to a float log-likelihood.
+    """
+    def __init__(self, likelihood_factory, factory_args=(), nworkers=None, mp_context="spawn"):
+        self.nworkers = os.cpu_count() if nworkers is None else nworkers
+        self.executor = ProcessPoolExecutor(max_workers=self.nworkers, mp_context=mp.get_context(mp_context),
+                                            initializer=_init_fine_worker, initargs=(likelihood_factory, factory_args))
+
+    def submit(self, theta):
+        """Queue one fine evaluation, returns a Future holding the log-likelihood."""
+        theta = torch.as_tensor(theta).detach().cpu().numpy().astype(np.float64)
+        return self.executor.submit(_eval_fine_worker, theta)
+
+    def map(self, thetas):
+        """Evaluate a batch of thetas in parallel, blocking until all are done."""
+        futures = [self.submit(theta) for theta in thetas]
+        return np.array([future.result() for future in futures])
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 
 class MetropolisHastings(torch.nn.Module):
     """Implements Metropolis Hastings with multiple chains and configurable prior, likelihood, and proposal."""
@@ -38,6 +205,16 @@ class MetropolisHastings(torch.nn.Module):
         """Define the likelihood function. Must be overridden."""
         raise NotImplementedError("log_likelihood must be implemented in a subclass.")
 
+    def log_prior_batched(self, theta):
+        """Log prior for a batch of chains, theta of shape (nchains, nparameters).
+        Falls back to the single chain log_prior, override for a vectorized version."""
+        return torch.stack([torch.as_tensor(self.log_prior(th), dtype=torch.float64, device=self.device) for th in theta])
+
+    def log_likelihood_batched(self, theta):
+        """Log likelihood for a batch of chains, theta of shape (nchains, nparameters).
+        Falls back to the single chain log_likelihood, override for a vectorized version."""
+        return torch.stack([torch.as_tensor(self.log_likelihood(th), dtype=torch.float64, device=self.device) for th in theta])
+
     def proposal(self, theta, dt):
         """Proposal with independent step sizes for each chain."""
         if self.proposal_type == "random_walk":
@@ -48,15 +225,28 @@ class MetropolisHastings(torch.nn.Module):
             gradient = torch.autograd.grad(self.log_likelihood(theta), theta, retain_graph=True)[0]
             return theta + 0.5 * dt * gradient + dt * torch.randn_like(theta)
 
+    def proposal_batched(self, theta, dt):
+        """Proposal for a batch of chains, dt of shape (nchains, 1) holds the step size of each chain."""
+        if self.proposal_type == "random_walk":
+            return theta + dt * torch.randn_like(theta)
+        elif self.proposal_type == "langevin":
+            theta = theta.detach().requires_grad_()
+            gradient = torch.autograd.grad(self.log_likelihood_batched(theta).sum(), theta)[0]
+            return (theta + 0.5 * dt * gradient + dt * torch.randn_like(theta)).detach()
+
 
-    def run_chain(self, verbose=True):
-        """Run Metropolis-Hastings """
+    def run_chain(self, verbose=True, sink=None):
+        """Run Metropolis-Hastings. The states after burn-in are passed to `sink` (a `SampleSink`),
+        by default a `MemorySink`, and `sink.result()` is returned with the acceptance rate."""
         theta = torch.empty((self.nparameters), device=self.device).uniform_(-1, 1)
-        samples = torch.zeros((self.nsamples + self.burnin, self.nparameters), device=self.device)
+        sink = MemorySink() if sink is None else sink
         accepted_proposals = 0
 
         # Initialize separate dt for each chai
         dt =  self.dt
+
+        # The log-posterior of the current state is part of the chain state
+        log_posterior = self.log_prior(theta) + self.log_likelihood(theta)
         
         if verbose:
             pbar = tqdm(range(self.nsamples + self.burnin), desc="Running MCMC", unit="step")
@@ -66,7 +256,6 @@ class MetropolisHastings(torch.nn.Module):
         for i in pbar:
             theta_proposal = self.proposal(theta, dt)  # Pass dt to proposal
 
-            log_posterior = self.log_prior(theta) + self.log_likelihood(theta)
             log_posterior_proposal = self.log_prior(theta_proposal) + self.log_likelihood(theta_proposal)
 
             # Compute acceptance probabilities (vectorized)
@@ -74,10 +263,12 @@ class MetropolisHastings(torch.nn.Module):
 
             if torch.rand(1, device=self.device) < a:
                 theta = theta_proposal
+                log_posterior = log_posterior_proposal
                 accepted_proposals += 1
 
             # Only store samples after burn-in
-            samples[i, :] = theta
+            if i >= self.burnin:
+                sink.append(theta)
 
             # Adaptive step size adjustment (each chain updates its own dt)
             dt += dt * (a.item() - 0.234) / (i + 1)
@@ -85,7 +276,7 @@ class MetropolisHastings(torch.nn.Module):
             if verbose and (i % (self.nsamples // 10) == 0)and (i!=0):
                 pbar.set_postfix(acceptance_rate=f"{accepted_proposals / (i+1):.4f}", proposal_variance=f"{dt:.4f}")
 
-        return samples[self.burnin:,:].detach().cpu().numpy(),accepted_proposals/self.nsamples
+        return sink.result(),accepted_proposals/self.nsamples
 
 
     def _run_chain(self, seed, result_queue):
@@ -114,6 +305,56 @@ class MetropolisHastings(torch.nn.Module):
 
         return results
 
+    def run_chains_batched(self, nchains=64, verbose=True, sink=None):
+        """Run nchains Metropolis-Hastings chains in lockstep within a single process.
+
+        The chains are kept as one (nchains, nparameters) tensor, so each step evaluates
+        the prior and likelihood of all proposals with a single call to the batched methods
+        and accepts/rejects them with one tensor operation. Each chain adapts its own step size.
+
+        Returns:
+            samples: `sink.result()`, by default an array of shape (nsamples, nchains, nparameters).
+            acceptance_rate: Array of shape (nchains,) with the acceptance rate of each chain.
+        """
+        theta = torch.empty((nchains, self.nparameters), device=self.device).uniform_(-1, 1)
+        sink = MemorySink() if sink is None else sink
+        accepted_proposals = torch.zeros(nchains, device=self.device)
+
+        # Separate dt for each chain
+        dt = torch.full((nchains, 1), self.dt, device=self.device)
+
+        # The log-posterior of the current states is carried over between steps
+        log_posterior = self.log_prior_batched(theta) + self.log_likelihood_batched(theta)
+
+        if verbose:
+            pbar = tqdm(range(self.nsamples + self.burnin), desc="Running MCMC", unit="step")
+        else:
+            pbar = range(self.nsamples + self.burnin)
+
+        for i in pbar:
+            theta_proposal = self.proposal_batched(theta, dt)
+            log_posterior_proposal = self.log_prior_batched(theta_proposal) + self.log_likelihood_batched(theta_proposal)
+
+            # Acceptance probabilities for all chains at once
+            a = torch.exp(log_posterior_proposal - log_posterior).clamp(max=1.0)
+            accept = torch.rand(nchains, device=self.device) < a
+
+            theta = torch.where(accept.unsqueeze(-1), theta_proposal, theta)
+            log_posterior = torch.where(accept, log_posterior_proposal, log_posterior)
+            accepted_proposals += accept
+
+            if i >= self.burnin:
+                sink.append(theta)
+
+            # Adaptive step size adjustment (each chain updates its own dt)
+            dt += dt * (a.unsqueeze(-1) - 0.234) / (i + 1)
+
+            if verbose and (i % (self.nsamples // 10) == 0) and (i != 0):
+                pbar.set_postfix(acceptance_rate=f"{(accepted_proposals / (i+1)).mean().item():.4f}",
+                                 proposal_variance=f"{dt.mean().item():.4f}")
+
+        return sink.result(), (accepted_proposals / self.nsamples).cpu().numpy()
+
 
 
 class MCMCDA(torch.nn.Module):
@@ -151,6 +392,16 @@ class MCMCDA(torch.nn.Module):
         """Define the likelihood function for the finner model. Must be overridden."""
         raise NotImplementedError("log_likelihood must be implemented in a subclass.")
 
+    def log_prior_batched(self, theta):
+        """Log prior for a batch of parameters, theta of shape (nproposals, nparameters).
+        Falls back to the single log_prior, override for a vectorized version."""
+        return torch.stack([torch.as_tensor(self.log_prior(th), dtype=torch.float64, device=self.device) for th in theta])
+
+    def log_likelihood_outer_batched(self, theta):
+        """Coarse log likelihood for a batch of parameters, theta of shape (nproposals, nparameters).
+        Falls back to the single log_likelihood_outer, override for a vectorized version."""
+        return torch.stack([torch.as_tensor(self.log_likelihood_outer(th), dtype=torch.float64, device=self.device) for th in theta])
+
     def proposal(self, theta, dt):
         """Proposal with independent step sizes for each chain."""
         if self.proposal_type == "random_walk":
@@ -161,16 +412,55 @@ class MCMCDA(torch.nn.Module):
             gradient = torch.autograd.grad(self.log_likelihood(theta), theta, retain_graph=True)[0]
             return theta + 0.5 * dt * gradient + dt * torch.randn_like(theta)
 
+    def prefetch_proposals(self, theta, dt, log_posterior_outer, nproposals, fine_pool=None):
+        """
+        Draw `nproposals` random walk proposals from the current theta and screen them through the
+        coarse model with one batched evaluation. While the chain stays at theta the proposals are
+        i.i.d., so consuming them in order (and dropping the rest once theta moves) leaves the
+        Delayed Acceptance chain unchanged in distribution. With a `fine_pool` the fine solves of
+        all coarse-accepted proposals are submitted at once and run in parallel.
+
+        Returns a deque of (theta_proposal, log_posterior_proposal_outer, a, coarse_accept, fine_future).
+        """
+        if self.proposal_type != "random_walk":
+            raise ValueError(f"Prefetching only supports random walk proposals, not {self.proposal_type}.")
+
+        theta_proposal = theta + dt * torch.randn((nproposals, self.nparameters), device=self.device)
+        log_posterior_proposal_outer = self.log_prior_batched(theta_proposal) + self.log_likelihood_outer_batched(theta_proposal)
+
+        a = torch.clamp(torch.exp(log_posterior_proposal_outer - log_posterior_outer), max=1.0)
+        coarse_accept = torch.rand(nproposals, device=self.device) < a
+
+        coarse_accept = coarse_accept.tolist()
+        if fine_pool is not None:
+            fine_futures = [fine_pool.submit(th) if accept else None for th, accept in zip(theta_proposal, coarse_accept)]
+        else:
+            fine_futures = [None] * nproposals
+
+        return deque(zip(theta_proposal, log_posterior_proposal_outer, a, coarse_accept, fine_futures))
+
+    def run_chain(self, samples = False, verbose=True, outer_sink=None, inner_sink=None, prefetch=1, fine_pool=None):
+        """Run Metropolis-Hastings followed by Delayed Acceptance. With `samples=True` the states of
+        both phases are passed to `outer_sink` and `inner_sink` (`MemorySink` by default).
+        With `prefetch > 1` (random walk only, other proposals raise) the coarse stage of Delayed Acceptance screens
+        `prefetch` proposals per batched coarse evaluation, see `prefetch_proposals`, and a
+        `FineSolverPool` passed as `fine_pool` solves the coarse-accepted ones in parallel. A
+        `fine_pool` needs `prefetch > 1`, a single proposal has nothing to solve in parallel."""
+        if prefetch > 1 and self.proposal_type != "random_walk":
+            raise ValueError(f"Prefetching only supports random walk proposals, not {self.proposal_type}.")
+        if fine_pool is not None and prefetch <= 1:
+            raise ValueError(f"A fine_pool needs prefetch > 1, got prefetch={prefetch}.")
 
-    def run_chain(self, samples = False, verbose=True):
-        """Run Metropolis-Hastings """
         theta = torch.empty((self.nparameters), device=self.device).uniform_(-1, 1)
         acceptance_list = torch.zeros((self.iter_da), device=self.device)
-        samples_outer = torch.zeros((self.iter_mcmc, self.nparameters), device=self.device)
-        samples_inner = []
+        outer_sink = MemorySink() if outer_sink is None else outer_sink
+        inner_sink = MemorySink() if inner_sink is None else inner_sink
         # Initialize separate dt for each chai
         dt =  self.dt
 
+        # Coarse log-posterior of the current state, carried as chain state
+        log_posterior_outer = self.log_prior(theta) + self.log_likelihood_outer(theta)
+
         outer_mh = 0
         if verbose:
             pbar = tqdm(range(self.iter_mcmc), desc="Running MCMC", unit="step")
@@ -181,8 +471,7 @@ class MCMCDA(torch.nn.Module):
             # Propose new theta values
             theta_proposal = self.proposal(theta,dt)
             
-            # Compute the current log-posterior
-            log_posterior_outer = self.log_prior(theta) + self.log_likelihood_outer(theta)
+            # Compute the proposal log-posterior
             log_posterior_proposal_outer = self.log_prior(theta_proposal) + self.log_likelihood_outer(theta_proposal)
 
             # Compute the acceptance ratio
@@ -190,10 +479,11 @@ class MCMCDA(torch.nn.Module):
 
             if torch.rand(1, device=self.device) < a:
                 theta = theta_proposal.clone()
+                log_posterior_outer = log_posterior_proposal_outer
                 outer_mh += 1
 
             if samples:
-                samples_outer[i,:] = theta
+                outer_sink.append(theta)
 
             # Adaptive step size adjustment 
             dt += dt * (a.item() - 0.234) / (i + 1)
@@ -207,23 +497,39 @@ class MCMCDA(torch.nn.Module):
         if verbose:
             pbar = tqdm(range(self.iter_da), desc="Running Delayed Acceptance", unit="step")
     
+        # Fine log-posterior of the current state, the coarse one is carried over from above
+        log_posterior_inner = self.log_prior(theta) + self.log_likelihood_inner(theta)
+
+        # Coarse-screened proposals, all drawn from the current theta
+        queue = deque()
+
         inner_accepted,inner_mh = 0,0
         while inner_mh < self.iter_da:
-            # Propose new theta values
-            theta_proposal = self.proposal(theta,dt)
-            
-            # Compute the current log-posterior
-            log_posterior_outer = self.log_prior(theta) + self.log_likelihood_outer(theta)
-            log_posterior_proposal_outer = self.log_prior(theta_proposal) + self.log_likelihood_outer(theta_proposal)
+            if prefetch > 1:
+                if not queue:
+                    queue = self.prefetch_proposals(theta, dt, log_posterior_outer, prefetch, fine_pool)
+                theta_proposal, log_posterior_proposal_outer, a, coarse_accept, fine_future = queue.popleft()
+            else:
+                fine_future = None
+
+                # Propose new theta values
+                theta_proposal = self.proposal(theta,dt)
+                
+                # Compute the proposal log-posterior
+                log_posterior_proposal_outer = self.log_prior(theta_proposal) + self.log_likelihood_outer(theta_proposal)
 
-            # Compute the acceptance ratio
-            a = torch.clamp(torch.exp(log_posterior_proposal_outer - log_posterior_outer), max=1.0)
+                # Compute the acceptance ratio
+                a = torch.clamp(torch.exp(log_posterior_proposal_outer - log_posterior_outer), max=1.0)
+                coarse_accept = torch.rand(1, device=self.device) < a
 
             # Accept or reject the proposal
-            if torch.rand(1, device=self.device) < a:
+            if coarse_accept:
                 inner_mh += 1
-                log_posterior_inner = self.log_prior(theta) + self.log_likelihood_inner(theta)
-                log_posterior_proposal_inner = self.log_prior(theta_proposal) + self.log_likelihood_inner(theta_proposal)
+                if fine_future is not None:
+                    log_likelihood_proposal_inner = torch.tensor(fine_future.result(), dtype=torch.float64, device=self.device)
+                else:
+                    log_likelihood_proposal_inner = self.log_likelihood_inner(theta_proposal)
+                log_posterior_proposal_inner = self.log_prior(theta_proposal) + log_likelihood_proposal_inner
 
                 # Compute the acceptance ratio
                 a = torch.clamp(torch.exp(log_posterior_proposal_inner - (log_posterior_inner))*(1/a), max=1.0)
@@ -233,12 +539,19 @@ class MCMCDA(torch.nn.Module):
 
                 if torch.rand(1, device=self.device) < a:
                     theta = theta_proposal.clone()
+                    log_posterior_outer = log_posterior_proposal_outer
+                    log_posterior_inner = log_posterior_proposal_inner
                     inner_accepted += 1
                     acceptance_list[inner_mh-1] +=1
+                    # The prefetched proposals were drawn from the previous state
+                    for *_, future in queue:
+                        if future is not None:
+                            future.cancel()
+                    queue.clear()
 
             if samples:
                 # Store the current sample and step size
-                samples_inner.append(theta)
+                inner_sink.append(theta)
 
                 # Update progress bar and print progress every 10% (or any interval)
             if verbose and (inner_mh % (self.iter_da // 10) == 0) and (inner_mh != 0):
@@ -252,7 +565,7 @@ class MCMCDA(torch.nn.Module):
         if verbose:
             print(f"Times inner step {inner_mh:.4f}, Acceptance Rate: {inner_accepted / inner_mh:.4f}")
         if samples:
-            return torch.tensor(samples_inner),samples_outer
+            return inner_sink.result(),outer_sink.result()
         else:
             return acceptance_list
     
@@ -412,7 +725,7 @@ class MCMCDA(torch.nn.Module):
 #             # Adaptive step size adjustment 
 #             self.dt += self.dt * (a - 0.234) / (i + 1)
 
-#             del log_posterior_current, log_posterior_proposal, alpha_proposal
+#             del log_posterior_proposal, alpha_proposal
 #             if self.device != "cpu":
 #                 torch.cuda.empty_cache()
 
@@ -618,12 +931,16 @@ class DAHM:
         acceptance_rate = 0
         inner_mh = 0
 
+        # Coarse and fine log-posteriors of the current state, carried as chain state.
+        # The fine one is only needed once the first proposal passes the coarse stage.
+        log_posterior_current = self.log_posterior(self.solver1,alpha)
+        log_posterior_current2 = None
+
         for i in range(n_chains):
             # Propose new alpha values
             alpha_proposal = self.proposals(alpha)
             
-            # Compute the current log-posterior
-            log_posterior_current = self.log_posterior(self.solver1,alpha)
+            # Compute the proposal log-posterior
             log_posterior_proposal = self.log_posterior(self.solver1,alpha_proposal)
 
             # Compute the acceptance ratio
@@ -632,7 +949,8 @@ class DAHM:
             # Accept or reject the proposal
             if torch.rand(1, device=self.device) < a:
                 inner_mh += 1
-                log_posterior_current2 = self.log_posterior(self.solver2,alpha)
+                if log_posterior_current2 is None:
+                    log_posterior_current2 = self.log_posterior(self.solver2,alpha)
                 log_posterior_proposal2 = self.log_posterior(self.solver2,alpha_proposal)
 
                 # Compute the acceptance ratio
@@ -640,6 +958,8 @@ class DAHM:
 
                 if torch.rand(1, device=self.device) < a:
                     alpha = alpha_proposal
+                    log_posterior_current = log_posterior_proposal
+                    log_posterior_current2 = log_posterior_proposal2
                     acceptance_rate += 1
 
             # Store the current sample and step size
@@ -649,7 +969,7 @@ class DAHM:
             # Adaptive step size adjustment 
             #self.dt += self.dt * (a - 0.234) / (i + 1)
 
-            del log_posterior_current, log_posterior_proposal, alpha_proposal
+            del log_posterior_proposal, alpha_proposal
             if self.device != "cpu":
                 torch.cuda.empty_cache()
 
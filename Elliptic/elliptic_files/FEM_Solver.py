@@ -1,90 +1,39 @@
-import ufl
-from mpi4py import MPI
-from petsc4py import PETSc
-from dolfinx import mesh, fem, plot
-from dolfinx.fem.petsc import LinearProblem
-from dolfinx import geometry
+# dolfinx is optional, the rest of elliptic_files (FEMSolver1D in particular) works without it
+try:
+    import ufl
+    from mpi4py import MPI
+    from petsc4py import PETSc
+    from dolfinx import mesh, fem, plot
+    from dolfinx.fem.petsc import LinearProblem
+    from dolfinx import geometry
+    HAS_DOLFINX = True
+except ImportError:
+    HAS_DOLFINX = False
 
 import numpy as np
-from scipy.optimize import fsolve, brentq
+from scipy.sparse import csr_matrix
 
-class RootFinder:
-    def __init__(self, lam , M, equation=None):
-        """
-        lam: parameter lambda (for your equation)
-        M: number of intervals to search for roots
-        equation: optional, if you want to provide a custom equation
-        """
-        self.lam = lam
-        self.M = M
-        self.c = 1 / lam
-        self.equation = equation if equation else self.default_equation
-
-    def default_equation(self, x):
-        """Default transcendental equation: tan(x) = (2c*x)/(x^2 - c^2)"""
-        c = self.c
-        return np.tan(x) - (2 * c * x) / (x**2 - c**2)
-
-    def find_roots(self):
-        """Find the roots using the Brent or fsolve method depending on the case."""
-        roots = []
-        for i in range(self.M):
-            wmin = (i - 0.499) * np.pi
-            wmax = (i + 0.499) * np.pi
-
-            # Handle the singularity around c
-            if wmin <= self.c <= wmax:  
-                if wmin > 0:
-                    root = fsolve(self.equation, (self.c + wmin) / 2)[0]
-                    roots.append(root)
-                root = fsolve(self.equation, (self.c + wmax) / 2)[0]
-                roots.append(root)
-            elif wmin > 0:  
-                root = brentq(self.equation, wmin, wmax)
-                roots.append(root)
-        
-        return np.array(roots)
-
-
-class Parametric_K:
-    def __init__(self, theta, lam , M):
-        self.theta = np.array(theta)
-        self.finder = RootFinder(lam, M)
-        self.roots = np.array(self.finder.find_roots())
-
-    @property
-    def A(self):
-        """Compute the A coefficients."""
-        return np.sqrt(1 / ((1/8)*(5 + (self.roots / 2)**2) + 
-                            (np.sin(2*self.roots) / (4*self.roots)) * ((self.roots / 4)**2 - 1) - (np.cos(2*self.roots)/8)))
-    @property
-    def an(self):
-        """Compute the an values."""
-        return np.sqrt(8 / (self.roots**2 + 16))
-    
-    def eval(self, x):
+from .kl_expansion import RootFinder, kl_roots, Parametric_K
+
+class FEMSolver:
+    def __init__(self, theta, lam = 1 /4, M = 2, vert=30, l_bc = 0, r_bc = 2, persistent=True):
         """
-        Evaluate the sum for a given x, summing over all terms defined by theta and roots.
-        x: 2D array of points (n, dim), where n is the number of points and dim is the dimension.
-        Returns an array of evaluations for each point.
+        theta: KL coefficients of the diffusion coefficient k
+        lam, M: correlation length and number of terms of the KL expansion
+        vert: number of cells of the unit interval mesh
+        l_bc, r_bc: Dirichlet values at x=0 and x=1
+        persistent: compile the forms and set up the PETSc matrix, vector and KSP once, and only
+                    update the DOF values of k and reassemble on every solve (see `setup_problem`)
         """
-        # Initialize the result array (same size as the number of points)
-        result = np.zeros(x.shape[1])
-        
-        # Compute the sum over all terms
-        for i in range(len(self.theta)):
-            result += self.theta[i] * self.an[i] * self.A[i] * (
-                np.sin(self.roots[i] * x[0]) + (self.roots[i] / 4) * np.cos(self.roots[i] * x[0])
-            )
-        return np.exp(result)
-     
+        if not HAS_DOLFINX:
+            raise ImportError("FEMSolver requires dolfinx, use FEMSolver1D for a dolfinx-free solver.")
 
-class FEMSolver:
-    def __init__(self, theta, lam = 1 /4, M = 2, vert=30, l_bc = 0, r_bc = 2 ):
         self.l_bc, self.r_bc = l_bc, r_bc
         self.theta = theta
         self.lam = lam
         self.M = M
+        self.vert = vert
+        self.persistent = persistent
 
         # Enable GPU-aware PETSc options
         # PETSc.Options().setValue('mat_type', 'aijcusparse')  # Use CUDA sparse matrix type
@@ -93,17 +42,32 @@ class FEMSolver:
         self.domain = mesh.create_unit_interval(MPI.COMM_WORLD, vert)
         self.V = fem.functionspace(self.domain, ("Lagrange", 1))
         self.bc_l, self.bc_r = self.set_boundary_conditions()
+        self.k_basis = self.kl_basis()
         self.k = self.interpolate_k()
         self.f = self.interpolate_f()
         self.uh = None
+        self.problem = self.setup_problem() if persistent else None
+        self.eval_operators = {}  # Point evaluation matrices, see point_evaluation_matrix
     
     
+    def kl_basis(self):
+        """
+        KL basis functions at the DOF coordinates, (n_dofs, n_terms). For P1 elements the
+        interpolant of k is its value at the DOFs, so k(theta) = exp(k_basis @ theta).
+        """
+        x = self.V.tabulate_dof_coordinates().T
+        return Parametric_K(np.zeros(0), self.lam, self.M).basis(x)
+
+    def update_k(self, k):
+        """Set the DOF values of `k` to the interpolant of k(theta), a single mat-vec."""
+        theta = np.asarray(self.theta, dtype=np.float64).reshape(-1)
+        k.x.array[:] = np.exp(self.k_basis[:, :len(theta)] @ theta)
+        return k
+
     def interpolate_k(self):
         """Interpolate the k function based on the provided equation."""
         k = fem.Function(self.V)
-        k_an = Parametric_K(self.theta,self.lam,self.M)
-        k.interpolate(k_an.eval)
-        return k
+        return self.update_k(k)
 
 
     def set_boundary_conditions(self):
@@ -116,6 +80,19 @@ class FEMSolver:
         
         return bc_l, bc_r
 
+    def setup_problem(self):
+        """
+        Linear problem with k as a mutable fem.Function, so the forms are compiled and the
+        matrix, right-hand side and KSP are created once. Every `LinearProblem.solve` then
+        reassembles them with the current DOF values of k and solves again.
+        """
+        u = ufl.TrialFunction(self.V)
+        v = ufl.TestFunction(self.V)
+
+        a = self.k * ufl.dot(ufl.grad(u), ufl.grad(v)) * ufl.dx
+        L = self.f * v * ufl.dx
+        return LinearProblem(a, L, bcs=[self.bc_l, self.bc_r])
+
     def interpolate_f(self):
         """Interpolate the f function."""
         f = fem.Function(self.V)
@@ -123,7 +100,15 @@ class FEMSolver:
         return f
 
     def solve(self):
-        """Define and solve the linear variational problem."""
+        """
+        Define and solve the linear variational problem. In persistent mode only the values of
+        k are updated, and the returned solution is the same fem.Function on every call.
+        """
+        if self.persistent:
+            self.update_k(self.k)  # The forms hold self.k, only its DOF values change
+            self.uh = self.problem.solve()
+            return self.uh
+
         # Interpolate k and f functions every time we solve
         self.k = self.interpolate_k()  # Ensure k is updated based on current theta
         self.f = self.interpolate_f()  # f can remain static, but can be updated if needed
@@ -145,12 +130,17 @@ class FEMSolver:
         cells, types, x = plot.vtk_mesh(self.V)
         return (x, self.uh.x.array)
     
-    def eval_at_points(self, points):
-        """Evaluate the solution at arbitrary points using interpolation."""
-        
-        if self.uh is None:
-            raise ValueError("Solve the problem first by calling solve().")
-        
+    def point_evaluation_matrix(self, points):
+        """
+        Sparse interpolation matrix P (n_points x n_dofs) with P @ uh.x.array the solution at
+        `points`, built once per set of points and cached, as the mesh never changes. The rows
+        hold the P1 hat functions of the cell containing each point; points that are not on
+        this process are left out, as in `uh.eval`.
+        """
+        key = (points.shape, points.tobytes())
+        if key in self.eval_operators:
+            return self.eval_operators[key]
+
         # Ensure points are in the shape (N, 3) for DOLFINx
         if points.shape[1] == 1:
             # If points are 1D, pad with zeros for 2nd and 3rd dimensions
@@ -158,19 +148,38 @@ class FEMSolver:
 
         bb_tree = geometry.bb_tree(self.domain, self.domain.topology.dim)
 
-        cells,points_on_proc = [],[]
-
         # Find cells whose bounding-box collide with the the points
         cell_candidates = geometry.compute_collisions_points(bb_tree, points)
         # Choose one of the cells that contains the point
         colliding_cells = geometry.compute_colliding_cells(self.domain, cell_candidates, points)
 
+        dof_coordinates = self.V.tabulate_dof_coordinates()[:, 0]
+        rows, cols, weights = [], [], []
+
         for i, point in enumerate(points):
             if len(colliding_cells.links(i)) > 0:
-                points_on_proc.append(point)
-                cells.append(colliding_cells.links(i)[0])
+                dofs = self.V.dofmap.cell_dofs(colliding_cells.links(i)[0])
+                x0, x1 = dof_coordinates[dofs]
+                # Linear interpolation between the two vertex dofs of the interval
+                t = (point[0] - x0) / (x1 - x0)
+                row = len(rows) // 2
+                rows += [row, row]
+                cols += [dofs[0], dofs[1]]
+                weights += [1 - t, t]
+
+        n_dofs = self.V.dofmap.index_map.size_local + self.V.dofmap.index_map.num_ghosts
+        P = csr_matrix((weights, (rows, cols)), shape=(len(rows) // 2, n_dofs))
+        self.eval_operators[key] = P
+        return P
+
+    def eval_at_points(self, points):
+        """Evaluate the solution at arbitrary points, a sparse mat-vec with the cached
+        `point_evaluation_matrix`."""
+        
+        if self.uh is None:
+            raise ValueError("Solve the problem first by calling solve().")
 
-        points_on_proc = np.array(points_on_proc, dtype=np.float64)
-        u_values = self.uh.eval(points_on_proc, cells)
+        P = self.point_evaluation_matrix(points)
+        u_values = (P @ self.uh.x.array).reshape(-1, 1)
         
-        return u_values
\ No newline at end of file
+        return u_values
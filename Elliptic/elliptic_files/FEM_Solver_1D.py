@@ -0,0 +1,154 @@
+import numpy as np
+from scipy.linalg import solve_banded
+from scipy.sparse import csr_matrix
+
+from .kl_expansion import Parametric_K
+
+
+def thomas_solve(off, diag, rhs):
+    """
+    Solve symmetric tridiagonal systems with the Thomas algorithm, vectorized over the leading
+    (batch) axes.
+
+    off: (..., n-1) off-diagonal, diag: (..., n) diagonal, rhs: (..., n) right-hand side.
+    Returns the (..., n) solutions.
+    """
+    n = diag.shape[-1]
+    c = np.empty(off.shape, dtype=np.result_type(off, diag))
+    d = np.empty(rhs.shape, dtype=np.result_type(rhs, diag))
+
+    # Forward elimination
+    d[..., 0] = rhs[..., 0] / diag[..., 0]
+    if n > 1:
+        c[..., 0] = off[..., 0] / diag[..., 0]
+    for i in range(1, n):
+        denominator = diag[..., i] - off[..., i - 1] * c[..., i - 1]
+        if i < n - 1:
+            c[..., i] = off[..., i] / denominator
+        d[..., i] = (rhs[..., i] - off[..., i - 1] * d[..., i - 1]) / denominator
+
+    # Back substitution
+    for i in range(n - 2, -1, -1):
+        d[..., i] -= c[..., i] * d[..., i + 1]
+    return d
+
+
+class FEMSolver1D:
+    def __init__(self, theta, lam = 1 /4, M = 2, vert=30, l_bc = 0, r_bc = 2):
+        """
+        NumPy/SciPy version of FEMSolver for the 1D problem -(k u')' = 4x on the unit interval
+        with P1 elements, without dolfinx. The P1 stiffness matrix is tridiagonal, it is
+        assembled directly from the KL expansion of k at the mesh nodes and solved with a banded
+        solver, or the Thomas algorithm for a batch of thetas (`solve_batched`).
+
+        theta: KL coefficients of the diffusion coefficient k
+        lam, M: correlation length and number of terms of the KL expansion
+        vert: number of cells of the unit interval mesh
+        l_bc, r_bc: Dirichlet values at x=0 and x=1
+        """
+        self.l_bc, self.r_bc = l_bc, r_bc
+        self.theta = theta
+        self.lam = lam
+        self.M = M
+        self.vert = vert
+
+        self.x = np.linspace(0, 1, vert + 1)
+        self.h = 1 / vert
+        self.k_basis = Parametric_K(np.zeros(0), lam, M).basis(self.x[None, :])
+
+        # Load vector of the P1 interpolant of f = 4x at the interior nodes, h/6 (f_{i-1} + 4 f_i + f_{i+1})
+        f = 4 * self.x
+        self.load = self.h / 6 * (f[:-2] + 4 * f[1:-1] + f[2:])
+
+        self.uh = None
+        self.eval_operators = {}  # Point evaluation matrices, see point_evaluation_matrix
+
+    def assemble(self, theta):
+        """
+        Tridiagonal system of the interior nodes for a batch of thetas (B, nterms), with the
+        Dirichlet values lifted to the right-hand side.
+
+        Returns:
+        tuple: off-diagonal (B, vert-2), diagonal (B, vert-1) and right-hand side (B, vert-1).
+        """
+        k = np.exp(theta @ self.k_basis[:, :theta.shape[1]].T)  # k at the nodes, (B, vert+1)
+
+        # Element stiffness of a P1 k, the mean of k over the cell over h
+        stiffness = 0.5 * (k[:, :-1] + k[:, 1:]) / self.h
+
+        diag = stiffness[:, :-1] + stiffness[:, 1:]
+        off = -stiffness[:, 1:-1]
+
+        rhs = np.repeat(self.load[None, :], theta.shape[0], axis=0)
+        rhs[:, 0] += stiffness[:, 0] * self.l_bc
+        rhs[:, -1] += stiffness[:, -1] * self.r_bc
+        return off, diag, rhs
+
+    def with_boundary_values(self, u_interior):
+        """Nodal values (B, vert+1) from the interior solution (B, vert-1)."""
+        u = np.empty((u_interior.shape[0], self.vert + 1))
+        u[:, 0], u[:, -1] = self.l_bc, self.r_bc
+        u[:, 1:-1] = u_interior
+        return u
+
+    def solve(self):
+        """Solve for the current theta, returns the nodal values of the solution."""
+        theta = np.asarray(self.theta, dtype=np.float64).reshape(1, -1)
+        off, diag, rhs = self.assemble(theta)
+
+        # Banded storage (upper, diagonal, lower) of the symmetric tridiagonal matrix
+        ab = np.zeros((3, self.vert - 1))
+        ab[0, 1:] = off[0]
+        ab[1] = diag[0]
+        ab[2, :-1] = off[0]
+
+        u_interior = solve_banded((1, 1), ab, rhs[0], check_finite=False)
+        self.uh = self.with_boundary_values(u_interior[None, :])[0]
+        return self.uh
+
+    def solve_batched(self, thetas):
+        """
+        Solve for a batch of parameters at once, thetas of shape (B, nterms).
+        Returns the nodal values of the solutions, (B, vert+1).
+        """
+        thetas = np.asarray(thetas, dtype=np.float64).reshape(len(thetas), -1)
+        off, diag, rhs = self.assemble(thetas)
+        return self.with_boundary_values(thomas_solve(off, diag, rhs))
+
+    def solution_array(self):
+        """Mesh coordinates (padded to 3D, as dolfinx.plot.vtk_mesh) and nodal values of the solution."""
+        x = np.hstack((self.x.reshape(-1, 1), np.zeros((self.vert + 1, 2))))
+        return (x, self.uh)
+
+    def point_evaluation_matrix(self, points):
+        """
+        Sparse interpolation matrix P (n_points x vert+1) of the P1 hat functions at `points`,
+        built once per set of points and cached. Points outside the unit interval are left out.
+        """
+        key = (points.shape, points.tobytes())
+        if key in self.eval_operators:
+            return self.eval_operators[key]
+
+        p = np.asarray(points, dtype=np.float64)[:, 0]
+        p = p[(p >= 0) & (p <= 1)]
+        cells = np.clip(np.searchsorted(self.x, p, side="right") - 1, 0, self.vert - 1)
+        t = (p - self.x[cells]) / self.h
+
+        rows = np.repeat(np.arange(len(p)), 2)
+        cols = np.stack((cells, cells + 1), axis=1).reshape(-1)
+        weights = np.stack((1 - t, t), axis=1).reshape(-1)
+
+        P = csr_matrix((weights, (rows, cols)), shape=(len(p), self.vert + 1))
+        self.eval_operators[key] = P
+        return P
+
+    def eval_at_points(self, points):
+        """Evaluate the solution at arbitrary points, shape (n_points, 1)."""
+        if self.uh is None:
+            raise ValueError("Solve the problem first by calling solve().")
+
+        return (self.point_evaluation_matrix(points) @ self.uh).reshape(-1, 1)
+
+    def eval_at_points_batched(self, points, solutions):
+        """Evaluate a batch of nodal solutions (B, vert+1) at arbitrary points, shape (B, n_points)."""
+        return (self.point_evaluation_matrix(points) @ solutions.T).T
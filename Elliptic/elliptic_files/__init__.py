@@ -1,5 +1,7 @@
 from .elliptic_mcmc import *
 from .elliptic import *
 from .FEM_Solver import *
+from .FEM_Solver_1D import *
+from .kl_expansion import *
 from .train_elliptic import *
 from .utilities import *
\ No newline at end of file
@@ -1,7 +1,7 @@
 
 import torch
 from Base.dg import deepGalerkin
-from .FEM_Solver import RootFinder
+from .kl_expansion import RootFinder
 
 def k_function(data_domain,w):
     x = data_domain[:,0].reshape(-1,1)
@@ -15,14 +15,45 @@ def k_function(data_domain,w):
 
     return torch.sum(an*bn*theta,dim=1)
 
+def kl_coefficients(w):
+    """Coefficients an*A of the KL basis functions, one per root w."""
+    A = torch.sqrt(1 / ( (1/8)*(5 + (w / 2)**2) +  (torch.sin(2*w) / (4*w))*((w / 4)**2 - 1) - (torch.cos(2*w)/8)))
+    an = torch.sqrt(8 / (w**2 + 16))
+    return an*A
+
+def k_function_dx(data_domain, w, coefficients):
+    """
+    k and its x-derivative, analytically from the KL basis with the precomputed
+    `coefficients` (see kl_coefficients), without autograd through k.
+    """
+    x = data_domain[:,0].reshape(-1,1)
+    theta = data_domain[:,1:].reshape(x.shape[0],-1)
+
+    sin_wx, cos_wx = torch.sin(w*x), torch.cos(w*x)
+    weights = coefficients*theta
+
+    k = torch.sum(weights*(sin_wx + (w/4)*cos_wx), dim=1)
+    k_x = torch.sum(weights*w*(cos_wx - (w/4)*sin_wx), dim=1)
+    return k, k_x
+
 
 class Elliptic(deepGalerkin):
-    def __init__(self, config,device, lam = 1/4, M = 2):
+    # Model output and differentiated input (the KL parameters follow x), see deepGalerkin.partials
+    output_names = ("u",)
+    input_names = ("x",)
+
+    def __init__(self, config,device, lam = 1/4, M = 2, analytic_k = True):
+        """
+        analytic_k: compute the residual as exp(k)(k_x u_x + u_xx) with k and k_x from the KL
+                    basis in closed form, instead of differentiating exp(k) u_x with autograd
+        """
         super().__init__(config,device)
         self.root_finder = RootFinder(lam, M)
         self.roots = torch.tensor(self.root_finder.find_roots())
+        self.kl_coefficients = kl_coefficients(self.roots)
+        self.analytic_k = analytic_k
     
-    @deepGalerkin.laplace_approx()
+    @deepGalerkin.laplace_approx(output=0)
     def u(self,x):
         pred = self.model(x)
         return pred.reshape(-1,1)
@@ -30,6 +61,10 @@ class Elliptic(deepGalerkin):
     @deepGalerkin.laplace_approx()
     def elliptic_pde(self, x_interior):
         """ The pytorch autograd version of calculating residual """
+        # Models pickled before analytic_k existed keep the autograd residual
+        if getattr(self, "analytic_k", False):
+            return self.elliptic_pde_analytic(x_interior)
+
         data_domain = x_interior.requires_grad_(True)
 
         u = self.model(data_domain)
@@ -43,6 +78,23 @@ class Elliptic(deepGalerkin):
             
         return ddu_x[:,0].reshape(-1,1) + 4*data_domain[:,0].reshape(-1,1)
 
+    def elliptic_pde_analytic(self, x_interior):
+        """
+        Residual (exp(k) u_x)_x + 4x = exp(k)(k_x u_x + u_xx) + 4x, with k and k_x in closed
+        form. Only u is differentiated, once for u_x and once for u_xx.
+        """
+        data_domain = x_interior.requires_grad_(True)
+
+        d = self.partials(data_domain, ("u_x", "u_xx"))
+        du_x, ddu_x = d["u_x"], d["u_xx"]
+
+        # k depends on the inputs only, its derivative is already in k_x
+        roots, coefficients = self.roots.to(data_domain.device), self.kl_coefficients.to(data_domain.device)
+        k, k_x = k_function_dx(data_domain.detach(), roots, coefficients)
+        k, k_x = k.to(du_x.dtype).reshape(-1,1), k_x.to(du_x.dtype).reshape(-1,1)
+
+        return torch.exp(k)*(k_x*du_x + ddu_x) + 4*data_domain[:,0].reshape(-1,1)
+
 
     def pde_loss(self,data_interior,loss_fn):
         elliptic_pred = self.elliptic_pde(data_interior)
@@ -1,10 +1,12 @@
 
 import torch
+import numpy as np
 
-from Base.mcmc import MetropolisHastings,MCMCDA
+from Base.mcmc import MetropolisHastings,MCMCDA,FineSolverPool
 from Base.lla import dgala
 
 from elliptic_files.FEM_Solver import FEMSolver
+from elliptic_files.FEM_Solver_1D import FEMSolver1D
 from elliptic_files.elliptic import Elliptic
 
 
@@ -20,15 +22,24 @@ class EllipticMCMC(MetropolisHastings):
 
         # Dictionary to map surrogate classes to their likelihood functions
         likelihood_methods = {FEMSolver: self.fem_log_likelihood,
+                                   FEMSolver1D: self.fem_log_likelihood,
                                    Elliptic: self.nn_log_likelihood,
                                    dgala: self.dgala_log_likelihood}
 
-        # Precompute the likelihood function at initialization
-        surrogate_type = type(surrogate)
-        if surrogate_type in likelihood_methods:
-            self.log_likelihood_func = likelihood_methods[surrogate_type]
+        # Vectorized likelihoods for batched chains, FEM falls back to a loop over chains
+        batched_likelihood_methods = {FEMSolver1D: self.fem1d_log_likelihood_batched,
+                                      Elliptic: self.nn_log_likelihood_batched,
+                                      dgala: self.dgala_log_likelihood_batched}
+
+        # Precompute the likelihood function at initialization, subclasses (the structured dgala
+        # curvatures) use the likelihood of their base class
+        for surrogate_type, likelihood_func in likelihood_methods.items():
+            if isinstance(surrogate, surrogate_type):
+                self.log_likelihood_func = likelihood_func
+                self.log_likelihood_batched_func = batched_likelihood_methods.get(surrogate_type, super().log_likelihood_batched)
+                break
         else:
-            raise ValueError(f"Surrogate of type {surrogate_type.__name__} is not supported.")
+            raise ValueError(f"Surrogate of type {type(surrogate).__name__} is not supported.")
 
     def log_prior(self, theta):
         if not ((theta >= -1) & (theta <= 1)).all():
@@ -36,6 +47,10 @@ class EllipticMCMC(MetropolisHastings):
         else:
             return 0
 
+    def log_prior_batched(self, theta):
+        inside = ((theta >= -1) & (theta <= 1)).all(dim=-1)
+        return torch.where(inside, 0., -torch.inf).to(self.observations_values.dtype)
+
     def fem_log_likelihood(self, theta ):
         """
         Evaluates the log-likelihood given a FEM.
@@ -59,10 +74,10 @@ class EllipticMCMC(MetropolisHastings):
         Evaluates the log-likelihood given a dgala.
         """
         data = torch.cat([self.observation_locations, theta.repeat(self.observation_locations.size(0), 1)], dim=1).float()
-        surg_mu, surg_sigma = self.surrogate(data)
+        surg_mu, surg_sigma = self.surrogate(data, diagonal=True)
 
         surg_mu = surg_mu.view(-1, 1)
-        surg_sigma = surg_sigma[:, :, 0].view(-1, 1)
+        surg_sigma = surg_sigma.view(-1, 1)
 
         sigma = self.observation_noise ** 2 + surg_sigma
         dy = surg_mu.shape[0]
@@ -71,9 +86,52 @@ class EllipticMCMC(MetropolisHastings):
 
         return -0.5 * torch.sum(((self.observations_values - surg_mu.reshape(-1, 1)) ** 2) / sigma)- cte
     
+    def batched_data(self, theta):
+        """Stack the observation locations for every chain, shape (nchains * n_obs, 1 + nparameters)."""
+        nobs = self.observation_locations.size(0)
+        return torch.cat([self.observation_locations.repeat(theta.size(0), 1),
+                          theta.repeat_interleave(nobs, dim=0)], dim=1).float()
+
+    def fem1d_log_likelihood_batched(self, theta):
+        """
+        Evaluates the log-likelihood of a batch of chains given a FEMSolver1D, with one batched
+        tridiagonal solve.
+        """
+        solutions = self.surrogate.solve_batched(theta.cpu().numpy())
+        surg = self.surrogate.eval_at_points_batched(self.observation_locations.cpu().numpy(), solutions)
+        surg = torch.tensor(surg, device=self.device)
+        return -0.5 * torch.sum(((self.observations_values.reshape(1, -1) - surg) ** 2) / (self.observation_noise ** 2), dim=1)
+
+    def nn_log_likelihood_batched(self, theta):
+        """
+        Evaluates the log-likelihood of a batch of chains given a NN, with one forward pass.
+        """
+        surg = self.surrogate.u(self.batched_data(theta)).detach().reshape(theta.size(0), -1)
+        return -0.5 * torch.sum(((self.observations_values.reshape(1, -1) - surg) ** 2) / (self.observation_noise ** 2), dim=1)
+
+    def dgala_log_likelihood_batched(self, theta):
+        """
+        Evaluates the log-likelihood of a batch of chains given a dgala, with one forward pass.
+        """
+        surg_mu, surg_sigma = self.surrogate(self.batched_data(theta), diagonal=True)
+
+        surg_mu = surg_mu.reshape(theta.size(0), -1)
+        surg_sigma = surg_sigma.reshape(theta.size(0), -1)
+
+        sigma = self.observation_noise ** 2 + surg_sigma
+        dy = surg_mu.shape[1]
+
+        cte = 0.5 * (dy * torch.log(torch.tensor(2 * torch.pi)) + torch.sum(torch.log(sigma), dim=1))
+
+        return -0.5 * torch.sum(((self.observations_values.reshape(1, -1) - surg_mu) ** 2) / sigma, dim=1) - cte
+
     def log_likelihood(self, theta):
         """Directly call the precomputed likelihood function."""
         return self.log_likelihood_func(theta)
+
+    def log_likelihood_batched(self, theta):
+        """Directly call the precomputed batched likelihood function."""
+        return self.log_likelihood_batched_func(theta)
         
 
 class EllipticMCMCDA(MCMCDA):
@@ -90,6 +148,7 @@ class EllipticMCMCDA(MCMCDA):
         # Dictionary to map surrogate classes to likelihood functions
         likelihood_methods = {
             FEMSolver: self.fem_log_likelihood,
+            FEMSolver1D: self.fem_log_likelihood,
             Elliptic: self.nn_log_likelihood,
             dgala: self.dgala_log_likelihood
         }
@@ -98,12 +157,25 @@ class EllipticMCMCDA(MCMCDA):
         self.log_likelihood_outer_func = self.get_likelihood_function(coarse_surrogate, likelihood_methods)
         self.log_likelihood_inner_func = self.get_likelihood_function(finer_surrogate, likelihood_methods)
 
+        # Vectorized coarse likelihood for prefetched proposals, other surrogates fall back to a loop
+        batched_likelihood_methods = {
+            FEMSolver1D: self.fem1d_log_likelihood_batched,
+            Elliptic: self.nn_log_likelihood_batched,
+            dgala: self.dgala_log_likelihood_batched
+        }
+        self.log_likelihood_outer_batched_func = self.get_likelihood_function(coarse_surrogate, batched_likelihood_methods,
+                                                                              default=super().log_likelihood_outer_batched)
+
     def log_prior(self, theta):
         if not ((theta >= -1) & (theta <= 1)).all():
             return -torch.inf
         else:
             return 0
 
+    def log_prior_batched(self, theta):
+        inside = ((theta >= -1) & (theta <= 1)).all(dim=-1)
+        return torch.where(inside, 0., -torch.inf).to(self.observations_values.dtype)
+
     def fem_log_likelihood(self,surrogate, theta):
         """
         Evaluates the log-likelihood given a FEM.
@@ -127,10 +199,10 @@ class EllipticMCMCDA(MCMCDA):
         Evaluates the log-likelihood given a dgala.
         """
         data = torch.cat([self.observation_locations, theta.repeat(self.observation_locations.size(0), 1)], dim=1).float()
-        surg_mu, surg_sigma = surrogate(data)
+        surg_mu, surg_sigma = surrogate(data, diagonal=True)
 
         surg_mu = surg_mu.view(-1, 1)
-        surg_sigma = surg_sigma[:, :, 0].view(-1, 1)
+        surg_sigma = surg_sigma.view(-1, 1)
 
         sigma = self.observation_noise ** 2 + surg_sigma
         dy = surg_mu.shape[0]
@@ -138,11 +210,52 @@ class EllipticMCMCDA(MCMCDA):
         cte = 0.5 * (dy * torch.log(torch.tensor(2 * torch.pi)) + torch.sum(torch.log(sigma)))
         return -0.5 * torch.sum(((self.observations_values - surg_mu.reshape(-1, 1)) ** 2) / sigma)- cte
     
-    def get_likelihood_function(self, surrogate, likelihood_methods):
+    def batched_data(self, theta):
+        """Stack the observation locations for every theta, shape (ntheta * n_obs, 1 + nparameters)."""
+        nobs = self.observation_locations.size(0)
+        return torch.cat([self.observation_locations.repeat(theta.size(0), 1),
+                          theta.repeat_interleave(nobs, dim=0)], dim=1).float()
+
+    def fem1d_log_likelihood_batched(self, surrogate, theta):
+        """
+        Evaluates the log-likelihood of a batch of theta given a FEMSolver1D, with one batched
+        tridiagonal solve.
+        """
+        solutions = surrogate.solve_batched(theta.cpu().numpy())
+        surg = surrogate.eval_at_points_batched(self.observation_locations.cpu().numpy(), solutions)
+        surg = torch.tensor(surg, device=self.device)
+        return -0.5 * torch.sum(((self.observations_values.reshape(1, -1) - surg) ** 2) / (self.observation_noise ** 2), dim=1)
+
+    def nn_log_likelihood_batched(self, surrogate, theta):
+        """
+        Evaluates the log-likelihood of a batch of theta given a NN, with one forward pass.
+        """
+        surg = surrogate.u(self.batched_data(theta)).detach().reshape(theta.size(0), -1)
+        return -0.5 * torch.sum(((self.observations_values.reshape(1, -1) - surg) ** 2) / (self.observation_noise ** 2), dim=1)
+
+    def dgala_log_likelihood_batched(self, surrogate, theta):
+        """
+        Evaluates the log-likelihood of a batch of theta given a dgala, with one forward pass.
+        """
+        surg_mu, surg_sigma = surrogate(self.batched_data(theta), diagonal=True)
+
+        surg_mu = surg_mu.reshape(theta.size(0), -1)
+        surg_sigma = surg_sigma.reshape(theta.size(0), -1)
+
+        sigma = self.observation_noise ** 2 + surg_sigma
+        dy = surg_mu.shape[1]
+
+        cte = 0.5 * (dy * torch.log(torch.tensor(2 * torch.pi)) + torch.sum(torch.log(sigma), dim=1))
+
+        return -0.5 * torch.sum(((self.observations_values.reshape(1, -1) - surg_mu) ** 2) / sigma, dim=1) - cte
+
+    def get_likelihood_function(self, surrogate, likelihood_methods, default=None):
         """Precompute and return the appropriate likelihood function for a given surrogate."""
         for surrogate_type, likelihood_func in likelihood_methods.items():
             if isinstance(surrogate, surrogate_type):
                 return lambda theta: likelihood_func(surrogate, theta)
+        if default is not None:
+            return default
         raise ValueError(f"Surrogate of type {type(surrogate).__name__} is not supported.")
 
     def log_likelihood_outer(self, theta):
@@ -150,4 +263,36 @@ class EllipticMCMCDA(MCMCDA):
 
     def log_likelihood_inner(self, theta):
         return self.log_likelihood_inner_func(theta)
+
+    def log_likelihood_outer_batched(self, theta):
+        return self.log_likelihood_outer_batched_func(theta)
+
+    def fine_pool(self, nworkers=None):
+        """Start a FineSolverPool whose workers each hold their own FEMSolver, with the
+        discretization of the fine surrogate, for `run_chain(prefetch=..., fine_pool=...)`."""
+        if not isinstance(self.finer_surrogate, FEMSolver):
+            raise ValueError(f"Fine surrogate of type {type(self.finer_surrogate).__name__} cannot be pooled.")
+        solver_kwargs = dict(lam=self.finer_surrogate.lam, M=self.finer_surrogate.M, vert=self.finer_surrogate.vert,
+                             l_bc=self.finer_surrogate.l_bc, r_bc=self.finer_surrogate.r_bc)
+        factory_args = (self.observation_locations.cpu().numpy(), self.observations_values.cpu().numpy(),
+                        self.observation_noise, self.nparameters, solver_kwargs)
+        return FineSolverPool(FEMLogLikelihood, factory_args, nworkers=nworkers)
+
+
+class FEMLogLikelihood:
+    """
+    FEM log-likelihood with its own long-lived FEMSolver, built once per FineSolverPool worker.
+    Same likelihood as `EllipticMCMCDA.fem_log_likelihood`, in numpy.
+    """
+    def __init__(self, observation_locations, observations_values, observation_noise, nparameters=2, solver_kwargs=None):
+        self.observation_locations = observation_locations
+        self.observations_values = observations_values
+        self.observation_noise = observation_noise
+        self.solver = FEMSolver(np.zeros(nparameters), **(solver_kwargs or {}))
+
+    def __call__(self, theta):
+        self.solver.theta = theta
+        self.solver.solve()
+        surg = self.solver.eval_at_points(self.observation_locations).reshape(-1, 1)
+        return -0.5 * np.sum(((self.observations_values - surg) ** 2) / (self.observation_noise ** 2))
     
\ No newline at end of file
@@ -0,0 +1,78 @@
+import numpy as np
+from functools import lru_cache
+from scipy.optimize import fsolve, brentq
+
+class RootFinder:
+    def __init__(self, lam , M, equation=None):
+        """
+        lam: parameter lambda (for your equation)
+        M: number of intervals to search for roots
+        equation: optional, if you want to provide a custom equation
+        """
+        self.lam = lam
+        self.M = M
+        self.c = 1 / lam
+        self.equation = equation if equation else self.default_equation
+
+    def default_equation(self, x):
+        """Default transcendental equation: tan(x) = (2c*x)/(x^2 - c^2)"""
+        c = self.c
+        return np.tan(x) - (2 * c * x) / (x**2 - c**2)
+
+    def find_roots(self):
+        """Find the roots using the Brent or fsolve method depending on the case."""
+        roots = []
+        for i in range(self.M):
+            wmin = (i - 0.499) * np.pi
+            wmax = (i + 0.499) * np.pi
+
+            # Handle the singularity around c
+            if wmin <= self.c <= wmax:  
+                if wmin > 0:
+                    root = fsolve(self.equation, (self.c + wmin) / 2)[0]
+                    roots.append(root)
+                root = fsolve(self.equation, (self.c + wmax) / 2)[0]
+                roots.append(root)
+            elif wmin > 0:  
+                root = brentq(self.equation, wmin, wmax)
+                roots.append(root)
+        
+        return np.array(roots)
+
+
+@lru_cache(maxsize=None)
+def kl_roots(lam, M):
+    """Roots of the KL expansion for (lam, M), found once and cached as a read-only array."""
+    roots = RootFinder(lam, M).find_roots()
+    roots.setflags(write=False)
+    return roots
+
+
+class Parametric_K:
+    def __init__(self, theta, lam , M):
+        self.theta = np.array(theta)
+        self.roots = kl_roots(lam, M)
+
+        # KL coefficients, computed once
+        self.A = np.sqrt(1 / ((1/8)*(5 + (self.roots / 2)**2) + 
+                              (np.sin(2*self.roots) / (4*self.roots)) * ((self.roots / 4)**2 - 1) - (np.cos(2*self.roots)/8)))
+        self.an = np.sqrt(8 / (self.roots**2 + 16))
+
+    def basis(self, x, nterms=None):
+        """
+        KL basis functions an*A*(sin(w x) + w/4 cos(w x)) of the first `nterms` terms.
+        x: 2D array of points (dim, n), only x[0] is used.
+        Returns an (n, nterms) array, so that log k = basis @ theta.
+        """
+        nterms = len(self.roots) if nterms is None else nterms
+        w = self.roots[:nterms]
+        x = np.asarray(x[0]).reshape(-1, 1)
+        return self.an[:nterms] * self.A[:nterms] * (np.sin(w * x) + (w / 4) * np.cos(w * x))
+    
+    def eval(self, x):
+        """
+        Evaluate the sum for a given x, summing over all terms defined by theta and roots.
+        x: 2D array of points (n, dim), where n is the number of points and dim is the dimension.
+        Returns an array of evaluations for each point.
+        """
+        return np.exp(self.basis(x, len(self.theta)) @ self.theta)
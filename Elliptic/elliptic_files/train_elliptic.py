@@ -1,8 +1,12 @@
+import os
 import time
 import wandb
+import hashlib
 
 import torch
+import torch.multiprocessing as mp
 from torch.utils.data import Dataset,DataLoader
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 from scipy.stats import qmc
@@ -11,7 +15,10 @@ from .FEM_Solver import FEMSolver
 from .elliptic import Elliptic
 
 
-def samples_param(size, nparam, min_val=-1, max_val=1,seed = 65647437836358831880808032086803839626):
+# Seed of the parameter samples, part of the key of the cached test sets
+PARAM_SEED = 65647437836358831880808032086803839626
+
+def samples_param(size, nparam, min_val=-1, max_val=1,seed = PARAM_SEED):
     """Sample parameters uniformly from a specified range."""
     rng = np.random.default_rng(seed)
     return rng.uniform(min_val, max_val, size=(size, nparam))
@@ -68,7 +75,54 @@ def generate_data(size, param = None, nparam = 2, seed = 65647437836358831880808
         return data_int, left_bc, right_bc  
 
 
-def generate_test_data(size, lam = 1/4, M = 2,param = None,vert=30, nparam=2):
+# FEM solver owned by a test data worker process
+_test_solver = None
+
+def _init_test_worker(lam, M, vert, nparam):
+    """Build the long-lived FEM solver of a test data worker, one solver per process."""
+    global _test_solver
+    torch.set_num_threads(1)
+    _test_solver = FEMSolver(np.zeros(nparam), lam, M, vert=vert)
+
+def solve_test_chunk(solver, params):
+    """
+    Solve the FEM problem for a chunk of parameters, returns the mesh points, the solutions and a
+    mask of the parameters whose solve succeeded (the rows of failed solves are zero).
+    """
+    test_data = np.zeros((params.shape[0], solver.vert + 1))
+    solved = np.zeros(params.shape[0], dtype=bool)
+
+    for i in range(params.shape[0]):
+        try:
+            # Solve the FEM problem
+            solver.theta = params[i, :]  # Update the parameter vector
+            solver.uh = None
+            solver.solve()
+            test_data[i, :] = solver.solution_array()[1]
+            solved[i] = True
+        except Exception as e:
+            print(f"FEM solver failed for sample {params[i, :]}: {str(e)}")
+            continue
+
+    # Get the test points (vertices)
+    try:
+        x_test = solver.solution_array()[0][:, 0].reshape(-1, 1)
+    except Exception as e:
+        raise RuntimeError(f"Failed to retrieve test points: {str(e)}")
+
+    return x_test, test_data, solved
+
+def _solve_test_worker(params):
+    return solve_test_chunk(_test_solver, params)
+
+def test_data_path(cache_dir, params, seed, vert, lam, M):
+    """Cache file of a test set, keyed by (seed, vert, lam, M, size) and a digest of the parameters."""
+    digest = hashlib.sha1(np.ascontiguousarray(params, dtype=np.float64).tobytes()).hexdigest()[:12]
+    return os.path.join(cache_dir, f"test_data_seed{seed}_vert{vert}_lam{lam:g}_M{M}_size{params.shape[0]}_{digest}.npz")
+
+
+def generate_test_data(size, lam = 1/4, M = 2,param = None,vert=30, nparam=2, nworkers=0, chunk_size=250,
+                       cache_dir=None, seed=None):
     """
     Generate test data using the FEM solver for a specified number of samples and parameters.
 
@@ -76,40 +130,54 @@ def generate_test_data(size, lam = 1/4, M = 2,param = None,vert=30, nparam=2):
     - size (int): Number of test samples to generate.
     - vert (int): Number of vertices for the FEMSolver mesh.
     - nparam (int): Number of parameters for the test.
+    - nworkers (int): > 0 solves chunks of `chunk_size` parameters on a process pool of that
+      size, with one FEMSolver per worker.
+    - cache_dir (str): Folder of the on-disk test sets. A test set found there is loaded
+      instead of solved, a new one is saved there unless some of its solves failed.
+    - seed: Seed the parameters were sampled with, part of the cache key (samples_param's
+      default seed when `param` is None).
 
     Returns:
     - x_test (np.ndarray): The test points (vertices).
-    - test_samples_param (np.ndarray): Parameters for the test.
+    - test_samples_param (np.ndarray): Parameters for the test, without those whose solve failed.
     - test_data (np.ndarray): FEM solver results for each test sample.
     """
     # Sample parameters
     if param is None:
-        test_samples_param = samples_param(size, nparam=nparam)
+        seed = PARAM_SEED if seed is None else seed
+        test_samples_param = samples_param(size, nparam=nparam, seed=seed)
     else:
         test_samples_param = param[:size,:]
 
-    solver = FEMSolver(np.zeros(nparam), lam, M, vert=vert)
+    if cache_dir is not None:
+        path = test_data_path(cache_dir, test_samples_param, seed, vert, lam, M)
+        if os.path.exists(path):
+            cached = np.load(path)
+            return cached["x_test"], cached["params"], cached["test_data"]
 
-    # Preallocate array for test data
-    test_data = np.zeros((size, vert + 1))
-
-    # Loop through and solve for each parameter set
-    for i in range(size):
-        try:
-            # Solve the FEM problem
-            solver.theta = test_samples_param[i, :]  # Update the parameter vector
-            solver.uh = None
-            solution = solver.solve()
-            test_data[i, :] = solution.x.array
-        except Exception as e:
-            print(f"FEM solver failed for sample {i}: {str(e)}")
-            continue
+    chunks = [test_samples_param[i:i + chunk_size] for i in range(0, size, chunk_size)]
 
-    # Get the test points (vertices)
-    try:
-        x_test = solver.solution_array()[0][:, 0].reshape(-1, 1)
-    except Exception as e:
-        raise RuntimeError(f"Failed to retrieve test points: {str(e)}")
+    if nworkers > 0:
+        with ProcessPoolExecutor(max_workers=nworkers, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_test_worker, initargs=(lam, M, vert, nparam)) as executor:
+            results = list(executor.map(_solve_test_worker, chunks))
+    else:
+        solver = FEMSolver(np.zeros(nparam), lam, M, vert=vert)
+        results = [solve_test_chunk(solver, chunk) for chunk in chunks]
+
+    x_test = results[0][0]
+    test_data = np.concatenate([data for _, data, _ in results], axis=0)
+    solved = np.concatenate([solved for _, _, solved in results])
+
+    # Failed solves are dropped, and such an incomplete test set is not cached
+    if not solved.all():
+        print(f"Dropped {np.sum(~solved)} of {size} test samples whose FEM solve failed, the test set is not cached.")
+        test_samples_param, test_data = test_samples_param[solved], test_data[solved]
+    elif cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = path.replace(".npz", ".tmp.npz")
+        np.savez(tmp_path, x_test=x_test, params=test_samples_param, test_data=test_data)
+        os.replace(tmp_path, path)  # Never leave a partially written test set behind
 
     return x_test, test_samples_param, test_data
 
@@ -128,7 +196,13 @@ def train_elliptic(config, device):
 
     dataset = dGDataset(size = config.samples, param=param_train)
 
-    x_val,param_val, sol_val = generate_test_data(config.samples,param =param_test, vert=30)
+    x_val,param_val, sol_val = generate_test_data(config.samples,param =param_test, vert=30,
+                                                  nworkers=config.get("test_workers", 0),
+                                                  cache_dir=config.get("test_data_cache", None),
+                                                  seed=PARAM_SEED)
+
+    validation = ValidationSet(param_val, x_val, sol_val, device)
+    validation_every = config.get("validation_every", 1)
 
     dataloader = DataLoader(dataset, batch_size=config.batch_size, shuffle=False)
 
@@ -159,8 +233,9 @@ def train_elliptic(config, device):
         # Calculate the average loss for the epoch
         epoch_train_loss /= len(dataloader)
 
-        # Compute the test loss at the end of the epoch
-        test_loss_current = compute_mean_error(dg_elliptic.model, param_val, x_val, sol_val)
+        # Compute the test loss at the end of every `validation_every` epochs
+        validate = epoch % validation_every == 0 or epoch == config.epochs - 1
+        test_metrics = {"test_loss": validation.mean_error(dg_elliptic.model)} if validate else {}
 
         # Scheduler step
         if epoch >= start_scheduler and (epoch - start_scheduler) % config.scheduler_step == 0:
@@ -170,7 +245,7 @@ def train_elliptic(config, device):
         wandb.log({
             "epoch": epoch,
             "train_loss": epoch_train_loss,
-            "test_loss": test_loss_current,
+            **test_metrics,
             "loss_computation_time": loss_computation_time,
             "learning_rate": scheduler.get_last_lr()[0],
             **{f"loss_{key}": value.item() for key, value in losses.items()},
@@ -189,45 +264,48 @@ def train_elliptic(config, device):
     return dg_elliptic
 
 
+class ValidationSet:
+    """
+    Validation data resident on the training device: the inputs of every test parameter at
+    every test point, (n_params * n_x, 1 + nparam), are built once so that the mean relative
+    L2 error of a model is one forward pass and a few tensor reductions.
+    """
+    def __init__(self, parameters_test, t, y_numerical, device="cpu"):
+        parameters_test = torch.as_tensor(np.asarray(parameters_test), dtype=torch.float32)
+        t = torch.as_tensor(np.asarray(t), dtype=torch.float32).reshape(-1, 1)
+        self.nparams, self.nx = parameters_test.shape[0], t.shape[0]
+
+        self.data = torch.cat([t.repeat(self.nparams, 1),
+                               parameters_test.repeat_interleave(self.nx, dim=0)], dim=1).to(device)
+
+        self.y_numerical = torch.as_tensor(np.asarray(y_numerical), dtype=torch.float64).reshape(self.nparams, self.nx).to(device)
+        self.y_norm = torch.linalg.vector_norm(self.y_numerical, dim=1)
+
+    def mean_error(self, model):
+        """Mean over the test parameters of the relative L2 error of `model`."""
+        with torch.inference_mode():
+            u_pred = model(self.data).reshape(self.nparams, self.nx).double()
+            error = torch.linalg.vector_norm(self.y_numerical - u_pred, dim=1) / self.y_norm
+        return error.mean().item()
+
+
 def compute_mean_error(model, parameters_test, t, y_numerical):
     """
-    Compute the mean error between the numerical solution and model predictions.
+    Compute the mean error between the numerical solution and model predictions, in a single
+    batched forward pass (see ValidationSet, which keeps the data around between calls).
 
     Parameters:
     model : torch.nn.Module
         The trained PyTorch model for predictions.
-    parameters_test : list of tuples
-        Test parameters to be used for generating test data.
+    parameters_test : np.ndarray
+        Test parameters, one row per test case.
     t : numpy.ndarray
         Time or spatial variable.
     y_numerical : numpy.ndarray
-        Numerical solution for comparison.
-    w : any
-        Weight or other identifier for mean_error storage.
-    act : str
-        Activation type for mean_error storage.
+        Numerical solution for comparison, one row per test case.
 
     Returns:
-    None: Updates mean_error in place.
+    float: Mean relative L2 error over the test parameters.
     """
-    error = []
-    
-    for n, pr1 in enumerate(parameters_test):
-        # Generate test data
-        
-        data_test = np.hstack((t, np.ones((t.shape[0],pr1.shape[0])) * pr1))
-        
-        # Get the numerical solution for this test case
-        numerical_sol = y_numerical[n, :]
-
-        # Predict using the model
-        u_pred = model(torch.tensor(data_test).float()).detach().cpu().numpy()
-
-        # Reshape the numerical solution to match the prediction shape
-        numerical_sol = numerical_sol.reshape(u_pred.shape)
-
-        # Calculate the error
-        error.append(np.linalg.norm(numerical_sol - u_pred, ord=2) / np.linalg.norm(numerical_sol, ord=2))
-
-    return np.mean(error)
-
+    device = next(model.parameters()).device
+    return ValidationSet(parameters_test, t, y_numerical, device).mean_error(model)
@@ -11,8 +11,9 @@ import matplotlib.pyplot as plt
 from statsmodels.graphics.tsaplots import plot_acf
 
 from .FEM_Solver import FEMSolver
+from .FEM_Solver_1D import FEMSolver1D
 
-from .train_elliptic import train_elliptic,generate_data,samples_param
+from .train_elliptic import train_elliptic,generate_data,samples_param,generate_test_data
 
 
 def generate_data_elliptic(size, param = None, nparam = 2, seed = 65647437836358831880808032086803839626):
@@ -259,9 +260,33 @@ def plot_nn_vs_fem(weights, param_test, x_test, sol_test, sample_size, model_pat
     plt.show()
 
 
-def compute_max_error(N,vert=30, grid=75):
+def grid_reference_solutions(parameters, vert=30, reference="fem", nworkers=0, cache_dir=None):
+    """
+    FEM reference solutions for a batch of parameters, (n_params, vert + 1), and the mesh points.
+    "fem" (the default) runs the dolfinx FEMSolver through generate_test_data, on `nworkers`
+    processes and cached in `cache_dir` when given, "fem1d" solves the whole batch at once with
+    FEMSolver1D (see experiments/fem_1d_parity.py for its parity with FEMSolver).
+    """
+    if reference == "fem1d":
+        solver = FEMSolver1D(np.zeros(parameters.shape[1]), vert=vert)
+        return solver.x.reshape(-1, 1), solver.solve_batched(parameters)
+    elif reference == "fem":
+        x_FEM, _, y_FEM = generate_test_data(parameters.shape[0], param=parameters, vert=vert,
+                                             nparam=parameters.shape[1], nworkers=nworkers,
+                                             cache_dir=cache_dir, seed="grid")
+        return x_FEM, y_FEM
+    raise ValueError(f"Unknown reference solver '{reference}', choose 'fem1d' or 'fem'.")
+
+
+def compute_max_error(N,vert=30, grid=75, reference="fem", nworkers=0, cache_dir=None,
+                      model_path="./models/MDNN_s{}.pth", batch_size=2**18, output_path=None, device="cpu"):
     """
     Compute the maximum error between the FEM solution and a surrogate neural network for different parameters and observation sizes.
+
+    The FEM reference solutions of the whole grid are computed in one batch (see
+    grid_reference_solutions), each surrogate is loaded once and evaluated on the whole
+    grid x mesh batch, in chunks of `batch_size` rows. The error cube is saved to
+    `output_path` (.npy) when given.
     """
     parameter  = np.linspace(-1,1,grid)
 
@@ -271,41 +296,35 @@ def compute_max_error(N,vert=30, grid=75):
     # Create meshgrid for plotting later
     X, Y = np.meshgrid(parameter, parameter)
 
-    solver = FEMSolver(np.zeros(2), vert = vert)
-
-    # Main loop over parameter space
-    for i, par1 in enumerate(parameter):
-        for j, par2 in enumerate(parameter):
-            pr = np.array([par1, par2])
-
-            # Update the solver with new parameter values
-            solver.theta = pr  # Update the parameter vector
-            solver.uh = None  # Reset the FEM solution
-            solver.solve()
-
-            # Get FEM solution arrays
-            x_FEM, y_FEM = solver.solution_array()
-            x_FEM, y_FEM = x_FEM[:, 0].reshape(-1, 1), y_FEM.reshape(-1, 1)
+    # Grid parameters in the order of results, results[i, j] is (parameter[i], parameter[j])
+    parameters = np.stack(np.meshgrid(parameter, parameter, indexing="ij"), axis=-1).reshape(-1, 2)
+    x_FEM, y_FEM = grid_reference_solutions(parameters, vert, reference, nworkers, cache_dir)
+    nx = x_FEM.shape[0]
 
-            data = torch.tensor(np.hstack((x_FEM, np.ones((x_FEM.shape[0], pr.shape[0])) * pr))).float()
+    data = torch.cat([torch.tensor(x_FEM, dtype=torch.float32).repeat(parameters.shape[0], 1),
+                      torch.tensor(parameters, dtype=torch.float32).repeat_interleave(nx, dim=0)], dim=1).to(device)
 
-            # Loop over observation sizes N
-            for z, sample in enumerate(N):
-                model_path = f"./models/MDNN_s{sample}.pth"
+    # Loop over observation sizes N
+    for z, sample in enumerate(N):
+        path = model_path.format(sample)
 
-                try:
-                    elliptic = torch.load(model_path)
-                    elliptic.eval()
+        try:
+            elliptic = torch.load(path, map_location=device)
+        except FileNotFoundError:
+            print(f"Model file not found for N={sample} at path {path}")
+            results[:, :, z] = np.nan  # Mark missing model data
+            continue
 
-                    surg = elliptic.model(data).detach().cpu().numpy().reshape(-1, 1)
+        elliptic.eval()
+        with torch.inference_mode():
+            surg = torch.cat([elliptic.model(batch) for batch in torch.split(data, batch_size)])
+        surg = surg.cpu().numpy().reshape(parameters.shape[0], nx)
 
-                    # Compute the maximum error between FEM and surrogate
-                    max_error = np.max(np.abs(y_FEM - surg))
-                    results[i, j, z] = max_error
+        # Compute the maximum error between FEM and surrogate
+        results[:, :, z] = np.max(np.abs(y_FEM - surg), axis=1).reshape(grid, grid)
 
-                except FileNotFoundError:
-                    print(f"Model file not found for N={sample} at path {model_path}")
-                    results[i, j, z] = np.nan  # Mark missing model data
+    if output_path is not None:
+        np.save(output_path, results)
 
     return results, X, Y
 
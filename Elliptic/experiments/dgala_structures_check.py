@@ -0,0 +1,115 @@
+import sys
+import os
+import argparse
+import numpy as np
+import torch
+from ml_collections import ConfigDict
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(project_root)  # This allows importing from base, Elliptic, etc.
+sys.path.append(os.path.join(project_root, "Elliptic"))  # Explicitly add Elliptic folder
+
+from Base.lla import get_dgala
+from elliptic_files.elliptic import Elliptic
+from elliptic_files.elliptic_mcmc import EllipticMCMC
+from elliptic_files.utilities import deepgala_data_fit
+
+
+def toy_model(nparam, hidden, seed):
+    """Untrained elliptic surrogate with a small tanh MLP, the Laplace fit does not need a MAP."""
+    torch.manual_seed(seed)
+    config = ConfigDict()
+    config.nn_model = "NN"
+    config.lambdas = {"elliptic": 1, "ubcl": 1, "ubcr": 1}
+    config.model = ConfigDict({"layers": [1 + nparam, hidden, hidden, 1], "activation": "tanh"})
+    return Elliptic(config, "cpu", M=nparam)
+
+def dense_reference(dense, structure, model, fit_data, options):
+    """
+    The dense dgala with H restricted to the couplings `structure` keeps: its diagonal for "diag",
+    the blocks of the layers for "kron" and the full H for "lowrank". The restricted references
+    are fitted again, a deepcopy would share the feature hook of `dense`.
+    """
+    if structure == "lowrank":
+        return dense
+    reference = get_dgala(model, "full", **options)
+    reference.fit(fit_data)
+    if structure == "diag":
+        mask = torch.eye(reference.n_params)
+    else:
+        mask = torch.block_diag(*[torch.ones(size, size) for size in reference.layer_sizes])
+    reference.H = reference.H * mask
+    return reference
+
+def mcmc_log_likelihood(surrogate, x_obs, theta):
+    """EllipticMCMC log-likelihood of `theta` with `surrogate`, observations from the surrogate mean."""
+    data = torch.cat([x_obs, theta.repeat(x_obs.shape[0], 1)], dim=1)
+    observations = surrogate(data, diagonal=True)[0].reshape(-1, 1)
+    mcmc = EllipticMCMC(surrogate, x_obs, observations, nparameters=theta.shape[0], observation_noise=1e-2)
+    return mcmc.log_likelihood(theta + 0.1).item()
+
+def check(subset, rank, nparam, hidden, nfit, ntest, seed=0):
+    """
+    Fit the dense dgala and every structured curvature of `subset` on the same fit data, and
+    compare the log determinant of the posterior precision, the diagonal predictive variances
+    and the EllipticMCMC log-likelihood with the dense reference (see dense_reference).
+    Returns rows (structure, options, exact, log det error, variance error, likelihood error) of
+    relative errors, `exact` when the structure represents the reference without approximation.
+    """
+    model = toy_model(nparam, hidden, seed)
+    fit_data = deepgala_data_fit(nfit, nparam, "cpu", seed)
+    x_test = deepgala_data_fit(ntest, nparam, "cpu", seed + 1)["data_fit"]["pde"]
+    x_obs = torch.linspace(0.2, 0.8, 6).reshape(-1, 1)
+    theta = torch.zeros(nparam)
+
+    options = {"last_layer_name": "layers.output_layer", "subset_of_weights": subset}
+    dense = get_dgala(model, "full", **options)
+    dense.fit(fit_data)
+
+    # The Kronecker factors of a single output layer are exact, rank n_params Nyström too
+    cases = [("diag", {}, True), ("kron", {}, subset == "last_layer"),
+             ("lowrank", {"rank": dense.n_params}, True)]
+    if rank < dense.n_params:
+        cases.append(("lowrank", {"rank": rank}, False))
+
+    rows = []
+    for structure, kwargs, exact in cases:
+        llp = get_dgala(model, structure, **options, **kwargs)
+        llp.fit(fit_data)
+        reference = dense_reference(dense, structure, model, fit_data, options)
+
+        log_det, log_det_ref = llp.log_det_posterior_precision.item(), reference.log_det_posterior_precision.item()
+        var, var_ref = llp(x_test, diagonal=True)[1], reference(x_test, diagonal=True)[1]
+        loglik, loglik_ref = mcmc_log_likelihood(llp, x_obs, theta), mcmc_log_likelihood(reference, x_obs, theta)
+
+        rows.append((structure, kwargs, exact, abs(log_det - log_det_ref) / abs(log_det_ref),
+                     ((var - var_ref).abs() / var_ref).max().item(), abs(loglik - loglik_ref) / abs(loglik_ref)))
+    return dense.n_params, rows
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Structured dgala curvatures against the dense dgala on a toy MLP")
+    parser.add_argument("--subsets", type=str, nargs="+", default=["last_layer", "all"], help="Laplace weights")
+    parser.add_argument("--rank", type=int, default=20, help="Rank of the approximate low-rank curvature")
+    parser.add_argument("--nparam", type=int, default=2, help="Number of KL terms")
+    parser.add_argument("--hidden", type=int, default=8, help="Width of the hidden layers")
+    parser.add_argument("--nfit", type=int, default=200, help="Fit points per term")
+    parser.add_argument("--ntest", type=int, default=100, help="Points of the predictive variances")
+    parser.add_argument("--tol", type=float, default=1e-3, help="Largest accepted relative error of the exact cases")
+
+    args = parser.parse_args()
+
+    failed = False
+    for subset in args.subsets:
+        n_params, rows = check(subset, args.rank, args.nparam, args.hidden, args.nfit, args.ntest)
+        print(f"{subset}, {n_params} parameters")
+        print(f"{'structure':>10} {'options':>12} {'exact':>6} {'log det':>10} {'variance':>10} {'loglik':>10}")
+        for structure, kwargs, exact, log_det_error, var_error, loglik_error in rows:
+            options = ",".join(f"{key}={value}" for key, value in kwargs.items()) or "-"
+            print(f"{structure:>10} {options:>12} {str(exact):>6} {log_det_error:>10.2e} {var_error:>10.2e} {loglik_error:>10.2e}")
+            failed |= exact and np.max([log_det_error, var_error, loglik_error]) > args.tol
+        print()
+
+    if failed:
+        sys.exit(f"A structured dgala differs from the dense dgala by more than {args.tol} where it should be exact")
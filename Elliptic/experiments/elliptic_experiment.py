@@ -11,8 +11,9 @@ sys.path.append(project_root)  # This allows importing from base, Elliptic, etc.
 sys.path.append(os.path.join(project_root, "Elliptic"))  # Explicitly add Elliptic folder
 
 
-from Base.lla import dgala
+from Base.lla import get_dgala
 from Base.utilities import clear_hooks
+from Base.mcmc import MemorySink, NpyChunkSink, MomentsSink
 from elliptic_files.elliptic_mcmc import EllipticMCMC, EllipticMCMCDA
 from elliptic_files.train_elliptic import train_elliptic
 from elliptic_files.utilities import generate_noisy_obs,deepgala_data_fit
@@ -27,6 +28,8 @@ def elliptic_experiment():
 
     # DeepGala
     config.deepgala = False
+    config.hessian_structure = "full"  # Options: "full", "diag", "kron", "lowrank"
+    config.laplace_weights = "last_layer"  # "last_layer", "all" or a list of layer names
 
     # Inverse problem parameters
     config.noise_level = 1e-4
@@ -43,12 +46,17 @@ def elliptic_experiment():
     config.proposal_variance = 1e-3
     config.samples = 1000000
     config.FEM_h = 50
+    config.nchains = 1  # > 1 runs the chains batched in a single process
+    config.sample_sink = "memory"  # Options: "memory", "npy" (chunks flushed to disk), "moments"
+    config.thin = 1
 
     # Delayed Acceptance
     config.da_mcmc_nn = False
     config.da_mcmc_dgala = False
     config.iter_mcmc = 1000000
     config.iter_da = 20000
+    config.da_prefetch = 1  # > 1 screens that many coarse proposals per batched evaluation
+    config.fine_workers = 0  # > 0 solves the prefetched proposals on a FineSolverPool of that size, needs da_prefetch > 1
 
     return config
 
@@ -91,12 +99,42 @@ def get_deepgalerkin_config():
     config.scheduler_step = 50
     config.samples = 5000
     config.batch_size = 150
+    config.test_workers = 0  # > 0 generates the validation set on a process pool of that size
+    config.test_data_cache = "./Elliptic/data"  # Validation sets are solved once and reused from here
+    config.validation_every = 1  # Epochs between validation errors
     # config.alpha = 0.9  # For updating loss weights
     # config.weights_update = 250
     return config
 
+def build_sink(config_experiment, path):
+    """Sample sink selected by config.sample_sink, "npy" chunks are written to a folder next to `path`."""
+    if config_experiment.sample_sink == "npy":
+        return NpyChunkSink(path.replace(".npy", ""), thin=config_experiment.thin)
+    elif config_experiment.sample_sink == "moments":
+        return MomentsSink(thin=config_experiment.thin)
+    return MemorySink(thin=config_experiment.thin)
+
+def save_samples(samples, config_experiment, path):
+    """Save what the sink returned, "npy" sinks have already flushed their chunks to disk."""
+    if config_experiment.sample_sink == "memory":
+        np.save(path, samples)
+    elif config_experiment.sample_sink == "moments":
+        np.savez(path.replace(".npy", "_moments.npz"), **samples)
+
+# Helper function to run Delayed Acceptance
+def run_da_chain(mcmcda, config_experiment):
+    """Run Delayed Acceptance, spreading the fine solves over a FineSolverPool when requested."""
+    if config_experiment.fine_workers > 0:
+        if config_experiment.da_prefetch <= 1:
+            raise ValueError(f"fine_workers = {config_experiment.fine_workers} needs da_prefetch > 1, "
+                             f"got {config_experiment.da_prefetch}.")
+        with mcmcda.fine_pool(config_experiment.fine_workers) as fine_pool:
+            return mcmcda.run_chain(verbose=config_experiment.verbose, prefetch=config_experiment.da_prefetch,
+                                    fine_pool=fine_pool)
+    return mcmcda.run_chain(verbose=config_experiment.verbose, prefetch=config_experiment.da_prefetch)
+
 # Helper function to set up MCMC chain
-def run_mcmc_chain(surrogate_model, obs_points, sol_test, config_experiment,device):
+def run_mcmc_chain(surrogate_model, obs_points, sol_test, config_experiment,device, path):
     mcmc = EllipticMCMC(
         surrogate=surrogate_model,
         observation_locations=obs_points,
@@ -108,7 +146,10 @@ def run_mcmc_chain(surrogate_model, obs_points, sol_test, config_experiment,devi
         step_size=config_experiment.proposal_variance,
         device=device
     )
-    return mcmc.run_chain(verbose=config_experiment.verbose)
+    if config_experiment.nchains > 1:
+        return mcmc.run_chains_batched(nchains=config_experiment.nchains, verbose=config_experiment.verbose,
+                                       sink=build_sink(config_experiment, path))
+    return mcmc.run_chain(verbose=config_experiment.verbose, sink=build_sink(config_experiment, path))
 
 # Main experiment runner
 def run_experiment(config_experiment,device):
@@ -129,7 +170,8 @@ def run_experiment(config_experiment,device):
         nn_surrogate_model.eval()
 
         data_fit = deepgala_data_fit(config_experiment.nn_model,config_experiment.KL_expansion,device)
-        llp = dgala(nn_surrogate_model)
+        llp = get_dgala(nn_surrogate_model, config_experiment.hessian_structure,
+                        subset_of_weights=config_experiment.laplace_weights)
         llp.fit(data_fit)
         llp.optimize_marginal_likelihood()
         clear_hooks(llp)
@@ -147,24 +189,26 @@ def run_experiment(config_experiment,device):
         nn_surrogate_model = torch.load(f"./Elliptic/models/MDNN_s{config_experiment.nn_model}.pth")
         nn_surrogate_model.eval()
 
-        nn_samples = run_mcmc_chain(nn_surrogate_model, obs_points, sol_test, config_experiment,device)
-        np.save(f'./Elliptic/results/NN_ss{config_experiment.nn_model}_var{config_experiment.noise_level}.npy', nn_samples[0])
+        samples_path = f'./Elliptic/results/NN_ss{config_experiment.nn_model}_var{config_experiment.noise_level}.npy'
+        nn_samples = run_mcmc_chain(nn_surrogate_model, obs_points, sol_test, config_experiment,device, samples_path)
+        save_samples(nn_samples[0], config_experiment, samples_path)
     
     # Step 5: DeepGaLA Surrogate for MCMC
     if config_experiment.dgala_mcmc:
         print(f"Starting MCMC with DeepGaLA_s{config_experiment.nn_model}")
         llp = torch.load(f"./Elliptic/models/elliptic_dgala_{config_experiment.nn_model}.pth")
         llp.model.set_last_layer("output_layer")  # Re-register hooks
-        nn_samples = run_mcmc_chain(llp, obs_points, sol_test, config_experiment, device)
-        np.save(f'./Elliptic/results/dgala_ss{config_experiment.nn_model}_var{config_experiment.noise_level}.npy', nn_samples[0])
+        samples_path = f'./Elliptic/results/dgala_ss{config_experiment.nn_model}_var{config_experiment.noise_level}.npy'
+        nn_samples = run_mcmc_chain(llp, obs_points, sol_test, config_experiment, device, samples_path)
+        save_samples(nn_samples[0], config_experiment, samples_path)
     
     # Step 6: MCMC FEM Samples (if enabled)
     fem_path = f'./Elliptic/results/FEM_var{config_experiment.noise_level}.npy'
     if config_experiment.fem_mcmc:
         print("Starting MCMC with FEM")
         fem_solver = FEMSolver(np.zeros(2), vert=config_experiment.FEM_h)
-        fem_samples = run_mcmc_chain(fem_solver, obs_points, sol_test, config_experiment, device)
-        np.save(fem_path, fem_samples[0])
+        fem_samples = run_mcmc_chain(fem_solver, obs_points, sol_test, config_experiment, device, fem_path)
+        save_samples(fem_samples[0], config_experiment, fem_path)
 
     # Step 7: Delayed Acceptance for NN
     if config_experiment.da_mcmc_nn:
@@ -181,7 +225,7 @@ def run_experiment(config_experiment,device):
                         iter_mcmc=config_experiment.iter_mcmc, iter_da = config_experiment.iter_da,
                         step_size=config_experiment.proposal_variance, device=device )
         
-        acceptance_res = elliptic_mcmcda.run_chain(verbose=config_experiment.verbose)
+        acceptance_res = run_da_chain(elliptic_mcmcda, config_experiment)
         np.save(f'./Elliptic/results/mcmc_da_nn_{config_experiment.nn_model}_{config_experiment.noise_level}.npy', acceptance_res)
 
     # Step 8: Delayed Acceptance for Dgala
@@ -200,7 +244,7 @@ def run_experiment(config_experiment,device):
                         iter_mcmc=config_experiment.iter_mcmc, iter_da = config_experiment.iter_da,
                         step_size=config_experiment.proposal_variance, device=device)
         
-        acceptance_res = elliptic_mcmcda.run_chain(verbose=config_experiment.verbose)
+        acceptance_res = run_da_chain(elliptic_mcmcda, config_experiment)
         np.save(f'./Elliptic/results/mcmc_da_dgala_{config_experiment.nn_model}_{config_experiment.noise_level}.npy', acceptance_res)
 
 # Main loop for different sample sizes
@@ -0,0 +1,128 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(project_root)  # This allows importing from base, Elliptic, etc.
+sys.path.append(os.path.join(project_root, "Elliptic"))  # Explicitly add Elliptic folder
+
+from elliptic_files.FEM_Solver import FEMSolver, HAS_DOLFINX
+from elliptic_files.FEM_Solver_1D import FEMSolver1D
+from elliptic_files.kl_expansion import Parametric_K
+
+
+def reference_solve(theta, lam, M, vert, l_bc=0, r_bc=2):
+    """
+    P1 Galerkin solution of -(k u')' = 4x assembled cell by cell with 3-point Gauss quadrature
+    and solved densely, the same forms as the dolfinx FEMSolver (k and f are the P1
+    interpolants of their nodal values) without sharing any code with FEMSolver1D.
+    """
+    x = np.linspace(0, 1, vert + 1)
+    k = Parametric_K(theta, lam, M).eval(x.reshape(1, -1))
+    f = 4 * x
+
+    nodes, weights = np.polynomial.legendre.leggauss(3)
+    A = np.zeros((vert + 1, vert + 1))
+    b = np.zeros(vert + 1)
+    for cell in range(vert):
+        x0, x1 = x[cell], x[cell + 1]
+        h = x1 - x0
+        t = 0.5 * (nodes + 1)  # Quadrature points on the reference cell [0, 1]
+        phi = np.stack([1 - t, t])  # Hat functions at the quadrature points, (2, 3)
+        dphi = np.array([-1, 1]) / h
+        k_q = k[cell] * phi[0] + k[cell + 1] * phi[1]
+        f_q = f[cell] * phi[0] + f[cell + 1] * phi[1]
+        dofs = [cell, cell + 1]
+        A[np.ix_(dofs, dofs)] += 0.5 * h * np.sum(weights * k_q) * np.outer(dphi, dphi)
+        b[dofs] += 0.5 * h * phi @ (weights * f_q)
+
+    # Dirichlet conditions by row replacement
+    for dof, value in [(0, l_bc), (vert, r_bc)]:
+        A[dof, :] = 0
+        A[dof, dof] = 1
+        b[dof] = value
+    return x, np.linalg.solve(A, b)
+
+
+def parity(nsamples, nparam, vert, obs, seed=0):
+    """
+    Solve the elliptic problem for random thetas with the tridiagonal FEMSolver1D, the reference
+    assembly and, when dolfinx is installed, the dolfinx FEMSolver, and compare the nodal
+    solutions, the values at observation points and the batched solve. The reference error
+    covers both the nodal solution and the values at the observation points.
+    Returns the largest absolute differences (nan without dolfinx) and the time per solve.
+    """
+    rng = np.random.default_rng(seed)
+    thetas = rng.uniform(-1, 1, (nsamples, nparam))
+    obs_points = np.linspace(0.2, 0.8, obs).reshape(-1, 1)
+
+    fem = FEMSolver(np.zeros(nparam), M=nparam, vert=vert) if HAS_DOLFINX else None
+    fem1d = FEMSolver1D(np.zeros(nparam), M=nparam, vert=vert)
+
+    reference_error, nodal_error, obs_error = 0.0, 0.0, 0.0
+    fem_time, fem1d_time = 0.0, 0.0
+    fem1d_solutions = np.zeros((nsamples, vert + 1))
+
+    for i, theta in enumerate(thetas):
+        fem1d.theta = theta
+
+        start = time.perf_counter()
+        fem1d_solutions[i] = fem1d.solve()
+        fem1d_time += time.perf_counter() - start
+
+        x, u = reference_solve(theta, 1 / 4, nparam, vert)
+        reference_error = max(reference_error, np.max(np.abs(u - fem1d_solutions[i])),
+                              np.max(np.abs(np.interp(obs_points[:, 0], x, u) - fem1d.eval_at_points(obs_points)[:, 0])))
+
+        if fem is not None:
+            fem.theta = theta
+            start = time.perf_counter()
+            fem.solve()
+            fem_time += time.perf_counter() - start
+
+            # dolfinx may number the dofs in another order than the mesh nodes
+            x, u = fem.solution_array()
+            order = np.argsort(x[:, 0])
+            nodal_error = max(nodal_error, np.max(np.abs(u[order] - fem1d.solution_array()[1])))
+            obs_error = max(obs_error, np.max(np.abs(fem.eval_at_points(obs_points) - fem1d.eval_at_points(obs_points))))
+
+    if fem is None:
+        nodal_error, obs_error, fem_time = np.nan, np.nan, np.nan
+
+    start = time.perf_counter()
+    batched_solutions = fem1d.solve_batched(thetas)
+    batched_time = time.perf_counter() - start
+    batched_error = np.max(np.abs(batched_solutions - fem1d_solutions))
+
+    return (reference_error, nodal_error, obs_error, batched_error,
+            fem_time / nsamples, fem1d_time / nsamples, batched_time / nsamples)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Parity of the dolfinx and tridiagonal 1D elliptic solvers")
+    parser.add_argument("--nsamples", type=int, default=100, help="Number of random thetas")
+    parser.add_argument("--nparam", type=int, default=2, help="Number of KL terms")
+    parser.add_argument("--vert", type=int, nargs="+", default=[30, 100, 1000], help="Mesh sizes")
+    parser.add_argument("--obs", type=int, default=6, help="Number of observation points")
+    parser.add_argument("--tol", type=float, default=1e-8, help="Largest accepted difference")
+
+    args = parser.parse_args()
+
+    if not HAS_DOLFINX:
+        print("dolfinx is not installed, FEMSolver1D is only compared with the reference assembly")
+
+    print(f"{'vert':>5} {'ref err':>10} {'nodal err':>10} {'obs err':>10} {'batch err':>10} "
+          f"{'dolfinx':>10} {'1D':>10} {'1D batched':>11}")
+    failed = False
+    for vert in args.vert:
+        reference_error, nodal_error, obs_error, batched_error, fem_time, fem1d_time, batched_time = \
+            parity(args.nsamples, args.nparam, vert, args.obs)
+        print(f"{vert:>5} {reference_error:>10.2e} {nodal_error:>10.2e} {obs_error:>10.2e} {batched_error:>10.2e} "
+              f"{1e6 * fem_time:>8.1f}us {1e6 * fem1d_time:>8.1f}us {1e6 * batched_time:>9.1f}us")
+        failed |= np.nanmax([reference_error, nodal_error, obs_error, batched_error]) > args.tol
+
+    if failed:
+        sys.exit(f"FEMSolver1D differs from the reference by more than {args.tol}")
@@ -0,0 +1,153 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+import torch
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(project_root)  # This allows importing from base, Elliptic, etc.
+sys.path.append(os.path.join(project_root, "Elliptic"))  # Explicitly add Elliptic folder
+
+from elliptic_files.FEM_Solver_1D import FEMSolver1D
+from elliptic_files.elliptic_mcmc import EllipticMCMC, EllipticMCMCDA
+
+
+def count_calls(func, counter, key):
+    """Wrap a likelihood so every call is counted in counter[key]."""
+    def counted(theta):
+        counter[key] += 1
+        return func(theta)
+    return counted
+
+def legacy_run_chain(mh):
+    """MetropolisHastings.run_chain before the log-posterior was carried as chain state:
+    the current state is evaluated again on every step."""
+    theta = torch.empty((mh.nparameters), device=mh.device).uniform_(-1, 1)
+    samples = torch.zeros((mh.nsamples + mh.burnin, mh.nparameters), device=mh.device)
+    dt = mh.dt
+    for i in range(mh.nsamples + mh.burnin):
+        theta_proposal = mh.proposal(theta, dt)
+
+        log_posterior = mh.log_prior(theta) + mh.log_likelihood(theta)
+        log_posterior_proposal = mh.log_prior(theta_proposal) + mh.log_likelihood(theta_proposal)
+
+        a = torch.exp(log_posterior_proposal - log_posterior).clamp(max=1.0)
+        if torch.rand(1, device=mh.device) < a:
+            theta = theta_proposal
+        samples[i, :] = theta
+        dt += dt * (a.item() - 0.234) / (i + 1)
+    return samples[mh.burnin:].cpu().numpy()
+
+def legacy_run_chain_da(da):
+    """MCMCDA.run_chain before the coarse and fine log-posteriors were carried as chain state."""
+    theta = torch.empty((da.nparameters), device=da.device).uniform_(-1, 1)
+    dt = da.dt
+    for i in range(da.iter_mcmc):
+        theta_proposal = da.proposal(theta, dt)
+        log_posterior_outer = da.log_prior(theta) + da.log_likelihood_outer(theta)
+        log_posterior_proposal_outer = da.log_prior(theta_proposal) + da.log_likelihood_outer(theta_proposal)
+        a = torch.exp(log_posterior_proposal_outer - log_posterior_outer).clamp(max=1.0)
+        if torch.rand(1, device=da.device) < a:
+            theta = theta_proposal.clone()
+        dt += dt * (a.item() - 0.234) / (i + 1)
+
+    inner_mh = 0
+    samples = []
+    while inner_mh < da.iter_da:
+        theta_proposal = da.proposal(theta, dt)
+        log_posterior_outer = da.log_prior(theta) + da.log_likelihood_outer(theta)
+        log_posterior_proposal_outer = da.log_prior(theta_proposal) + da.log_likelihood_outer(theta_proposal)
+        a = torch.clamp(torch.exp(log_posterior_proposal_outer - log_posterior_outer), max=1.0)
+        if torch.rand(1, device=da.device) < a:
+            inner_mh += 1
+            log_posterior_inner = da.log_prior(theta) + da.log_likelihood_inner(theta)
+            log_posterior_proposal_inner = da.log_prior(theta_proposal) + da.log_likelihood_inner(theta_proposal)
+            a = torch.clamp(torch.exp(log_posterior_proposal_inner - log_posterior_inner) * (1 / a), max=1.0)
+            if torch.rand(1, device=da.device) < a:
+                theta = theta_proposal.clone()
+        samples.append(theta.cpu().numpy())
+    return np.array(samples)
+
+def observations(vert, nobs, noise, seed):
+    """Noisy FEMSolver1D observations of a random theta."""
+    rng = np.random.default_rng(seed)
+    solver = FEMSolver1D(rng.uniform(-1, 1, 2), vert=vert)
+    solver.solve()
+    obs_points = np.linspace(0.2, 0.8, nobs).reshape(-1, 1)
+    obs_values = solver.eval_at_points(obs_points) + noise * rng.standard_normal((nobs, 1))
+    return obs_points, obs_values
+
+def benchmark_mh(niter, vert, nobs, noise, seed=0):
+    """Solves per step, time per step and largest sample difference of the legacy and the
+    current MetropolisHastings.run_chain, both run from the same seed."""
+    obs_points, obs_values = observations(vert, nobs, noise, seed)
+    results = {}
+    for name in ["legacy", "carried"]:
+        counter = {"fine": 0}
+        mh = EllipticMCMC(FEMSolver1D(np.zeros(2), vert=vert), obs_points, obs_values,
+                          observation_noise=noise, nsamples=niter, burnin=0, step_size=0.1)
+        mh.log_likelihood_func = count_calls(mh.log_likelihood_func, counter, "fine")
+
+        torch.manual_seed(seed)
+        start = time.perf_counter()
+        samples = legacy_run_chain(mh) if name == "legacy" else mh.run_chain(verbose=False)[0]
+        results[name] = (counter["fine"] / niter, (time.perf_counter() - start) / niter, samples)
+
+    difference = np.max(np.abs(results["legacy"][2] - results["carried"][2]))
+    return {name: result[:2] for name, result in results.items()}, difference
+
+def benchmark_da(iter_mcmc, iter_da, vert_coarse, vert_fine, nobs, noise, seed=0):
+    """Coarse and fine solves per step, time per step and largest sample difference of the
+    legacy and the current MCMCDA.run_chain, both run from the same seed."""
+    obs_points, obs_values = observations(vert_fine, nobs, noise, seed)
+    results = {}
+    for name in ["legacy", "carried"]:
+        counter = {"coarse": 0, "fine": 0}
+        da = EllipticMCMCDA(FEMSolver1D(np.zeros(2), vert=vert_coarse), FEMSolver1D(np.zeros(2), vert=vert_fine),
+                            obs_points, obs_values, observation_noise=noise, iter_mcmc=iter_mcmc,
+                            iter_da=iter_da, step_size=0.1)
+        da.log_likelihood_outer_func = count_calls(da.log_likelihood_outer_func, counter, "coarse")
+        da.log_likelihood_inner_func = count_calls(da.log_likelihood_inner_func, counter, "fine")
+
+        torch.manual_seed(seed)
+        start = time.perf_counter()
+        if name == "legacy":
+            samples = legacy_run_chain_da(da)
+        else:
+            samples = da.run_chain(samples=True, verbose=False)[0]
+        elapsed = time.perf_counter() - start
+        nsteps = iter_mcmc + len(samples)
+        results[name] = (counter["coarse"] / nsteps, counter["fine"] / iter_da, elapsed / nsteps, samples)
+
+    difference = np.max(np.abs(results["legacy"][3] - results["carried"][3]))
+    return {name: result[:3] for name, result in results.items()}, difference
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Cost per step of carrying the log-posterior as chain state")
+    parser.add_argument("--niter", type=int, default=1000000, help="Metropolis-Hastings iterations")
+    parser.add_argument("--iter_mcmc", type=int, default=100000, help="Coarse-only iterations of delayed acceptance")
+    parser.add_argument("--iter_da", type=int, default=10000, help="Fine stages of delayed acceptance")
+    parser.add_argument("--vert", type=int, default=100, help="Mesh size of the (fine) solver")
+    parser.add_argument("--vert_coarse", type=int, default=10, help="Mesh size of the coarse solver")
+    parser.add_argument("--nobs", type=int, default=6, help="Number of observation points")
+    parser.add_argument("--noise", type=float, default=1e-2, help="Observation noise")
+
+    args = parser.parse_args()
+
+    mh_results, mh_difference = benchmark_mh(args.niter, args.vert, args.nobs, args.noise)
+    print(f"MetropolisHastings, {args.niter} iterations")
+    print(f"{'chain':>8} {'solves/step':>12} {'us/step':>9}")
+    for name, (solves, step_time) in mh_results.items():
+        print(f"{name:>8} {solves:>12.3f} {1e6 * step_time:>9.1f}")
+    print(f"speed-up {mh_results['legacy'][1] / mh_results['carried'][1]:.2f}x, largest sample difference {mh_difference:.1e}\n")
+
+    da_results, da_difference = benchmark_da(args.iter_mcmc, args.iter_da, args.vert_coarse, args.vert,
+                                             args.nobs, args.noise)
+    print(f"MCMCDA, {args.iter_mcmc} coarse iterations and {args.iter_da} fine stages")
+    print(f"{'chain':>8} {'coarse/step':>12} {'fine/stage':>11} {'us/step':>9}")
+    for name, (coarse, fine, step_time) in da_results.items():
+        print(f"{name:>8} {coarse:>12.3f} {fine:>11.3f} {1e6 * step_time:>9.1f}")
+    print(f"speed-up {da_results['legacy'][2] / da_results['carried'][2]:.2f}x, largest sample difference {da_difference:.1e}")
@@ -9,12 +9,12 @@ class NavierStokes(deepGalerkin):
         self.chunks = config.chunks
         self.M = torch.triu(torch.ones((self.chunks, self.chunks)), diagonal=1).T
     
-    @deepGalerkin.laplace_approx()
+    @deepGalerkin.laplace_approx(output=0)
     def u(self,x):
         pred = self.model(x)
         return pred[:,0].reshape(-1,1)
     
-    @deepGalerkin.laplace_approx()
+    @deepGalerkin.laplace_approx(output=1)
     def v(self,x):
         pred = self.model(x)
         return pred[:,1].reshape(-1,1)
@@ -110,12 +110,12 @@ class Vorticity(deepGalerkin):
         self.chunks = config.chunks
         self.M = torch.triu(torch.ones((self.chunks, self.chunks)), diagonal=1).T
     
-    @deepGalerkin.laplace_approx()
+    @deepGalerkin.laplace_approx(output=0)
     def w(self,x):
         pred = self.model(x)
         return pred[:,0].reshape(-1,1)
     
-    @deepGalerkin.laplace_approx()
+    @deepGalerkin.laplace_approx(output=1)
     def phi(self,x):
         pred = self.model(x)
         return pred[:,1].reshape(-1,1)
@@ -21,7 +21,7 @@ class Elliptic(deepGalerkin):
         self.root_finder = RootFinder(lam, M)
         self.roots = torch.tensor(self.root_finder.find_roots())
     
-    @deepGalerkin.laplace_approx()
+    @deepGalerkin.laplace_approx(output=0)
     def u(self,x):
         pred = self.model(x)
         return pred.reshape(-1,1)
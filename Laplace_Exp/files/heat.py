@@ -3,10 +3,16 @@ from Base.dg import deepGalerkin
 
 
 class Heat(deepGalerkin):
+    # Model output, differentiated inputs (the third column is a parameter) and the partials
+    # of the residual, see deepGalerkin.partials
+    output_names = ("u",)
+    input_names = ("x", "t")
+    pde_partials = ("u_t", "u_xx")
+
     def __init__(self, config,device):
         super().__init__(config,device)
 
-    @deepGalerkin.laplace_approx()
+    @deepGalerkin.laplace_approx(output=0)
     def u(self,x):
         pred = self.model(x)
         return pred.reshape(-1,1)
@@ -16,14 +22,9 @@ class Heat(deepGalerkin):
         """ The pytorch autograd version of calculating residual """
         data_domain = x_interior.requires_grad_(True)
 
-        u = self.u(data_domain)
-    
-        du = torch.autograd.grad(u, data_domain,grad_outputs=torch.ones_like(u),create_graph=True)[0]
+        d = self.partials(data_domain, self.pde_partials)
 
-        ddu_x = torch.autograd.grad(du[:,0],data_domain,
-                                    grad_outputs=torch.ones_like(du[:,0]),create_graph=True)[0]
-        
-        f = du[:,1].reshape(-1,1) - data_domain[:,2].reshape(-1,1)*ddu_x[:,0].reshape(-1,1)- torch.sin(5*torch.pi*data_domain[:,0].reshape(-1,1))
+        f = d["u_t"] - data_domain[:,2].reshape(-1,1)*d["u_xx"] - torch.sin(5*torch.pi*data_domain[:,0].reshape(-1,1))
         return f
 
     def pde_loss(self,data_interior,loss_fn):
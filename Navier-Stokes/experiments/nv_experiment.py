@@ -11,8 +11,9 @@ sys.path.append(project_root)  # This allows importing from base, Elliptic, etc.
 sys.path.append(os.path.join(project_root, "Navier-Stokes"))  # Explicitly add Elliptic folder
 
 
-from Base.lla import dgala
+from Base.lla import get_dgala
 from Base.utilities import clear_hooks
+from Base.mcmc import MemorySink, NpyChunkSink, MomentsSink
 from nv_files.nv_mcmc import NVMCMC, NVMCMCDA
 from nv_files.train_nvs import train_vorticity_dg
 from nv_files.utilities import generate_noisy_obs,deepgala_data_fit
@@ -26,6 +27,8 @@ def nv_experiment():
 
     # DeepGala
     config.deepgala = False
+    config.hessian_structure = "full"  # Options: "full", "diag", "kron", "lowrank"
+    config.laplace_weights = "last_layer"  # "last_layer", "all" or a list of layer names
 
     # Inverse problem parameters
     config.noise_level = 1e-3
@@ -38,6 +41,9 @@ def nv_experiment():
     config.proposal = "random_walk"
     config.proposal_variance = 1e-3
     config.samples = 1_000_000
+    config.nchains = 1  # > 1 runs the chains batched in a single process
+    config.sample_sink = "memory"  # Options: "memory", "npy" (chunks flushed to disk), "moments"
+    config.thin = 1
     
     # Num Solver Config
     config.fs_n = 128
@@ -49,6 +55,8 @@ def nv_experiment():
     config.da_mcmc_dgala = False
     config.iter_mcmc = 1_000_000
     config.iter_da = 5_000
+    config.da_prefetch = 1  # > 1 screens that many coarse proposals per batched evaluation
+    config.fine_workers = 0  # > 0 solves the prefetched proposals on a FineSolverPool of that size, needs da_prefetch > 1
 
     return config
 
@@ -110,8 +118,35 @@ def get_vorticity_train_config():
     
     return config
 
+def build_sink(config_experiment, path):
+    """Sample sink selected by config.sample_sink, "npy" chunks are written to a folder next to `path`."""
+    if config_experiment.sample_sink == "npy":
+        return NpyChunkSink(path.replace(".npy", ""), thin=config_experiment.thin)
+    elif config_experiment.sample_sink == "moments":
+        return MomentsSink(thin=config_experiment.thin)
+    return MemorySink(thin=config_experiment.thin)
+
+def save_samples(samples, config_experiment, path):
+    """Save what the sink returned, "npy" sinks have already flushed their chunks to disk."""
+    if config_experiment.sample_sink == "memory":
+        np.save(path, samples)
+    elif config_experiment.sample_sink == "moments":
+        np.savez(path.replace(".npy", "_moments.npz"), **samples)
+
+# Helper function to run Delayed Acceptance
+def run_da_chain(mcmcda, config_experiment):
+    """Run Delayed Acceptance, spreading the fine solves over a FineSolverPool when requested."""
+    if config_experiment.fine_workers > 0:
+        if config_experiment.da_prefetch <= 1:
+            raise ValueError(f"fine_workers = {config_experiment.fine_workers} needs da_prefetch > 1, "
+                             f"got {config_experiment.da_prefetch}.")
+        with mcmcda.fine_pool(config_experiment.fine_workers) as fine_pool:
+            return mcmcda.run_chain(verbose=config_experiment.verbose, prefetch=config_experiment.da_prefetch,
+                                    fine_pool=fine_pool)
+    return mcmcda.run_chain(verbose=config_experiment.verbose, prefetch=config_experiment.da_prefetch)
+
 # Helper function to set up MCMC chain
-def run_mcmc_chain(surrogate_model, obs_points, sol_test, config_experiment,device):
+def run_mcmc_chain(surrogate_model, obs_points, sol_test, config_experiment,device, path):
     mcmc = NVMCMC(
         surrogate=surrogate_model,
         observation_locations=obs_points,
@@ -123,7 +158,10 @@ def run_mcmc_chain(surrogate_model, obs_points, sol_test, config_experiment,devi
         step_size=config_experiment.proposal_variance,
         device=device
     )
-    return mcmc.run_chain(verbose=config_experiment.verbose)
+    if config_experiment.nchains > 1:
+        return mcmc.run_chains_batched(nchains=config_experiment.nchains, verbose=config_experiment.verbose,
+                                       sink=build_sink(config_experiment, path))
+    return mcmc.run_chain(verbose=config_experiment.verbose, sink=build_sink(config_experiment, path))
 
 # Main experiment runner
 def run_experiment(config_experiment,device):
@@ -145,7 +183,8 @@ def run_experiment(config_experiment,device):
         nn_surrogate_model.eval()
 
         data_fit = deepgala_data_fit(config_experiment.nn_model,config_experiment.KL_expansion,device)
-        llp = dgala(nn_surrogate_model)
+        llp = get_dgala(nn_surrogate_model, config_experiment.hessian_structure,
+                        subset_of_weights=config_experiment.laplace_weights)
         llp.fit(data_fit)
         llp.optimize_marginal_likelihood()
         clear_hooks(llp)
@@ -161,16 +200,18 @@ def run_experiment(config_experiment,device):
         print(f"Starting MCMC with NN_s{config_experiment.nn_model}")
         nn_surrogate_model = torch.load(f"./Navier-Stokes/models/vorticity_kl{config_experiment.KL_expansion}_s{config_experiment.nn_model}.pth")
         nn_surrogate_model.eval()
-        nn_samples = run_mcmc_chain(nn_surrogate_model, obs_points, sol_test, config_experiment,device)
-        np.save(f'./Navier-Stokes/results/nn_kl{config_experiment.KL_expansion}_ss{config_experiment.nn_model}_var{config_experiment.noise_level}.npy', nn_samples[0])
+        samples_path = f'./Navier-Stokes/results/nn_kl{config_experiment.KL_expansion}_ss{config_experiment.nn_model}_var{config_experiment.noise_level}.npy'
+        nn_samples = run_mcmc_chain(nn_surrogate_model, obs_points, sol_test, config_experiment,device, samples_path)
+        save_samples(nn_samples[0], config_experiment, samples_path)
     
     # Step 5: DeepGaLA Surrogate for MCMC
     if config_experiment.dgala_mcmc:
         print(f"Starting MCMC with DeepGaLA_s{config_experiment.nn_model}")
         llp = torch.load(f"./Navier-Stokes/models/nv_dgala_{config_experiment.nn_model}.pth")
         llp.model.set_last_layer("output_layer")  # Re-register hooks
-        nn_samples = run_mcmc_chain(llp, obs_points, sol_test, config_experiment, device)
-        np.save(f'./Navier-Stokes/results/dgala_kl{config_experiment.KL_expansion}_ss{config_experiment.nn_model}_var{config_experiment.noise_level}.npy', nn_samples[0])
+        samples_path = f'./Navier-Stokes/results/dgala_kl{config_experiment.KL_expansion}_ss{config_experiment.nn_model}_var{config_experiment.noise_level}.npy'
+        nn_samples = run_mcmc_chain(llp, obs_points, sol_test, config_experiment, device, samples_path)
+        save_samples(nn_samples[0], config_experiment, samples_path)
 
     # Step 7: Delayed Acceptance for NN
     if config_experiment.da_mcmc_nn:
@@ -184,7 +225,7 @@ def run_experiment(config_experiment,device):
                         fs_indices_sol=obs_indices,iter_mcmc=config_experiment.iter_mcmc, iter_da = config_experiment.iter_da,
                         step_size=config_experiment.proposal_variance, device=device )
         
-        acceptance_res = nv_mcmcda.run_chain(verbose=config_experiment.verbose)
+        acceptance_res = run_da_chain(nv_mcmcda, config_experiment)
         np.save(f'./Navier-Stokes/results/mcmc_da_nn_{config_experiment.nn_model}_kl{config_experiment.KL_expansion}_{config_experiment.noise_level}.npy', acceptance_res)
 
     # Step 8: Delayed Acceptance for Dgala
@@ -200,7 +241,7 @@ def run_experiment(config_experiment,device):
                         fs_indices_sol=obs_indices,iter_mcmc=config_experiment.iter_mcmc, iter_da = config_experiment.iter_da,
                         step_size=config_experiment.proposal_variance, device=device )
         
-        acceptance_res = nv_mcmcda.run_chain(verbose=config_experiment.verbose)
+        acceptance_res = run_da_chain(nv_mcmcda, config_experiment)
         np.save(f'./Navier-Stokes/results/mcmc_da_dgala_{config_experiment.nn_model}_kl{config_experiment.KL_expansion}_{config_experiment.noise_level}.npy', acceptance_res)
 
 
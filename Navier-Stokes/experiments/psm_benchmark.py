@@ -0,0 +1,98 @@
+import sys
+import os
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import torch
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(project_root)  # This allows importing from base, Elliptic, etc.
+sys.path.append(os.path.join(project_root, "Navier-Stokes"))  # Explicitly add Navier-Stokes folder
+
+from nv_files.Pseudo_Spectral_Solver import VorticitySolver2D, torch_NVSolver2D
+
+
+def force_function(X, Y):
+    return  (np.sin(X + Y) + np.cos(X + Y))
+
+def torch_force_function(X, Y):
+    return  (torch.sin(X + Y) + torch.cos(X + Y))
+
+def time_steps(step, w_hat, nsteps, nwarmup=5):
+    """Median wall time of `nsteps` time steps, after `nwarmup` warm-up steps."""
+    for _ in range(nwarmup):
+        w_hat = step(w_hat)
+    times = []
+    for _ in range(nsteps):
+        start = time.perf_counter()
+        w_hat = step(w_hat)
+        times.append(time.perf_counter() - start)
+    return np.median(times)
+
+def numpy_allocations(step, w_hat):
+    """Peak temporary memory of one numpy time step, traced with tracemalloc."""
+    w_hat = step(w_hat)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    step(w_hat)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - baseline
+
+def torch_allocations(step, w_hat):
+    """Number and size of the tensor allocations of one torch time step."""
+    w_hat = step(w_hat)
+    with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], profile_memory=True) as prof:
+        step(w_hat)
+    allocations = [evt.cpu_memory_usage for evt in prof.events() if evt.cpu_memory_usage > 0]
+    return len(allocations), sum(allocations)
+
+def benchmark(N, nsteps, method="CN", fft_backend="numpy"):
+    """
+    Time one pseudo-spectral time step with and without the prepared mode (precomputed
+    operators and preallocated work buffers), for the numpy solver on the given FFT backend
+    and the torch solver.
+    """
+    rng = np.random.default_rng(0)
+    w0 = rng.standard_normal((N, N))
+    spectrum_bytes = N * (N // 2 + 1) * 16
+    results = []
+
+    for prepared in [False, True]:
+        solver = VorticitySolver2D(N=N, L=2*np.pi, T=1, nu=1e-2, dt=1e-4, num_sol=2, method=method,
+                                   force=force_function, prepared=prepared, fft_backend=fft_backend)
+        step = solver.crank_nicholson_step if method == "CN" else solver.rk4_step
+        w_hat = solver.initialize_vorticity(w0)
+        step_time = time_steps(step, w_hat, nsteps)
+        peak = numpy_allocations(step, w_hat)
+        results.append((f"{fft_backend} {method}", prepared, step_time, f"{peak / 2**20:.2f} MiB peak ({peak / spectrum_bytes:.1f} spectra)"))
+
+    if method == "CN":
+        for prepared in [False, True]:
+            solver = torch_NVSolver2D(N=N, L=2*np.pi, T=1, nu=1e-2, dt=1e-4, num_sol=2, method=method,
+                                      force=torch_force_function, prepared=prepared)
+            w_hat = solver.initialize_vorticity(w0)
+            step_time = time_steps(solver.crank_nicholson_step, w_hat, nsteps)
+            count, size = torch_allocations(solver.crank_nicholson_step, w_hat)
+            results.append(("torch CN", prepared, step_time, f"{count} allocations, {size / 2**20:.2f} MiB"))
+
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Pseudo-spectral time step micro-benchmark")
+    parser.add_argument("--N", type=int, nargs="+", default=[128, 256, 512], help="Grid sizes")
+    parser.add_argument("--nsteps", type=int, default=50, help="Timed steps per configuration")
+    parser.add_argument("--method", type=str, default="CN", choices=["CN", "RK4"], help="Time stepping method")
+    parser.add_argument("--fft_backend", type=str, default="numpy", choices=["numpy", "scipy", "pyfftw", "torch"],
+                        help="FFT backend of the numpy solver")
+
+    args = parser.parse_args()
+
+    print(f"{'N':>5} {'solver':>10} {'prepared':>9} {'ms/step':>9}  allocations")
+    for N in args.N:
+        for name, prepared, step_time, allocations in benchmark(N, args.nsteps, args.method, args.fft_backend):
+            print(f"{N:>5} {name:>10} {str(prepared):>9} {1e3 * step_time:>9.3f}  {allocations}")
@@ -0,0 +1,107 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+import torch
+from ml_collections import ConfigDict
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(project_root)  # This allows importing from base, Elliptic, etc.
+sys.path.append(os.path.join(project_root, "Navier-Stokes"))  # Explicitly add Navier-Stokes folder
+
+from nv_files.NavierStokes import NavierStokes, Vorticity
+
+
+def grad(f, x):
+    return torch.autograd.grad(f, x, grad_outputs=torch.ones_like(f), create_graph=True)[0]
+
+def legacy_navier_stokes_pde(dg, x):
+    """NavierStokes.nv_pde before the restructuring: one forward per field, one gradient call per partial."""
+    x = x.requires_grad_(True)
+    u, v = dg.u(x), dg.v(x)
+    u_x, v_y = grad(u, x)[:, 0:1], grad(v, x)[:, 1:2]
+
+    uw, vw = dg.u(x), dg.v(x)
+    w = grad(vw, x)[:, 0:1] - grad(uw, x)[:, 1:2]
+    w_x, w_y, w_t = grad(w, x)[:, 0:1], grad(w, x)[:, 1:2], grad(w, x)[:, 2:3]
+    w_xx, w_yy = grad(w_x, x)[:, 0:1], grad(w_y, x)[:, 1:2]
+
+    f = 0.001 * (torch.sin(x[:, 0:1] + x[:, 1:2]) + torch.cos(x[:, 0:1] + x[:, 1:2]))
+    return w_t + u * w_x + v * w_y - dg.nu * (w_xx + w_yy) - f, u_x + v_y
+
+def legacy_vorticity_pde(dg, x):
+    """Vorticity.nv_pde before the shared derivative engine, one gradient call per partial."""
+    x = x.requires_grad_(True)
+    w, phi = dg.w(x), dg.phi(x)
+    phi_x, phi_y = grad(phi, x)[:, 0:1], grad(phi, x)[:, 1:2]
+    phi_xx, phi_yy = grad(phi_x, x)[:, 0:1], grad(phi_y, x)[:, 1:2]
+    w_x, w_y, w_t = grad(w, x)[:, 0:1], grad(w, x)[:, 1:2], grad(w, x)[:, 2:3]
+    w_xx, w_yy = grad(w_x, x)[:, 0:1], grad(w_y, x)[:, 1:2]
+
+    f = torch.sin(x[:, 0:1] + x[:, 1:2]) + torch.cos(x[:, 0:1] + x[:, 1:2])
+    return w_t + phi_y * w_x - phi_x * w_y - dg.nu * (w_xx + w_yy) - f, phi_xx + phi_yy + w
+
+def build_config(hidden_dim, num_layers, nparams, derivative_engine):
+    config = ConfigDict()
+    config.nn_model = "MDNN"
+    config.lambdas = {"nvs": 1, "cond": 1, "w0": 1, "phi": 1}
+    config.model = ConfigDict()
+    config.model.input_dim = 3 + nparams
+    config.model.hidden_dim = hidden_dim
+    config.model.num_layers = num_layers
+    config.model.out_dim = 2
+    config.model.activation = "tanh"
+    config.nu = 1e-2
+    config.chunks = 1
+    config.derivative_engine = derivative_engine
+    return config
+
+def time_iteration(dg, residual, x, niter, nwarmup=3):
+    """Median wall time of residual evaluation + backward of the squared residual loss."""
+    times = []
+    for i in range(nwarmup + niter):
+        start = time.perf_counter()
+        dg.model.zero_grad()
+        transport, cont = residual(x.detach().clone())
+        (transport.square().mean() + cont.square().mean()).backward()
+        if x.is_cuda:
+            torch.cuda.synchronize()
+        if i >= nwarmup:
+            times.append(time.perf_counter() - start)
+    return np.median(times)
+
+def benchmark(npoints, hidden_dim, num_layers, nparams, niter, device):
+    """Per-iteration time of the legacy and restructured residuals of both formulations."""
+    torch.manual_seed(0)
+    x = torch.rand(npoints, 3 + nparams, device=device)
+    results = []
+
+    ns = NavierStokes(build_config(hidden_dim, num_layers, nparams, "autograd"), device)
+    results.append(("NavierStokes", "legacy", time_iteration(ns, lambda x: legacy_navier_stokes_pde(ns, x), x, niter)))
+    results.append(("NavierStokes", "autograd", time_iteration(ns, ns.nv_pde, x, niter)))
+
+    for engine in ["autograd", "forward"]:
+        vort = Vorticity(build_config(hidden_dim, num_layers, nparams, engine), device)
+        if engine == "autograd":
+            results.append(("Vorticity", "legacy", time_iteration(vort, lambda x: legacy_vorticity_pde(vort, x), x, niter)))
+        results.append(("Vorticity", engine, time_iteration(vort, vort.nv_pde, x, niter)))
+
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="PINN residual (forward + backward) micro-benchmark")
+    parser.add_argument("--npoints", type=int, default=2000, help="Collocation points per iteration")
+    parser.add_argument("--hidden_dim", type=int, default=300, help="Hidden layer width")
+    parser.add_argument("--num_layers", type=int, default=4, help="Number of hidden layers")
+    parser.add_argument("--nparams", type=int, default=2, help="Parameters appended to (x, y, t)")
+    parser.add_argument("--niter", type=int, default=20, help="Timed iterations per configuration")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+
+    args = parser.parse_args()
+
+    print(f"{'model':>13} {'residual':>9} {'ms/iter':>9}")
+    for model, residual, iter_time in benchmark(args.npoints, args.hidden_dim, args.num_layers, args.nparams, args.niter, args.device):
+        print(f"{model:>13} {residual:>9} {1e3 * iter_time:>9.2f}")
@@ -9,43 +9,47 @@ class NavierStokes(deepGalerkin):
         #self.M = torch.triu(torch.ones((self.chunks, self.chunks)), diagonal=1).T
         self.init_M() 
 
-    @deepGalerkin.laplace_approx()
+    @deepGalerkin.laplace_approx(output=0)
     def u(self,x):
         pred = self.model(x)
         return pred[:,0].reshape(-1,1)
     
-    @deepGalerkin.laplace_approx()
+    @deepGalerkin.laplace_approx(output=1)
     def v(self,x):
         pred = self.model(x)
         return pred[:,1].reshape(-1,1)
 
+    def velocity_gradients(self, x_interior):
+        """
+        u, v from a single model call and their full gradients with respect to the inputs, one
+        gradient call per field. Columns 0, 1, 2 of the gradients are the x, y, t partials.
+        """
+        pred = self.model(x_interior)
+        u, v = pred[:,0].reshape(-1,1), pred[:,1].reshape(-1,1)
+
+        grad_u = torch.autograd.grad(u, x_interior, grad_outputs=torch.ones_like(u), create_graph=True)[0]
+        grad_v = torch.autograd.grad(v, x_interior, grad_outputs=torch.ones_like(v), create_graph=True)[0]
+        return u, v, grad_u, grad_v
+
     @deepGalerkin.laplace_approx()
     def w_net(self,x_interior):
         x_interior = x_interior.requires_grad_(True)
 
-        u = self.u(x_interior)
-        v = self.v(x_interior)
-
-        u_y = torch.autograd.grad(u, x_interior, grad_outputs=torch.ones_like(u), create_graph=True)[0][:, 1].reshape(-1,1)
-        v_x = torch.autograd.grad(v, x_interior, grad_outputs=torch.ones_like(v), create_graph=True)[0][:, 0].reshape(-1,1)
-        return v_x - u_y
+        _, _, grad_u, grad_v = self.velocity_gradients(x_interior)
+        return grad_v[:, 0].reshape(-1,1) - grad_u[:, 1].reshape(-1,1)
     
     @deepGalerkin.laplace_approx()
     def nv_pde(self, x_interior):
         x_interior = x_interior.requires_grad_(True)
 
-        u = self.u(x_interior)
-        v = self.v(x_interior)
-
-        u_x = torch.autograd.grad(u, x_interior, grad_outputs=torch.ones_like(u), create_graph=True)[0][:, 0].reshape(-1,1)
-        v_y = torch.autograd.grad(v, x_interior, grad_outputs=torch.ones_like(v), create_graph=True)[0][:, 1].reshape(-1,1)
+        u, v, grad_u, grad_v = self.velocity_gradients(x_interior)
+        u_x, v_y = grad_u[:, 0].reshape(-1,1), grad_v[:, 1].reshape(-1,1)
 
-        w = self.w_net(x_interior)
+        w = grad_v[:, 0].reshape(-1,1) - grad_u[:, 1].reshape(-1,1)
 
-        # Compute gradients for vorticity (for transport equation)
-        w_x = torch.autograd.grad(w, x_interior, grad_outputs=torch.ones_like(w), create_graph=True)[0][:, 0].reshape(-1,1)
-        w_y = torch.autograd.grad(w, x_interior, grad_outputs=torch.ones_like(w), create_graph=True)[0][:, 1].reshape(-1,1)
-        w_t = torch.autograd.grad(w, x_interior, grad_outputs=torch.ones_like(w), create_graph=True)[0][:, 2].reshape(-1,1)
+        # Compute gradients for vorticity (for transport equation), one gradient call for all of them
+        grad_w = torch.autograd.grad(w, x_interior, grad_outputs=torch.ones_like(w), create_graph=True)[0]
+        w_x, w_y, w_t = grad_w[:, 0].reshape(-1,1), grad_w[:, 1].reshape(-1,1), grad_w[:, 2].reshape(-1,1)
 
         w_xx = torch.autograd.grad(w_x, x_interior, grad_outputs=torch.ones_like(w_x), create_graph=True)[0][:, 0].reshape(-1,1)
         w_yy = torch.autograd.grad(w_y, x_interior, grad_outputs=torch.ones_like(w_y), create_graph=True)[0][:, 1].reshape(-1,1)
@@ -83,9 +87,9 @@ class NavierStokes(deepGalerkin):
         u0 = output_initial_condition[:, 1].reshape(-1, 1)
         v0 = output_initial_condition[:, 2].reshape(-1, 1)
 
-        u = self.u(initial_points)
-        v = self.v(initial_points)
-        wo_pred = self.w_net(initial_points)
+        initial_points = initial_points.requires_grad_(True)
+        u, v, grad_u, grad_v = self.velocity_gradients(initial_points)
+        wo_pred = grad_v[:, 0].reshape(-1,1) - grad_u[:, 1].reshape(-1,1)
 
         loss_u0 = loss_fn(u.view(-1, 1), u0)
         loss_v0 = loss_fn(v.view(-1, 1), v0)
@@ -103,6 +107,11 @@ class NavierStokes(deepGalerkin):
 
 
 class Vorticity(deepGalerkin):
+    # Model outputs, differentiated inputs and the partials of the residual, see deepGalerkin.partials
+    output_names = ("w", "phi")
+    input_names = ("x", "y", "t")
+    nv_partials = ("w", "w_x", "w_y", "w_t", "w_xx", "w_yy", "phi_x", "phi_y", "phi_xx", "phi_yy")
+
     def __init__(self, config,device):
         super().__init__(config,device)
 
@@ -112,12 +121,12 @@ class Vorticity(deepGalerkin):
 
         #self.M = torch.triu(torch.ones((self.chunks, self.chunks)), diagonal=1).T
     
-    @deepGalerkin.laplace_approx()
+    @deepGalerkin.laplace_approx(output=0)
     def w(self,x):
         pred = self.model(x)
         return pred[:,0].reshape(-1,1)
     
-    @deepGalerkin.laplace_approx()
+    @deepGalerkin.laplace_approx(output=1)
     def phi(self,x):
         pred = self.model(x)
         return pred[:,1].reshape(-1,1)
@@ -126,22 +135,9 @@ class Vorticity(deepGalerkin):
     def nv_pde(self, x_interior):
         x_interior = x_interior.requires_grad_(True)
 
-        w = self.w(x_interior)
-        phi = self.phi(x_interior)
-
-        phi_x = torch.autograd.grad(phi, x_interior, grad_outputs=torch.ones_like(phi), create_graph=True)[0][:, 0].reshape(-1,1)
-        phi_y = torch.autograd.grad(phi, x_interior, grad_outputs=torch.ones_like(phi), create_graph=True)[0][:, 1].reshape(-1,1)
-        phi_xx = torch.autograd.grad(phi_x, x_interior, grad_outputs=torch.ones_like(phi_x), create_graph=True)[0][:, 0].reshape(-1,1)
-        phi_yy = torch.autograd.grad(phi_y, x_interior, grad_outputs=torch.ones_like(phi_y), create_graph=True)[0][:, 1].reshape(-1,1)
-
-
-        # Compute gradients for vorticity (for transport equation)
-        w_x = torch.autograd.grad(w, x_interior, grad_outputs=torch.ones_like(w), create_graph=True)[0][:, 0].reshape(-1,1)
-        w_y = torch.autograd.grad(w, x_interior, grad_outputs=torch.ones_like(w), create_graph=True)[0][:, 1].reshape(-1,1)
-        w_t = torch.autograd.grad(w, x_interior, grad_outputs=torch.ones_like(w), create_graph=True)[0][:, 2].reshape(-1,1)
-
-        w_xx = torch.autograd.grad(w_x, x_interior, grad_outputs=torch.ones_like(w_x), create_graph=True)[0][:, 0].reshape(-1,1)
-        w_yy = torch.autograd.grad(w_y, x_interior, grad_outputs=torch.ones_like(w_y), create_graph=True)[0][:, 1].reshape(-1,1)
+        d = self.partials(x_interior, self.nv_partials)
+        w, w_x, w_y, w_t, w_xx, w_yy = d["w"], d["w_x"], d["w_y"], d["w_t"], d["w_xx"], d["w_yy"]
+        phi_x, phi_y, phi_xx, phi_yy = d["phi_x"], d["phi_y"], d["phi_xx"], d["phi_yy"]
 
         f = (torch.sin((x_interior[:,0].reshape(-1,1) + x_interior[:,1].reshape(-1,1))) + 
                   torch.cos((x_interior[:,0].reshape(-1,1) + x_interior[:,1].reshape(-1,1))))
@@ -1,10 +1,12 @@
 import numpy as np
-import cupy as cp
-from cupy.fft import rfft2, irfft2, fftfreq, rfftfreq
+
+from nv_files.fft_backends import get_fft_backend
 
 
 class VorticitySolver2D:
-    def __init__(self, N, T, nu, dt, num_sol = 10,L = 1, method = 'CN', force=None):
+    def __init__(self, N, T, nu, dt, num_sol = 10,L = 1, method = 'CN', force=None, prepared=True,
+                 cfl_interval=1, adaptive_dt=False, cfl_safety=0.9, dt_growth=1.1, max_steps=None,
+                 fft_backend='numpy', fft_options=None):
         """
         Initialize the Vorticity Solver with necessary parameters.
         
@@ -14,7 +16,23 @@ class VorticitySolver2D:
             T (float): Final time for simulation.
             nu (float): Viscosity of the fluid.
             dt (float): Time step.
-        """
+            prepared (bool): Run the time steps in preallocated work buffers with `out=` FFTs
+                             (numpy >= 2.0, torch or pyfftw backend), see `prepared_nonlinear_term`.
+            cfl_interval (int): Check the CFL condition every `cfl_interval` steps (stages for RK4).
+            adaptive_dt (bool): Let dt shrink and grow back towards the nominal `dt`, see `apply_cfl_condition`.
+            cfl_safety (float): Fraction of the CFL limit used as time step by the adaptive controller.
+            dt_growth (float): Largest factor by which the adaptive controller grows dt per check.
+            max_steps (int): Largest number of time steps of a run, 100 times the steps at the
+                             nominal dt by default, so a run whose dt keeps shrinking still ends.
+            fft_backend (str): FFT library, 'numpy', 'scipy', 'pyfftw' or 'torch' (or a backend
+                               instance), see `fft_backends`. The multithreaded ones pay off from N >= 256.
+            fft_options (dict): Options of the backend, e.g. {'workers': 8} for scipy or
+                                {'threads': 8, 'wisdom_file': 'fftw.wisdom'} for pyfftw.
+        """
+        self.fft = get_fft_backend(fft_backend, **(fft_options or {}))
+        if self.fft.xp is not np:
+            raise ValueError(f"VorticitySolver2D needs a CPU FFT backend, got '{self.fft.name}'.")
+
         self.N = N
         self.L = L
         self.T = T
@@ -23,12 +41,21 @@ class VorticitySolver2D:
         self.num_sol = num_sol
         self.method = method
         self.force = force
+        self.prepared = prepared and self.fft.supports_out
+
+        # CFL time step control
+        self.dt_nominal = dt
+        self.cfl_interval = cfl_interval
+        self.adaptive_dt = adaptive_dt
+        self.cfl_safety = cfl_safety
+        self.dt_growth = dt_growth
+        self.cfl_counter = 0
 
         # Add the forcing term (if provided)
         if self.force is not None:
             # Create the grid (X, Y)
             X, Y = np.meshgrid(np.linspace(0, self.L, self.N), np.linspace(0, self.L, self.N))
-            self.f_hat = np.fft.rfft2(self.force(X, Y)) # Apply the force
+            self.f_hat = self.fft.rfft2(self.force(X, Y)) # Apply the force
         
         # Grid setup
         self.kx = 2 * torch.pi*np.fft.fftfreq(N, d=self.L / N)
@@ -39,6 +66,15 @@ class VorticitySolver2D:
         # Avoid division by zero for the Laplace operator
         self.laplace_operator = self.k_squared.copy()
         self.laplace_operator[0, 0] = 1  # Regularize the zero mode
+
+        # Spectral derivative operators
+        self.ikx = 1j * self.kx
+        self.iky = 1j * self.ky
+        self.minus_ikx = -1j * self.kx
+
+        # dt-dependent time stepping operators and work buffers, built on first use
+        self.operators_key = None
+        self.work_shape = None
         
         # Dealiasing filter
         self.dealias_filter = self.brick_wall_filter_2d((N, N))
@@ -46,6 +82,7 @@ class VorticitySolver2D:
         # Initialize other variables
         self.time_array = np.linspace(dt, T, int(T / dt))
         self.points = np.linspace(0, len(self.time_array) - 1, self.num_sol, dtype=int)
+        self.max_steps = 100 * len(self.time_array) if max_steps is None else max_steps
 
         # RK4 parameters
         self.alphas = [0, 0.1496590219993, 0.3704009573644, 0.6222557631345, 0.9582821306748, 1]
@@ -78,22 +115,48 @@ class VorticitySolver2D:
         Computes the maximum stable time step according to the CFL condition.
         
         Parameters:
-        u (ndarray): x-component of velocity (physical space).
-        v (ndarray): y-component of velocity (physical space).
+        u (ndarray): x-component of velocity (physical space), (N, N) or a batch (B, N, N).
+        v (ndarray): y-component of velocity (physical space), (N, N) or a batch (B, N, N).
         
         Returns:
-        float: Maximum allowable time step according to the CFL condition.
+        float: Maximum allowable time step according to the CFL condition,
+               an array of shape (B, 1, 1) with one time step per member for a batch.
         """
         dx = self.L / self.N
         dy = dx  # since LxL domain, dx = dy
         delta = min(dx, dy)
 
-        u_max = np.max(np.abs(u))
-        v_max = np.max(np.abs(v))
+        u_max = np.max(np.abs(u), axis=(-2, -1))
+        v_max = np.max(np.abs(v), axis=(-2, -1))
 
-        dt_cfl = min(dx / u_max, dy / v_max, delta**2 / (2 * self.nu))
+        dt_cfl = np.minimum(np.minimum(dx / u_max, dy / v_max), delta**2 / (2 * self.nu))
+        if np.ndim(u) == 3:
+            dt_cfl = dt_cfl.reshape(-1, 1, 1)
         return dt_cfl
 
+    def apply_cfl_condition(self, u, v):
+        """
+        Time step control, evaluated every `cfl_interval` calls. By default dt is reduced to the
+        CFL limit when it exceeds it and never grows back. With `adaptive_dt` it is set to
+        `cfl_safety` times the limit, growing by at most `dt_growth` per check and never above the
+        nominal dt. For a batch each member has its own dt.
+        
+        Parameters:
+        u (ndarray): x-component of velocity (physical space).
+        v (ndarray): y-component of velocity (physical space).
+        """
+        check = self.cfl_counter % self.cfl_interval == 0
+        self.cfl_counter += 1
+        if not check:
+            return
+
+        dt_max = self.compute_cfl_time_step(u, v)
+        if self.adaptive_dt:
+            self.dt = np.minimum(np.minimum(self.cfl_safety * dt_max, self.dt_growth * self.dt), self.dt_nominal)
+        elif np.any(self.dt > dt_max):
+            print(f"Warning: Time step {np.max(self.dt)} exceeds the CFL limit {np.min(dt_max)}. Reducing time step.")
+            self.dt = np.minimum(self.dt, dt_max)  # Adjust time step if needed, per member for a batch
+
     def initialize_vorticity(self, w0):
         """
         Initialize the vorticity field.
@@ -104,7 +167,7 @@ class VorticitySolver2D:
         Returns:
         ndarray: Initial vorticity field (w0).
         """
-        w_hat = np.fft.rfft2(w0)  # Fourier transform of initial vorticity
+        w_hat = self.fft.rfft2(w0)  # Fourier transform of initial vorticity
         w_hat *= self.dealias_filter  # Apply dealiasing filter
         return w_hat
 
@@ -130,11 +193,11 @@ class VorticitySolver2D:
         Returns:
         tuple: u_hat, v_hat (velocity components in Fourier space).
         """
-        u_hat = 1j * self.ky * psi_hat  # u = dpsi/dy
-        v_hat = -1j * self.kx * psi_hat  # v = -dpsi/dx
+        u_hat = self.iky * psi_hat  # u = dpsi/dy
+        v_hat = self.minus_ikx * psi_hat  # v = -dpsi/dx
 
-        u = np.fft.irfft2(u_hat, s=(self.N, self.N))
-        v = np.fft.irfft2(v_hat, s=(self.N, self.N))
+        u = self.fft.irfft2(u_hat, s=(self.N, self.N))
+        v = self.fft.irfft2(v_hat, s=(self.N, self.N))
         
         return u_hat, v_hat, u, v
 
@@ -150,15 +213,90 @@ class VorticitySolver2D:
         Returns:
         ndarray: Nonlinear term in Fourier space.
         """
-        dw_dx_hat = 1j * self.kx * w_hat
-        dw_dy_hat = 1j * self.ky * w_hat
-        nonlinear_term = u * np.fft.irfft2(dw_dx_hat, s=(self.N, self.N)) + v * np.fft.irfft2(dw_dy_hat, s=(self.N, self.N))
-        nonlinear_term = np.fft.rfft2(nonlinear_term) * self.dealias_filter
+        dw_dx_hat = self.ikx * w_hat
+        dw_dy_hat = self.iky * w_hat
+        nonlinear_term = u * self.fft.irfft2(dw_dx_hat, s=(self.N, self.N)) + v * self.fft.irfft2(dw_dy_hat, s=(self.N, self.N))
+        nonlinear_term = self.fft.rfft2(nonlinear_term) * self.dealias_filter
         # Add the forcing term (if provided)
         if self.force is not None:
             nonlinear_term -= self.f_hat       # Add forcing term in Fourier space
         return nonlinear_term
 
+    def update_operators(self):
+        """
+        Build the dt-dependent operators of the current time stepping method. They are cached
+        and only rebuilt when dt (or the method) changed, i.e. after a CFL time step reduction.
+        """
+        if self.operators_key is not None and self.operators_key[0] == self.method and np.array_equal(self.operators_key[1], self.dt):
+            return
+        self.operators_key = (self.method, np.copy(self.dt))
+
+        if self.method == 'CN':
+            self.cn_numerator = 1 - 0.5 * self.dt * self.nu * self.laplace_operator
+            self.cn_denominator = 1 + 0.5 * self.dt * self.nu * self.laplace_operator
+        elif self.method == 'RK4':
+            self.rk4_numerators, self.rk4_denominators = [], []
+            for k in range(len(self.betas)):
+                mu = 0.5 * self.dt * (self.alphas[k + 1] - self.alphas[k])
+                self.rk4_numerators.append(1 - mu * self.nu * self.laplace_operator)
+                self.rk4_denominators.append(1 + mu * self.nu * self.laplace_operator)
+
+    def allocate_work_buffers(self, shape, dtype):
+        """
+        Preallocate the work arrays of the prepared time step for spectra of the given shape,
+        (N, N//2 + 1) or a batch (B, N, N//2 + 1).
+        """
+        real_shape = shape[:-2] + (self.N, self.N)
+        real_dtype = np.empty(0, dtype=dtype).real.dtype
+        self.work_shape, self.work_dtype = shape, dtype
+
+        self.psi_hat_buffer = np.empty(shape, dtype=dtype)
+        self.spectral_buffer = np.empty(shape, dtype=dtype)
+        self.nonlinear_hat_buffer = np.empty(shape, dtype=dtype)
+        self.rk4_h_buffer = np.empty(shape, dtype=dtype)
+        self.w_hat_buffers = [np.empty(shape, dtype=dtype), np.empty(shape, dtype=dtype)]
+
+        self.u_buffer = np.empty(real_shape, dtype=real_dtype)
+        self.v_buffer = np.empty(real_shape, dtype=real_dtype)
+        self.gradient_buffer = np.empty(real_shape, dtype=real_dtype)
+        self.nonlinear_buffer = np.empty(real_shape, dtype=real_dtype)
+
+    def next_w_hat_buffer(self, w_hat):
+        """Work buffer for the updated vorticity, alternating so it never aliases `w_hat`."""
+        return self.w_hat_buffers[1] if w_hat is self.w_hat_buffers[0] else self.w_hat_buffers[0]
+
+    def prepared_nonlinear_term(self, w_hat):
+        """
+        Velocity and nonlinear term of `w_hat`, the same operations as `solve_poisson`,
+        `compute_velocity` and `apply_nonlinear_term` but written into the preallocated work
+        buffers, without building the unused u_hat, v_hat.
+        
+        Returns:
+        tuple: u, v (physical space) and the nonlinear term in Fourier space, all work buffers.
+        """
+        dtype = np.result_type(w_hat.dtype, self.laplace_operator.dtype)
+        if self.work_shape != w_hat.shape or self.work_dtype != dtype:
+            self.allocate_work_buffers(w_hat.shape, dtype)
+        s = (self.N, self.N)
+
+        psi_hat = np.divide(w_hat, self.laplace_operator, out=self.psi_hat_buffer)
+
+        u = self.fft.irfft2(np.multiply(self.iky, psi_hat, out=self.spectral_buffer), s=s, out=self.u_buffer)
+        v = self.fft.irfft2(np.multiply(self.minus_ikx, psi_hat, out=self.spectral_buffer), s=s, out=self.v_buffer)
+
+        nonlinear_term = self.fft.irfft2(np.multiply(self.ikx, w_hat, out=self.spectral_buffer), s=s, out=self.nonlinear_buffer)
+        np.multiply(u, nonlinear_term, out=nonlinear_term)
+        dw_dy = self.fft.irfft2(np.multiply(self.iky, w_hat, out=self.spectral_buffer), s=s, out=self.gradient_buffer)
+        np.multiply(v, dw_dy, out=dw_dy)
+        np.add(nonlinear_term, dw_dy, out=nonlinear_term)
+
+        nonlinear_term_hat = self.fft.rfft2(nonlinear_term, out=self.nonlinear_hat_buffer)
+        np.multiply(nonlinear_term_hat, self.dealias_filter, out=nonlinear_term_hat)
+        # Add the forcing term (if provided)
+        if self.force is not None:
+            np.subtract(nonlinear_term_hat, self.f_hat, out=nonlinear_term_hat)
+        return u, v, nonlinear_term_hat
+
     def crank_nicholson_step(self, w_hat):
         """
         Perform a time step for solving the vorticity equation.
@@ -167,25 +305,32 @@ class VorticitySolver2D:
         w_hat (ndarray): Current vorticity in Fourier space.
         
         Returns:
-        ndarray: Updated vorticity in Fourier space.
+        ndarray: Updated vorticity in Fourier space, a work buffer in prepared mode.
         """
-        # Solve Poisson for stream function
-        psi_hat = self.solve_poisson(w_hat)
-        
-        # Compute velocity
-        u_hat, v_hat, u, v = self.compute_velocity(psi_hat)
+        if self.prepared:
+            u, v, nonlinear_term_hat = self.prepared_nonlinear_term(w_hat)
+        else:
+            # Solve Poisson for stream function
+            psi_hat = self.solve_poisson(w_hat)
+            
+            # Compute velocity
+            u_hat, v_hat, u, v = self.compute_velocity(psi_hat)
 
-        # Compute nonlinear term and update w_hat
-        nonlinear_term_hat = self.apply_nonlinear_term(u, v, w_hat)
+            # Compute nonlinear term and update w_hat
+            nonlinear_term_hat = self.apply_nonlinear_term(u, v, w_hat)
         
         # Apply CFL condition for time step
-        dt_max = self.compute_cfl_time_step(u, v)
-        if self.dt > dt_max:
-            print(f"Warning: Time step {self.dt} exceeds the CFL limit {dt_max}. Reducing time step.")
-            self.dt = dt_max  # Adjust time step if needed
+        self.apply_cfl_condition(u, v)
+        self.update_operators()
+        self.step_dt = self.dt  # Simulated time of this step
 
         # Update vorticity in Fourier space using Crank-Nicolson scheme
-        w_hat = ((1 - 0.5 * self.dt * self.nu * self.laplace_operator) * w_hat - self.dt * nonlinear_term_hat) / (1 + 0.5 * self.dt * self.nu * self.laplace_operator)
+        if self.prepared:
+            w_hat_next = np.multiply(self.cn_numerator, w_hat, out=self.next_w_hat_buffer(w_hat))
+            np.subtract(w_hat_next, np.multiply(self.dt, nonlinear_term_hat, out=nonlinear_term_hat), out=w_hat_next)
+            return np.divide(w_hat_next, self.cn_denominator, out=w_hat_next)
+
+        w_hat = (self.cn_numerator * w_hat - self.dt * nonlinear_term_hat) / self.cn_denominator
         return w_hat
     
 
@@ -199,63 +344,161 @@ class VorticitySolver2D:
         v (ndarray): y-component of velocity (physical space).
         
         Returns:
-        ndarray: Updated vorticity field in Fourier space.
+        ndarray: Updated vorticity field in Fourier space, a work buffer in prepared mode.
         """
         h = 0
+        self.step_dt = 0  # Simulated time of this step, dt may change between the stages
         for k in range(len(self.betas)):
 
-            psi_hat = self.solve_poisson(w_hat)
-        
-            # Compute velocity
-            u_hat, v_hat, u, v = self.compute_velocity(psi_hat)
+            if self.prepared:
+                u, v, nonlinear_term_hat = self.prepared_nonlinear_term(w_hat)
+            else:
+                psi_hat = self.solve_poisson(w_hat)
+            
+                # Compute velocity
+                u_hat, v_hat, u, v = self.compute_velocity(psi_hat)
 
-            # Compute nonlinear term and update w_hat
-            nonlinear_term_hat = self.apply_nonlinear_term(u, v, w_hat)
+                # Compute nonlinear term and update w_hat
+                nonlinear_term_hat = self.apply_nonlinear_term(u, v, w_hat)
             
 
-            dt_max = self.compute_cfl_time_step(u, v)
-            if self.dt > dt_max:
-                print(f"Warning: Time step {self.dt} exceeds the CFL limit {dt_max}. Reducing time step.")
-                self.dt = dt_max  # Adjust time step if needed
+            self.apply_cfl_condition(u, v)
+            self.update_operators()
+            self.step_dt = self.step_dt + (self.alphas[k + 1] - self.alphas[k]) * self.dt
+
+            if self.prepared:
+                h = self.rk4_h_buffer
+                if k == 0:
+                    h.fill(0)
+                np.subtract(np.multiply(h, self.betas[k], out=h), nonlinear_term_hat, out=h)
+
+                w_hat_next = np.multiply(self.rk4_numerators[k], w_hat, out=self.next_w_hat_buffer(w_hat))
+                np.add(w_hat_next, np.multiply(h, self.gammas[k] * self.dt, out=nonlinear_term_hat), out=w_hat_next)
+                w_hat = np.divide(w_hat_next, self.rk4_denominators[k], out=w_hat_next)
+                continue
 
             h = -nonlinear_term_hat + self.betas[k] * h
 
-            mu = 0.5 * self.dt * (self.alphas[k + 1] - self.alphas[k])
-            w_hat = ((1 - mu * self.nu * self.laplace_operator) * w_hat + self.gammas[k] * self.dt * h) / (1 + mu * self.nu * self.laplace_operator)
+            w_hat = (self.rk4_numerators[k] * w_hat + self.gammas[k] * self.dt * h) / self.rk4_denominators[k]
 
         return w_hat
 
 
-    def run_simulation(self, w_ref):
+    def time_step(self, w_hat):
+        """Advance `w_hat` by one step of the configured method, see `crank_nicholson_step` and `rk4_step`."""
+        if self.method == 'RK4':
+            return self.rk4_step(w_hat)
+        elif self.method == 'CN':
+            return self.crank_nicholson_step(w_hat)
+        raise ValueError(f"Unknown time stepping method {self.method}.")
+
+    def snapshot_times(self):
         """
-        Run the vorticity solver over the specified time domain.
+        Nominal simulation times of the snapshots, the entries `self.points` of `self.time_array`
+        (each once).
+        
+        Returns:
+        ndarray: The snapshot times, in increasing order.
+        """
+        return self.time_array[np.unique(self.points)]
+
+    def iterate_simulation(self, w_ref):
+        """
+        Run the vorticity solver over the specified time domain, yielding the snapshots
+        as they are produced instead of collecting them.
         
         Parameters:
-        w_ref (ndarray): Reference vorticity field for initialization.
+        w_ref (ndarray): Reference vorticity field for initialization, (N, N) or a batch (B, N, N).
+        
+        Yields:
+        tuple: (step, time, w), the number of time steps taken, the simulated time (one per
+               member for a batch) and the vorticity field in physical space, starting with
+               w_ref at step 0.
         """
-        w_list = []
-        w_list.append(w_ref)
+        yield 0, 0.0, w_ref
 
         w_hat = self.initialize_vorticity(w_ref)
 
-        for time in self.time_array:
-             
-            if self.method == 'RK4':
-                w_hat = self.rk4_step(w_hat)
-            elif self.method == 'CN':
-                w_hat = self.crank_nicholson_step(w_hat)
+        # Every run starts from the nominal dt (one per member for a batch), so a run does not
+        # depend on the time step reductions of earlier runs
+        self.dt = np.full((len(w_ref), 1, 1), self.dt_nominal) if np.ndim(w_ref) == 3 else self.dt_nominal
+        self.cfl_counter = 0
+
+        # The steps follow the simulated time rather than a fixed step count, so a run with a
+        # reduced dt still reaches T. A snapshot is taken after the step that ends closest to its
+        # nominal time (the same steps as before at constant dt) and yielded with the time
+        # actually simulated.
+        t = np.zeros_like(self.dt) if np.ndim(self.dt) else 0.0
+        step = 0
+        for target in self.snapshot_times():
+            while np.any(t < target - 0.5 * self.dt):
+                if step == self.max_steps:
+                    print(f"Warning: Stopped after {step} time steps at time {np.min(t)}, before the snapshot at {target}.")
+                    break
+                if np.ndim(t):
+                    # Members of a batch that already reached the snapshot wait, a zero time step
+                    # leaves their vorticity unchanged
+                    waiting = t >= target - 0.5 * self.dt
+                    dt, self.dt = self.dt, np.where(waiting, 0.0, self.dt)
+                    w_hat = self.time_step(w_hat)
+                    self.dt = np.where(waiting, dt, self.dt)
+                else:
+                    w_hat = self.time_step(w_hat)
+                t = t + self.step_dt
+                step += 1
+
+            w = self.fft.irfft2(w_hat, s=(self.N, self.N))
+            yield step, (t.ravel() if np.ndim(t) else t), w
+
+    def run_simulation(self, w_ref, callback=None):
+        """
+        Run the vorticity solver over the specified time domain.
         
-            
-            if time in self.time_array[self.points]:
-                w = np.fft.irfft2(w_hat, s=(self.N, self.N))
+        Parameters:
+        w_ref (ndarray): Reference vorticity field for initialization, (N, N) or a batch (B, N, N)
+                         in which case every snapshot is a (B, N, N) stack, see `run_simulation_batched`.
+        callback (callable): Optional, called as callback(step, time, w) for every snapshot
+                             (e.g. to write it to disk) in which case the snapshots are not kept.
+        
+        Returns:
+        list: The snapshots, empty when a callback is given.
+        """
+        w_list = []
+
+        for step, time, w in self.iterate_simulation(w_ref):
+            if callback is not None:
+                callback(step, time, w)
+            else:
                 w_list.append(w)
 
         return w_list
+
+    def run_simulation_batched(self, w_refs):
+        """
+        Run the vorticity solver for a stack of initial fields at once. All members are advanced
+        together, so every FFT is a single batched transform over the stack, while the CFL
+        check and time step reduction act on each member separately.
+        
+        Parameters:
+        w_refs (ndarray): Initial vorticity fields, shape (B, N, N).
+        
+        Returns:
+        list: For each member, its list of snapshots as returned by `run_simulation`.
+        """
+        w_refs = np.asarray(w_refs)
+        nmembers = w_refs.shape[0]
+
+        # Per-member time steps, broadcast against the (B, N, N//2 + 1) spectra, see iterate_simulation
+        w_list = self.run_simulation(w_refs)
+
+        return [[w[b] for w in w_list] for b in range(nmembers)]
     
 
 
 class NVSolver2D:
-    def __init__(self, N, T, nu, dt, num_sol=10, L=1, method='CN', force=None):
+    def __init__(self, N, T, nu, dt, num_sol=10, L=1, method='CN', force=None,
+                 cfl_interval=1, adaptive_dt=False, cfl_safety=0.9, dt_growth=1.1, max_steps=None,
+                 fft_backend='cupy'):
         """
         Initialize the Vorticity Solver with necessary parameters.
         
@@ -265,7 +508,18 @@ class NVSolver2D:
             T (float): Final time for simulation.
             nu (float): Viscosity of the fluid.
             dt (float): Time step.
-        """
+            cfl_interval (int): Check the CFL condition every `cfl_interval` steps (stages for RK4).
+            adaptive_dt (bool): Let dt shrink and grow back towards the nominal `dt`, see `apply_cfl_condition`.
+            cfl_safety (float): Fraction of the CFL limit used as time step by the adaptive controller.
+            dt_growth (float): Largest factor by which the adaptive controller grows dt per check.
+            max_steps (int): Largest number of time steps of a run, 100 times the steps at the
+                             nominal dt by default, so a run whose dt keeps shrinking still ends.
+            fft_backend (str): FFT backend, 'cupy' by default (cupy is only imported then), any
+                               other backend of `fft_backends` runs the solver on the host.
+        """
+        self.fft = get_fft_backend(fft_backend)
+        cp = self.xp = self.fft.xp
+
         self.N = N
         self.L = L * 2 * cp.pi
         self.T = T
@@ -275,14 +529,22 @@ class NVSolver2D:
         self.method = method
         self.force = force
 
+        # CFL time step control
+        self.dt_nominal = dt
+        self.cfl_interval = cfl_interval
+        self.adaptive_dt = adaptive_dt
+        self.cfl_safety = cfl_safety
+        self.dt_growth = dt_growth
+        self.cfl_counter = 0
+
         # Add the forcing term (if provided)
         if self.force is not None:
             X, Y = cp.meshgrid(cp.linspace(0, self.L, self.N), cp.linspace(0, self.L, self.N))
-            self.f_hat = rfft2(self.force(X, Y))  # Apply the force
+            self.f_hat = self.fft.rfft2(self.force(X, Y))  # Apply the force
 
         # Grid setup
-        self.kx = fftfreq(N, d=self.L / N)
-        self.ky = rfftfreq(N, d=self.L / N)
+        self.kx = cp.fft.fftfreq(N, d=self.L / N)
+        self.ky = cp.fft.rfftfreq(N, d=self.L / N)
         self.kx, self.ky = cp.meshgrid(self.kx, self.ky, indexing="ij")
         self.k_squared = self.kx**2 + self.ky**2
 
@@ -290,6 +552,14 @@ class NVSolver2D:
         self.laplace_operator = self.k_squared.copy()
         self.laplace_operator[0, 0] = 1  # Regularize the zero mode
 
+        # Spectral derivative operators
+        self.ikx = 1j * self.kx
+        self.iky = 1j * self.ky
+        self.minus_ikx = -1j * self.kx
+
+        # dt-dependent time stepping operators, built on first use
+        self.operators_key = None
+
         # Dealiasing filter
         self.dealias_filter = self.brick_wall_filter_2d((N, N))
 
@@ -297,6 +567,7 @@ class NVSolver2D:
         self.w_list = []
         self.time_array = cp.linspace(dt, T, int(T / dt))
         self.points = cp.linspace(0, len(self.time_array) - 1, self.num_sol, dtype=int)
+        self.max_steps = 100 * len(self.time_array) if max_steps is None else max_steps
 
         # RK4 parameters
         self.alphas = [0, 0.1496590219993, 0.3704009573644, 0.6222557631345, 0.9582821306748, 1]
@@ -308,7 +579,7 @@ class NVSolver2D:
         Implements the 2/3 rule dealiasing filter for a 2D real-to-complex Fourier transform grid.
         """
         n, m = grid_shape
-        filter_ = cp.zeros((n, m // 2 + 1), dtype=cp.float32)
+        filter_ = self.xp.zeros((n, m // 2 + 1), dtype=self.xp.float32)
         kx_max = int(2 / 3 * n // 2)  # Cutoff for rows (kx)
         ky_max = int(2 / 3 * (m // 2 + 1))  # Cutoff for columns (ky)
 
@@ -325,22 +596,41 @@ class NVSolver2D:
         dy = dx  # since LxL domain, dx = dy
         delta = min(dx, dy)
 
-        u_max = cp.max(cp.abs(u))
-        v_max = cp.max(cp.abs(v))
+        u_max = self.xp.max(self.xp.abs(u))
+        v_max = self.xp.max(self.xp.abs(v))
 
-        dt_cfl = min(dx / u_max, dy / v_max, delta**2 / (2 * self.nu))
-        return dt_cfl
+        # Reduce on the device, a single host transfer for the result
+        dt_cfl = self.xp.minimum(self.xp.minimum(dx / u_max, dy / v_max), delta**2 / (2 * self.nu))
+        return float(dt_cfl)
+
+    def apply_cfl_condition(self, u, v):
+        """
+        Time step control, evaluated (and synchronized with the host) every `cfl_interval` calls.
+        By default dt is reduced to the CFL limit when it exceeds it, with `adaptive_dt` it is set
+        to `cfl_safety` times the limit, growing by at most `dt_growth` per check and never above
+        the nominal dt.
+        """
+        check = self.cfl_counter % self.cfl_interval == 0
+        self.cfl_counter += 1
+        if not check:
+            return
+
+        dt_max = self.compute_cfl_time_step(u, v)
+        if self.adaptive_dt:
+            self.dt = min(self.cfl_safety * dt_max, self.dt_growth * self.dt, self.dt_nominal)
+        elif self.dt > dt_max:
+            print(f"Warning: Time step {self.dt} exceeds the CFL limit {dt_max}. Reducing time step.")
+            self.dt = dt_max
 
     def initialize_vorticity(self, w0):
         """
         Initialize the vorticity field.
         """
-        w0 = cp.asarray(w0)
+        w0 = self.xp.asarray(w0)
         #plan = cp.fft.get_fft_plan(w0)  # Precompute FFT plan
 
-        w_hat = rfft2(w0)  # Fourier transform of initial vorticity
+        w_hat = self.fft.rfft2(w0)  # Fourier transform of initial vorticity
         w_hat *= self.dealias_filter  # Apply dealiasing filter
-        self.w_list.append(w0)  # Keep result in CPU memory for later visualization
         return w_hat
 
     def solve_poisson(self, w_hat):
@@ -353,11 +643,11 @@ class NVSolver2D:
         """
         Compute velocity field in Fourier space from stream function.
         """
-        u_hat = 1j * self.ky * psi_hat  # u = dpsi/dy
-        v_hat = -1j * self.kx * psi_hat  # v = -dpsi/dx
+        u_hat = self.iky * psi_hat  # u = dpsi/dy
+        v_hat = self.minus_ikx * psi_hat  # v = -dpsi/dx
 
-        u = irfft2(u_hat, s=(self.N, self.N))
-        v = irfft2(v_hat, s=(self.N, self.N))
+        u = self.fft.irfft2(u_hat, s=(self.N, self.N))
+        v = self.fft.irfft2(v_hat, s=(self.N, self.N))
 
         return u_hat, v_hat, u, v
 
@@ -365,14 +655,33 @@ class NVSolver2D:
         """
         Compute and return the nonlinear term in Fourier space.
         """
-        dw_dx_hat = 1j * self.kx * w_hat
-        dw_dy_hat = 1j * self.ky * w_hat
-        nonlinear_term = u * irfft2(dw_dx_hat, s=(self.N, self.N)) + v * irfft2(dw_dy_hat, s=(self.N, self.N))
-        nonlinear_term = rfft2(nonlinear_term) * self.dealias_filter
+        dw_dx_hat = self.ikx * w_hat
+        dw_dy_hat = self.iky * w_hat
+        nonlinear_term = u * self.fft.irfft2(dw_dx_hat, s=(self.N, self.N)) + v * self.fft.irfft2(dw_dy_hat, s=(self.N, self.N))
+        nonlinear_term = self.fft.rfft2(nonlinear_term) * self.dealias_filter
         if self.force is not None:
             nonlinear_term -= self.f_hat  # Add forcing term in Fourier space
         return nonlinear_term
 
+    def update_operators(self):
+        """
+        Build the dt-dependent operators of the current time stepping method, only rebuilt
+        when dt (or the method) changed, i.e. after a CFL time step reduction.
+        """
+        if self.operators_key == (self.method, self.dt):
+            return
+        self.operators_key = (self.method, self.dt)
+
+        if self.method == 'CN':
+            self.cn_numerator = 1 - 0.5 * self.dt * self.nu * self.laplace_operator
+            self.cn_denominator = 1 + 0.5 * self.dt * self.nu * self.laplace_operator
+        elif self.method == 'RK4':
+            self.rk4_numerators, self.rk4_denominators = [], []
+            for k in range(len(self.betas)):
+                mu = 0.5 * self.dt * (self.alphas[k + 1] - self.alphas[k])
+                self.rk4_numerators.append(1 - mu * self.nu * self.laplace_operator)
+                self.rk4_denominators.append(1 + mu * self.nu * self.laplace_operator)
+
     def crank_nicholson_step(self, w_hat):
         """
         Perform a time step for solving the vorticity equation.
@@ -381,14 +690,11 @@ class NVSolver2D:
         u_hat, v_hat, u, v = self.compute_velocity(psi_hat)
         nonlinear_term_hat = self.apply_nonlinear_term(u, v, w_hat)
 
-        dt_max = self.compute_cfl_time_step(u, v)
-        if self.dt > dt_max:
-            print(f"Warning: Time step {self.dt} exceeds the CFL limit {dt_max}. Reducing time step.")
-            self.dt = dt_max
+        self.apply_cfl_condition(u, v)
+        self.update_operators()
+        self.step_dt = self.dt  # Simulated time of this step
 
-        w_hat = ((1 - 0.5 * self.dt * self.nu * self.laplace_operator) * w_hat - self.dt * nonlinear_term_hat) / (
-            1 + 0.5 * self.dt * self.nu * self.laplace_operator
-        )
+        w_hat = (self.cn_numerator * w_hat - self.dt * nonlinear_term_hat) / self.cn_denominator
         return w_hat
 
     def rk4_step(self, w_hat):
@@ -396,48 +702,81 @@ class NVSolver2D:
         Performs one RK4 step to advance the simulation.
         """
         h = 0
+        self.step_dt = 0  # Simulated time of this step, dt may change between the stages
         for k in range(len(self.betas)):
             psi_hat = self.solve_poisson(w_hat)
             u_hat, v_hat, u, v = self.compute_velocity(psi_hat)
             nonlinear_term_hat = self.apply_nonlinear_term(u, v, w_hat)
 
-            dt_max = self.compute_cfl_time_step(u, v)
-            if self.dt > dt_max:
-                print(f"Warning: Time step {self.dt} exceeds the CFL limit {dt_max}. Reducing time step.")
-                self.dt = dt_max
+            self.apply_cfl_condition(u, v)
+            self.update_operators()
+            self.step_dt += (self.alphas[k + 1] - self.alphas[k]) * self.dt
 
             h = -nonlinear_term_hat + self.betas[k] * h
-            mu = 0.5 * self.dt * (self.alphas[k + 1] - self.alphas[k])
-            w_hat = ((1 - mu * self.nu * self.laplace_operator) * w_hat + self.gammas[k] * self.dt * h) / (
-                1 + mu * self.nu * self.laplace_operator
-            )
+            w_hat = (self.rk4_numerators[k] * w_hat + self.gammas[k] * self.dt * h) / self.rk4_denominators[k]
 
         return w_hat
 
-    def run_simulation(self, w_ref):
+    def snapshot_times(self):
         """
-        Run the vorticity solver over the specified time domain.
+        Nominal simulation times of the snapshots, on the host.
         """
-        w_hat = self.initialize_vorticity(w_ref)
+        return self.fft.asnumpy(self.time_array[self.xp.unique(self.points)])
 
-        for time in self.time_array:
-            if self.method == 'RK4':
-                w_hat = self.rk4_step(w_hat)
-            elif self.method == 'CN':
-                w_hat = self.crank_nicholson_step(w_hat)
+    def iterate_simulation(self, w_ref):
+        """
+        Run the vorticity solver, yielding (step, time, w) for every snapshot as it is produced,
+        starting with w_ref at step 0. The fields stay on the device. The steps follow the
+        simulated time, a snapshot is taken after the step that ends closest to its nominal time
+        and `time` is the time actually simulated, so a reduced dt still reaches T.
+        """
+        w_ref = self.xp.asarray(w_ref)
+        yield 0, 0.0, w_ref
+
+        w_hat = self.initialize_vorticity(w_ref)
 
-            if time in self.time_array[self.points]:
-                w = irfft2(w_hat, s=(self.N, self.N))
+        # Every run starts from the nominal dt, independent of the reductions of earlier runs
+        self.dt = self.dt_nominal
+        self.cfl_counter = 0
+
+        t, step = 0.0, 0
+        for target in self.snapshot_times():
+            while t < target - 0.5 * self.dt:
+                if step == self.max_steps:
+                    print(f"Warning: Stopped after {step} time steps at time {t}, before the snapshot at {target}.")
+                    break
+                if self.method == 'RK4':
+                    w_hat = self.rk4_step(w_hat)
+                elif self.method == 'CN':
+                    w_hat = self.crank_nicholson_step(w_hat)
+                else:
+                    raise ValueError(f"Unknown time stepping method {self.method}.")
+                t += self.step_dt
+                step += 1
+
+            w = self.fft.irfft2(w_hat, s=(self.N, self.N))
+            yield step, t, w
+
+    def run_simulation(self, w_ref, callback=None):
+        """
+        Run the vorticity solver over the specified time domain. With a `callback`, it is called
+        as callback(step, time, w) for every snapshot instead of keeping it in `self.w_list`.
+        """
+        for step, time, w in self.iterate_simulation(w_ref):
+            if callback is not None:
+                callback(step, time, w)
+            else:
                 self.w_list.append(w)  # Store on CPU memory for post-processing
 
-        return [cp.asnumpy(w) for w in self.w_list]
+        return [self.fft.asnumpy(w) for w in self.w_list]
 
 
 import torch
 import torch.fft
 
 class torch_NVSolver2D:
-    def __init__(self, N, T, nu, dt, num_sol=10, L=1, method='CN', force=None, device='cpu'):
+    def __init__(self, N, T, nu, dt, num_sol=10, L=1, method='CN', force=None, device='cpu', prepared=True,
+                 cfl_interval=1, adaptive_dt=False, cfl_safety=0.9, dt_growth=1.1, max_steps=None):
         self.device = torch.device(device)
         self.N = N
         self.L = L 
@@ -447,6 +786,15 @@ class torch_NVSolver2D:
         self.num_sol = num_sol
         self.method = method
         self.force = force
+        self.prepared = prepared
+
+        # CFL time step control, see apply_cfl_condition
+        self.dt_nominal = dt
+        self.cfl_interval = cfl_interval
+        self.adaptive_dt = adaptive_dt
+        self.cfl_safety = cfl_safety
+        self.dt_growth = dt_growth
+        self.cfl_counter = 0
 
         if self.force is not None:
             X, Y = torch.meshgrid(torch.linspace(0, self.L, self.N, device=self.device), 
@@ -460,11 +808,21 @@ class torch_NVSolver2D:
         self.laplace_operator = self.k_squared.clone()
         self.laplace_operator[0, 0] = 1  # Avoid division by zero
 
+        # Spectral derivative operators
+        self.ikx = 1j * self.kx
+        self.iky = 1j * self.ky
+        self.minus_ikx = -1j * self.kx
+
+        # dt-dependent Crank-Nicolson operators and work buffers, built on first use
+        self.operators_dt = None
+        self.work_shape = None
+
         self.dealias_filter = self.brick_wall_filter_2d((N, N)).to(self.device)
 
         # Initialize other variables
         self.time_array = np.linspace(dt, T, int(T / dt))
         self.points = np.linspace(0, len(self.time_array) - 1, self.num_sol, dtype=int)
+        self.max_steps = 100 * len(self.time_array) if max_steps is None else max_steps
 
     def brick_wall_filter_2d(self, grid_shape):
         n, m = grid_shape
@@ -482,12 +840,28 @@ class torch_NVSolver2D:
         delta = min(dx,dy)
         eps = 1e-10  # Small number to prevent division by zero
 
-        u_max = torch.max(torch.abs(u)).item() + eps   # Small number to prevent division by zero
-        v_max = torch.max(torch.abs(v)).item()+ eps
+        # One device to host transfer for both maxima
+        u_max, v_max = (torch.stack([torch.max(torch.abs(u)), torch.max(torch.abs(v))]) + eps).tolist()
 
         dt_cfl = min(dx / u_max, dy / v_max, delta**2 / (2 * self.nu))
         return dt_cfl
 
+    def apply_cfl_condition(self, u, v):
+        # Every cfl_interval calls (one host sync each): reduce dt to the CFL limit, or with
+        # adaptive_dt set it to cfl_safety times the limit, growing by at most dt_growth per
+        # check and never above the nominal dt
+        check = self.cfl_counter % self.cfl_interval == 0
+        self.cfl_counter += 1
+        if not check:
+            return
+
+        dt_max = self.compute_cfl_time_step(u, v)
+        if self.adaptive_dt:
+            self.dt = min(self.cfl_safety * dt_max, self.dt_growth * self.dt, self.dt_nominal)
+        elif self.dt > dt_max:
+            print(f"Warning: Time step {self.dt} exceeds CFL limit {dt_max}. Reducing time step.")
+            self.dt = dt_max
+
     def initialize_vorticity(self, w0):
         w0 = torch.as_tensor(w0, device=self.device)
         w_hat = torch.fft.rfft2(w0)
@@ -498,16 +872,16 @@ class torch_NVSolver2D:
         return w_hat / self.laplace_operator
 
     def compute_velocity(self, psi_hat):
-        u_hat = 1j * self.ky * psi_hat
-        v_hat = -1j * self.kx * psi_hat
+        u_hat = self.iky * psi_hat
+        v_hat = self.minus_ikx * psi_hat
 
         u = torch.fft.irfft2(u_hat, s=(self.N, self.N))
         v = torch.fft.irfft2(v_hat, s=(self.N, self.N))
         return u_hat, v_hat, u, v
 
     def apply_nonlinear_term(self, u, v, w_hat):
-        dw_dx_hat = 1j * self.kx * w_hat
-        dw_dy_hat = 1j * self.ky * w_hat
+        dw_dx_hat = self.ikx * w_hat
+        dw_dy_hat = self.iky * w_hat
 
         nonlinear_term = u * torch.fft.irfft2(dw_dx_hat, s=(self.N, self.N)) + v * torch.fft.irfft2(dw_dy_hat, s=(self.N, self.N))
         nonlinear_term = torch.fft.rfft2(nonlinear_term) * self.dealias_filter
@@ -516,30 +890,110 @@ class torch_NVSolver2D:
             nonlinear_term -= self.f_hat
         return nonlinear_term
 
+    def update_operators(self):
+        # Crank-Nicolson operators, only rebuilt when a CFL reduction changed dt
+        if self.operators_dt == self.dt:
+            return
+        self.operators_dt = self.dt
+        self.cn_numerator = 1 - 0.5 * self.dt * self.nu * self.laplace_operator
+        self.cn_denominator = 1 + 0.5 * self.dt * self.nu * self.laplace_operator
+
+    def allocate_work_buffers(self, shape, dtype):
+        real_shape = shape[:-2] + (self.N, self.N)
+        real_dtype = torch.empty(0, dtype=dtype).real.dtype
+        self.work_shape, self.work_dtype = shape, dtype
+
+        self.psi_hat_buffer = torch.empty(shape, dtype=dtype, device=self.device)
+        self.spectral_buffer = torch.empty(shape, dtype=dtype, device=self.device)
+        self.nonlinear_hat_buffer = torch.empty(shape, dtype=dtype, device=self.device)
+        self.w_hat_buffers = [torch.empty(shape, dtype=dtype, device=self.device) for _ in range(2)]
+
+        self.u_buffer = torch.empty(real_shape, dtype=real_dtype, device=self.device)
+        self.v_buffer = torch.empty(real_shape, dtype=real_dtype, device=self.device)
+        self.gradient_buffer = torch.empty(real_shape, dtype=real_dtype, device=self.device)
+        self.nonlinear_buffer = torch.empty(real_shape, dtype=real_dtype, device=self.device)
+
+    def prepared_nonlinear_term(self, w_hat):
+        # solve_poisson, compute_velocity and apply_nonlinear_term in the preallocated work buffers
+        dtype = torch.result_type(w_hat, self.laplace_operator)
+        if self.work_shape != w_hat.shape or self.work_dtype != dtype:
+            self.allocate_work_buffers(w_hat.shape, dtype)
+        s = (self.N, self.N)
+
+        psi_hat = torch.div(w_hat, self.laplace_operator, out=self.psi_hat_buffer)
+
+        u = torch.fft.irfft2(torch.mul(self.iky, psi_hat, out=self.spectral_buffer), s=s, out=self.u_buffer)
+        v = torch.fft.irfft2(torch.mul(self.minus_ikx, psi_hat, out=self.spectral_buffer), s=s, out=self.v_buffer)
+
+        nonlinear_term = torch.fft.irfft2(torch.mul(self.ikx, w_hat, out=self.spectral_buffer), s=s, out=self.nonlinear_buffer)
+        nonlinear_term.mul_(u)
+        dw_dy = torch.fft.irfft2(torch.mul(self.iky, w_hat, out=self.spectral_buffer), s=s, out=self.gradient_buffer)
+        nonlinear_term.add_(dw_dy.mul_(v))
+
+        nonlinear_term_hat = torch.fft.rfft2(nonlinear_term, out=self.nonlinear_hat_buffer)
+        nonlinear_term_hat.mul_(self.dealias_filter)
+        if self.force is not None:
+            nonlinear_term_hat.sub_(self.f_hat)
+        return u, v, nonlinear_term_hat
+
     def crank_nicholson_step(self, w_hat):
-        psi_hat = self.solve_poisson(w_hat)
-        _, _, u, v = self.compute_velocity(psi_hat)
-        nonlinear_term_hat = self.apply_nonlinear_term(u, v, w_hat)
+        if self.prepared:
+            u, v, nonlinear_term_hat = self.prepared_nonlinear_term(w_hat)
+        else:
+            psi_hat = self.solve_poisson(w_hat)
+            _, _, u, v = self.compute_velocity(psi_hat)
+            nonlinear_term_hat = self.apply_nonlinear_term(u, v, w_hat)
 
-        dt_max = self.compute_cfl_time_step(u, v)
-        if self.dt > dt_max:
-            print(f"Warning: Time step {self.dt} exceeds CFL limit {dt_max}. Reducing time step.")
-            self.dt = dt_max
+        self.apply_cfl_condition(u, v)
+        self.update_operators()
+        self.step_dt = self.dt  # Simulated time of this step
 
-        w_hat = ((1 - 0.5 * self.dt * self.nu * self.laplace_operator) * w_hat - self.dt * nonlinear_term_hat) / (
-            1 + 0.5 * self.dt * self.nu * self.laplace_operator)
+        if self.prepared:
+            # Alternate between two buffers so the update never overwrites its input
+            w_hat_next = self.w_hat_buffers[1] if w_hat is self.w_hat_buffers[0] else self.w_hat_buffers[0]
+            torch.mul(self.cn_numerator, w_hat, out=w_hat_next)
+            w_hat_next.sub_(nonlinear_term_hat.mul_(self.dt))
+            return w_hat_next.div_(self.cn_denominator)
+
+        w_hat = (self.cn_numerator * w_hat - self.dt * nonlinear_term_hat) / self.cn_denominator
         return w_hat
 
-    def run_simulation(self, w_ref):
-        w_list = []
-        w_list.append(torch.as_tensor(w_ref, device=self.device))
+    def snapshot_times(self):
+        # Nominal simulation times of the snapshots
+        return self.time_array[np.unique(self.points)]
+
+    def iterate_simulation(self, w_ref):
+        # Yields (step, time, w) for every snapshot as it is produced, starting with w_ref at step 0.
+        # The steps follow the simulated time, so a reduced dt still reaches T: a snapshot is taken
+        # after the step that ends closest to its nominal time, with the time actually simulated
+        yield 0, 0.0, torch.as_tensor(w_ref, device=self.device)
 
         w_hat = self.initialize_vorticity(w_ref)
 
-        for time in self.time_array:
-            w_hat = self.crank_nicholson_step(w_hat)
-            if time in self.time_array[self.points]:
-                w = torch.fft.irfft2(w_hat, s=(self.N, self.N))
+        # Every run starts from the nominal dt, independent of the reductions of earlier runs
+        self.dt = self.dt_nominal
+        self.cfl_counter = 0
+
+        t, step = 0.0, 0
+        for target in self.snapshot_times():
+            while t < target - 0.5 * self.dt:
+                if step == self.max_steps:
+                    print(f"Warning: Stopped after {step} time steps at time {t}, before the snapshot at {target}.")
+                    break
+                w_hat = self.crank_nicholson_step(w_hat)
+                t += self.step_dt
+                step += 1
+
+            w = torch.fft.irfft2(w_hat, s=(self.N, self.N))
+            yield step, t, w
+
+    def run_simulation(self, w_ref, callback=None):
+        w_list = []
+
+        for step, time, w in self.iterate_simulation(w_ref):
+            if callback is not None:
+                callback(step, time, w)
+            else:
                 w_list.append(w)
 
         return w_list
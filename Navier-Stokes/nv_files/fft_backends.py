@@ -0,0 +1,198 @@
+import os
+import pickle
+import numpy as np
+
+# numpy.fft writes into preallocated arrays (`out=`) from numpy 2.0 on
+NUMPY_FFT_OUT = np.lib.NumpyVersion(np.__version__) >= "2.0.0"
+
+
+class NumpyFFT:
+    """
+    Real 2D FFTs over the last two axes with numpy.fft (pocketfft, single threaded).
+
+    Every backend exposes the same interface: `rfft2(x, out=None)`, `irfft2(x, s, out=None)`,
+    the array module `xp` the spectra live in, `asnumpy` to bring arrays to the host, and
+    `supports_out`, True when `out=` is written without allocating a temporary result.
+    """
+    name = "numpy"
+    xp = np
+    supports_out = NUMPY_FFT_OUT
+
+    def rfft2(self, x, out=None):
+        if out is None:
+            return np.fft.rfft2(x)
+        if NUMPY_FFT_OUT:
+            return np.fft.rfft2(x, out=out)
+        out[...] = np.fft.rfft2(x)
+        return out
+
+    def irfft2(self, x, s, out=None):
+        if out is None:
+            return np.fft.irfft2(x, s=s)
+        if NUMPY_FFT_OUT:
+            return np.fft.irfft2(x, s=s, out=out)
+        out[...] = np.fft.irfft2(x, s=s)
+        return out
+
+    def asnumpy(self, x):
+        return np.asarray(x)
+
+
+class ScipyFFT(NumpyFFT):
+    """
+    scipy.fft (pocketfft) with `workers` threads, which splits the batch of 1D transforms of a
+    2D FFT over the cores. workers=-1 uses all of them.
+    """
+    name = "scipy"
+    supports_out = False
+
+    def __init__(self, workers=-1):
+        import scipy.fft
+        self.fft = scipy.fft
+        self.workers = workers
+
+    def rfft2(self, x, out=None):
+        result = self.fft.rfft2(x, workers=self.workers)
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+    def irfft2(self, x, s, out=None):
+        result = self.fft.irfft2(x, s=s, workers=self.workers)
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+
+class PyFFTWFFT(NumpyFFT):
+    """
+    pyFFTW with `threads` threads. The FFTW plan of every (transform, shape, dtype) is built
+    once and reused, and the wisdom gathered while planning is kept in `wisdom_file` (when
+    given) so later runs skip the planning.
+
+    The plans own their output arrays, the results are copied into `out` (no allocation) or
+    into a fresh array.
+    """
+    name = "pyfftw"
+    supports_out = True
+
+    def __init__(self, threads=None, planner_effort="FFTW_MEASURE", wisdom_file=None):
+        import pyfftw
+        import pyfftw.builders
+        self.pyfftw = pyfftw
+        self.threads = threads if threads is not None else os.cpu_count()
+        self.planner_effort = planner_effort
+        self.wisdom_file = wisdom_file
+        self.plans = {}
+
+        if wisdom_file is not None and os.path.exists(wisdom_file):
+            with open(wisdom_file, "rb") as f:
+                pyfftw.import_wisdom(pickle.load(f))
+
+    def plan(self, kind, x, s=None):
+        """FFTW plan of `kind` ('rfft2' or 'irfft2') for arrays like `x`, built on first use."""
+        key = (kind, x.shape, x.dtype.str, s)
+        if key not in self.plans:
+            builder = getattr(self.pyfftw.builders, kind)
+            self.plans[key] = builder(np.empty_like(x), s=s, threads=self.threads,
+                                      planner_effort=self.planner_effort)
+            if self.wisdom_file is not None:
+                with open(self.wisdom_file, "wb") as f:
+                    pickle.dump(self.pyfftw.export_wisdom(), f)
+        return self.plans[key]
+
+    def rfft2(self, x, out=None):
+        result = self.plan("rfft2", x)(x)
+        if out is None:
+            return result.copy()
+        out[...] = result
+        return out
+
+    def irfft2(self, x, s, out=None):
+        result = self.plan("irfft2", x, tuple(s))(x)
+        if out is None:
+            return result.copy()
+        out[...] = result
+        return out
+
+
+class TorchFFT(NumpyFFT):
+    """
+    torch.fft on the CPU for numpy arrays, which are shared with the tensors without copies.
+    `threads` sets the size of torch's intra-op thread pool (process wide).
+    """
+    name = "torch"
+    supports_out = True
+
+    def __init__(self, threads=None):
+        import torch
+        self.torch = torch
+        if threads is not None:
+            torch.set_num_threads(threads)
+
+    def rfft2(self, x, out=None):
+        x = self.torch.from_numpy(np.ascontiguousarray(x))
+        if out is None:
+            return self.torch.fft.rfft2(x).numpy()
+        self.torch.fft.rfft2(x, out=self.torch.from_numpy(out))
+        return out
+
+    def irfft2(self, x, s, out=None):
+        x = self.torch.from_numpy(np.ascontiguousarray(x))
+        if out is None:
+            return self.torch.fft.irfft2(x, s=s).numpy()
+        self.torch.fft.irfft2(x, s=s, out=self.torch.from_numpy(out))
+        return out
+
+
+class CupyFFT:
+    """
+    cupy.fft on the GPU, the spectra are cupy arrays. cupy is only imported here, so the
+    other backends work without a GPU stack.
+    """
+    name = "cupy"
+    supports_out = False
+
+    def __init__(self):
+        import cupy
+        self.xp = cupy
+
+    def rfft2(self, x, out=None):
+        result = self.xp.fft.rfft2(x)
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+    def irfft2(self, x, s, out=None):
+        result = self.xp.fft.irfft2(x, s=s)
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+    def asnumpy(self, x):
+        return self.xp.asnumpy(x)
+
+
+FFT_BACKENDS = {
+    "numpy": NumpyFFT,
+    "scipy": ScipyFFT,
+    "pyfftw": PyFFTWFFT,
+    "torch": TorchFFT,
+    "cupy": CupyFFT,
+}
+
+
+def get_fft_backend(backend="numpy", **options):
+    """
+    FFT backend by name, with its options (e.g. workers=8 for scipy, threads=8 and
+    wisdom_file=... for pyfftw). A backend instance is returned as is.
+    """
+    if not isinstance(backend, str):
+        return backend
+    if backend not in FFT_BACKENDS:
+        raise ValueError(f"Unknown FFT backend '{backend}', choose one of {list(FFT_BACKENDS)}.")
+    return FFT_BACKENDS[backend](**options)
@@ -2,7 +2,7 @@
 import torch
 import numpy as np
 
-from Base.mcmc import MetropolisHastings,MCMCDA
+from Base.mcmc import MetropolisHastings,MCMCDA,FineSolverPool
 from Base.lla import dgala
 
 from nv_files.NavierStokes import Vorticity
@@ -24,12 +24,19 @@ class NVMCMC(MetropolisHastings):
         likelihood_methods = {Vorticity: self.nn_log_likelihood,
                                 dgala: self.dgala_log_likelihood}
 
-        # Precompute the likelihood function at initialization
-        surrogate_type = type(surrogate)
-        if surrogate_type in likelihood_methods:
-            self.log_likelihood_func = likelihood_methods[surrogate_type]
+        # Vectorized likelihoods for batched chains
+        batched_likelihood_methods = {Vorticity: self.nn_log_likelihood_batched,
+                                      dgala: self.dgala_log_likelihood_batched}
+
+        # Precompute the likelihood function at initialization, subclasses (the structured dgala
+        # curvatures) use the likelihood of their base class
+        for surrogate_type, likelihood_func in likelihood_methods.items():
+            if isinstance(surrogate, surrogate_type):
+                self.log_likelihood_func = likelihood_func
+                self.log_likelihood_batched_func = batched_likelihood_methods[surrogate_type]
+                break
         else:
-            raise ValueError(f"Surrogate of type {surrogate_type.__name__} is not supported.")
+            raise ValueError(f"Surrogate of type {type(surrogate).__name__} is not supported.")
 
     def log_prior(self, theta):
         if not ((theta >= -1) & (theta <= 1)).all():
@@ -37,6 +44,10 @@ class NVMCMC(MetropolisHastings):
         else:
             return 0
 
+    def log_prior_batched(self, theta):
+        inside = ((theta >= -1) & (theta <= 1)).all(dim=-1)
+        return torch.where(inside, 0., -torch.inf).to(self.observations_values.dtype)
+
     def nn_log_likelihood(self, theta):
         """
         Evaluates the log-likelihood given a NN.
@@ -50,10 +61,10 @@ class NVMCMC(MetropolisHastings):
         Evaluates the log-likelihood given a dgala.
         """
         data = torch.cat([self.observation_locations, theta.repeat(self.observation_locations.size(0), 1)], dim=1).float()
-        surg_mu, surg_sigma = self.surrogate(data)
+        surg_mu, surg_sigma = self.surrogate(data, outputs=[0], diagonal=True)
 
-        surg_mu = surg_mu[:,0].detach().view(-1, 1)
-        surg_sigma = surg_sigma[:, 0].detach().view(-1, 1)
+        surg_mu = surg_mu.view(-1, 1)
+        surg_sigma = surg_sigma.view(-1, 1)
 
         sigma = self.observation_noise ** 2 + surg_sigma
         dy = surg_mu.shape[0]
@@ -62,9 +73,42 @@ class NVMCMC(MetropolisHastings):
 
         return -0.5 * torch.sum(((self.observations_values - surg_mu.reshape(-1, 1)) ** 2) / sigma)- cte
     
+    def batched_data(self, theta):
+        """Stack the observation locations for every chain, shape (nchains * n_obs, 3 + nparameters)."""
+        nobs = self.observation_locations.size(0)
+        return torch.cat([self.observation_locations.repeat(theta.size(0), 1),
+                          theta.repeat_interleave(nobs, dim=0)], dim=1).float()
+
+    def nn_log_likelihood_batched(self, theta):
+        """
+        Evaluates the log-likelihood of a batch of chains given a NN, with one forward pass.
+        """
+        surg = self.surrogate.w(self.batched_data(theta)).detach().reshape(theta.size(0), -1)
+        return -0.5 * torch.sum(((self.observations_values.reshape(1, -1) - surg) ** 2) / (self.observation_noise ** 2), dim=1)
+
+    def dgala_log_likelihood_batched(self, theta):
+        """
+        Evaluates the log-likelihood of a batch of chains given a dgala, with one forward pass.
+        """
+        surg_mu, surg_sigma = self.surrogate(self.batched_data(theta), outputs=[0], diagonal=True)
+
+        surg_mu = surg_mu.reshape(theta.size(0), -1)
+        surg_sigma = surg_sigma.reshape(theta.size(0), -1)
+
+        sigma = self.observation_noise ** 2 + surg_sigma
+        dy = surg_mu.shape[1]
+
+        cte = 0.5 * (dy * torch.log(torch.tensor(2 * torch.pi)) + torch.sum(torch.log(sigma), dim=1))
+
+        return -0.5 * torch.sum(((self.observations_values.reshape(1, -1) - surg_mu) ** 2) / sigma, dim=1) - cte
+
     def log_likelihood(self, theta):
         """Directly call the precomputed likelihood function."""
         return self.log_likelihood_func(theta)
+
+    def log_likelihood_batched(self, theta):
+        """Directly call the precomputed batched likelihood function."""
+        return self.log_likelihood_batched_func(theta)
         
 
 class NVMCMCDA(MCMCDA):
@@ -77,6 +121,7 @@ class NVMCMCDA(MCMCDA):
         
         self.coarse_surrogate = coarse_surrogate
         self.fs_indices_sol = fs_indices_sol
+        self.fs_n, self.fs_T, self.fs_steps = fs_n, fs_T, fs_steps
         self.finer_surrogate = VorticitySolver2D(N=fs_n, L=2*np.pi, T=fs_T, nu=1e-2, 
                                        dt=fs_steps,num_sol=2, method='CN', force= self.force_function)
         
@@ -99,6 +144,14 @@ class NVMCMCDA(MCMCDA):
         self.log_likelihood_outer_func = self.get_likelihood_function(coarse_surrogate, likelihood_methods)
         self.log_likelihood_inner_func = self.psm_log_likelihood
 
+        # Vectorized coarse likelihood for prefetched proposals, other surrogates fall back to a loop
+        batched_likelihood_methods = {
+            Vorticity: self.nn_log_likelihood_batched,
+            dgala: self.dgala_log_likelihood_batched
+        }
+        self.log_likelihood_outer_batched_func = self.get_likelihood_function(coarse_surrogate, batched_likelihood_methods,
+                                                                              default=super().log_likelihood_outer_batched)
+
     def force_function(self,X,Y):
         return  (np.sin(X + Y) + np.cos(X + Y))
     
@@ -108,6 +161,10 @@ class NVMCMCDA(MCMCDA):
         else:
             return 0
 
+    def log_prior_batched(self, theta):
+        inside = ((theta >= -1) & (theta <= 1)).all(dim=-1)
+        return torch.where(inside, 0., -torch.inf).to(self.observations_values.dtype)
+
     def psm_log_likelihood(self, theta ):
         """
         Evaluates the log-likelihood given a FEM.
@@ -135,10 +192,10 @@ class NVMCMCDA(MCMCDA):
         Evaluates the log-likelihood given a dgala.
         """
         data = torch.cat([self.observation_locations, theta.repeat(self.observation_locations.size(0), 1)], dim=1).float()
-        surg_mu, surg_sigma = surrogate(data)
+        surg_mu, surg_sigma = surrogate(data, outputs=[0], diagonal=True)
 
-        surg_mu = surg_mu[:,0].detach().view(-1, 1)
-        surg_sigma = surg_sigma[:, 0].detach().view(-1, 1)
+        surg_mu = surg_mu.view(-1, 1)
+        surg_sigma = surg_sigma.view(-1, 1)
 
         sigma = self.observation_noise ** 2 + surg_sigma
         dy = surg_mu.shape[0]
@@ -147,11 +204,42 @@ class NVMCMCDA(MCMCDA):
 
         return -0.5 * torch.sum(((self.observations_values - surg_mu.reshape(-1, 1)) ** 2) / sigma)- cte
     
-    def get_likelihood_function(self, surrogate, likelihood_methods):
+    def batched_data(self, theta):
+        """Stack the observation locations for every theta, shape (ntheta * n_obs, 3 + nparameters)."""
+        nobs = self.observation_locations.size(0)
+        return torch.cat([self.observation_locations.repeat(theta.size(0), 1),
+                          theta.repeat_interleave(nobs, dim=0)], dim=1).float()
+
+    def nn_log_likelihood_batched(self, surrogate, theta):
+        """
+        Evaluates the log-likelihood of a batch of theta given a NN, with one forward pass.
+        """
+        surg = surrogate.w(self.batched_data(theta)).detach().reshape(theta.size(0), -1)
+        return -0.5 * torch.sum(((self.observations_values.reshape(1, -1) - surg) ** 2) / (self.observation_noise ** 2), dim=1)
+
+    def dgala_log_likelihood_batched(self, surrogate, theta):
+        """
+        Evaluates the log-likelihood of a batch of theta given a dgala, with one forward pass.
+        """
+        surg_mu, surg_sigma = surrogate(self.batched_data(theta), outputs=[0], diagonal=True)
+
+        surg_mu = surg_mu.reshape(theta.size(0), -1)
+        surg_sigma = surg_sigma.reshape(theta.size(0), -1)
+
+        sigma = self.observation_noise ** 2 + surg_sigma
+        dy = surg_mu.shape[1]
+
+        cte = 0.5 * (dy * torch.log(torch.tensor(2 * torch.pi)) + torch.sum(torch.log(sigma), dim=1))
+
+        return -0.5 * torch.sum(((self.observations_values.reshape(1, -1) - surg_mu) ** 2) / sigma, dim=1) - cte
+
+    def get_likelihood_function(self, surrogate, likelihood_methods, default=None):
         """Precompute and return the appropriate likelihood function for a given surrogate."""
         for surrogate_type, likelihood_func in likelihood_methods.items():
             if isinstance(surrogate, surrogate_type):
                 return lambda theta: likelihood_func(surrogate, theta)
+        if default is not None:
+            return default
         raise ValueError(f"Surrogate of type {type(surrogate).__name__} is not supported.")
 
     def log_likelihood_outer(self, theta):
@@ -159,4 +247,46 @@ class NVMCMCDA(MCMCDA):
 
     def log_likelihood_inner(self, theta):
         return self.log_likelihood_inner_func(theta)
+
+    def log_likelihood_outer_batched(self, theta):
+        return self.log_likelihood_outer_batched_func(theta)
+
+    def fine_pool(self, nworkers=None):
+        """Start a FineSolverPool whose workers each hold their own VorticitySolver2D, with the
+        same grid and time stepping as the fine surrogate, for `run_chain(prefetch=..., fine_pool=...)`."""
+        factory_args = (self.observations_values.cpu().numpy(), self.observation_noise, self.nparameters,
+                        self.fs_indices_sol, self.fs_n, self.fs_T, self.fs_steps)
+        return FineSolverPool(PSMLogLikelihood, factory_args, nworkers=nworkers)
+
+
+class PSMLogLikelihood:
+    """
+    Pseudo-spectral log-likelihood with its own long-lived VorticitySolver2D, built once per
+    FineSolverPool worker. Same likelihood as `NVMCMCDA.psm_log_likelihood`, in numpy.
+    """
+    def __init__(self, observations_values, observation_noise, nparameters=2, fs_indices_sol=None,
+                 fs_n=128, fs_T=2, fs_steps=5e-4):
+        self.observations_values = observations_values
+        self.observation_noise = observation_noise
+        self.nparameters = nparameters
+        self.fs_indices_sol = fs_indices_sol
+        self.solver = VorticitySolver2D(N=fs_n, L=2*np.pi, T=fs_T, nu=1e-2,
+                                        dt=fs_steps, num_sol=2, method='CN', force=self.force_function)
+
+        X = torch.linspace(0, 1, fs_n)*2*torch.pi  # Spatial grid in X direction
+        Y = torch.linspace(0, 1, fs_n)*2*torch.pi  # Spatial grid in Y direction
+        self.X, self.Y = torch.meshgrid(X, Y, indexing="ij")
+
+    def force_function(self, X, Y):
+        return  (np.sin(X + Y) + np.cos(X + Y))
+
+    def __call__(self, theta):
+        theta = torch.tensor(theta)
+        theta = theta.reshape(1,-1).unsqueeze(-1) if self.nparameters==2 else theta.reshape(-1,2).unsqueeze(-1)
+
+        w0 = omega0_samples_torch(self.X, self.Y, theta, d=5, tau=np.sqrt(2))
+
+        surg = self.solver.run_simulation(np.array(w0[:,:,0]))
+        surg = surg[-1].reshape(-1,1)[self.fs_indices_sol]
+        return -0.5 * np.sum(((self.observations_values - surg) ** 2) / (self.observation_noise ** 2))
     
\ No newline at end of file